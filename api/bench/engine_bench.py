@@ -0,0 +1,145 @@
+# bench/engine_bench.py
+"""Worker write throughput and API read throughput under each engine profile.
+
+Each profile runs in a fresh subprocess against its own SQLite file, because
+engine settings are read from the environment when ``database`` is imported:
+
+* ``legacy`` -- the old engine: SQL echo on, rollback journal, synchronous=FULL
+* ``tuned``  -- the defaults: echo off, WAL, synchronous=NORMAL, busy timeout,
+  single-connection writer engine for the sink
+
+A worker process fires ``--rows`` slots in passes of 50 (lease claim, result
+flush through ``ResultSink`` with its listeners, lease release: three commits
+per pass, like ``worker_loop``) while the API process keeps ``--concurrency``
+dashboard requests in flight (run pages, every fifth one a task edit), so
+reads and writes contend like they do in production.
+
+    cd api && python -m bench.engine_bench --rows 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    "legacy": {"DB_ECHO": "1", "SQLITE_WAL": "0", "SQLITE_SYNCHRONOUS": "FULL"},
+    "tuned": {},
+}
+
+
+def _worker(rows: int, tasks: int, batch: int, results):
+    """Worker process: one pass per batch -- claim the due slots, record results,
+    release leases: three short transactions, like ``worker_loop``."""
+    from database import SessionLocal
+    from leases import LeaseManager
+    from sink import ResultSink
+
+    leases, sink = LeaseManager(worker_id="bench"), ResultSink(max_rows=batch, max_delay=60)
+    db = SessionLocal()
+    start, base = time.perf_counter(), datetime.utcnow().replace(second=0, microsecond=0)
+    passes = rows // batch
+    for p in range(passes):
+        now = base + timedelta(minutes=p)
+        ids = [1 + (p * batch + i) % tasks for i in range(batch)]
+        won = leases.claim(db, [(task_id, now) for task_id in ids], now)
+        for task_id in won:
+            sink.add_run(dict(task_id=task_id, status="success" if task_id % 10 else "failure",
+                              latency_ms=20 + task_id % 300, created_at=now))
+        sink.flush()
+        leases.release(db, list(won))
+    db.close()
+    results.put(passes * batch / (time.perf_counter() - start))
+
+
+def _child(rows: int, tasks: int, concurrency: int, out_path: str, batch: int = 50):
+    import multiprocessing
+
+    import httpx
+
+    from database import engine
+    import migrations
+    migrations.upgrade(engine)
+    from database import SessionLocal
+    from main import app
+    from models import Task
+
+    db = SessionLocal()
+    db.add_all([Task(url=f"http://bench.test/{i}", method="GET") for i in range(tasks)])
+    db.commit()
+    db.close()
+
+    ctx = multiprocessing.get_context("spawn")  # like python -m worker next to the API
+    results = ctx.Queue()
+    worker = ctx.Process(target=_worker, args=(rows, tasks, batch, results))
+
+    async def api():
+        count = 0
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def loop(n):
+                nonlocal count
+                i = 0
+                while worker.is_alive():
+                    task_id = 1 + (n + i) % tasks
+                    if i % 5 == 4:  # dashboard edits
+                        resp = await client.patch(f"/tasks/{task_id}", json={"max_retries": i % 5})
+                    else:
+                        resp = await client.get(f"/tasks/{task_id}/runs", params={"limit": 50})
+                    resp.raise_for_status()
+                    count += 1
+                    i += 1
+            start = time.perf_counter()
+            await asyncio.gather(*(loop(n) for n in range(concurrency)))
+            return count, time.perf_counter() - start
+
+    worker.start()
+    requests, seconds = asyncio.run(api())
+    worker.join()
+    with open(out_path, "w") as f:
+        json.dump({
+            "worker_rows_per_s": round(results.get(timeout=5), 1),
+            "api_requests_per_s": round(requests / seconds, 1),
+        }, f)
+
+
+def run_profile(name: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "result.json")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", DISABLE_WORKER="1", **PROFILES[name])
+        env.pop("ASYNC_DATABASE_URL", None)
+        cmd = [sys.executable, "-m", "bench.engine_bench", "--child", out,
+               "--rows", str(args.rows), "--tasks", str(args.tasks), "--concurrency", str(args.concurrency)]
+        # echo output of the legacy profile is part of its cost, but not of the report
+        subprocess.run(cmd, cwd=HERE, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.engine_bench")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.rows, args.tasks, args.concurrency, args.child)
+        return
+
+    print(f"{'profile':<8} {'worker rows/s':>14} {'api req/s':>10}")
+    for name in args.profile or ["legacy", "tuned"]:
+        res = run_profile(name, args)
+        print(f"{name:<8} {res['worker_rows_per_s']:>14} {res['api_requests_per_s']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# bench/load.py
+"""End-to-end load test: scheduler + leases + executor + result sink.
+
+For each size a fresh SQLite database gets N tasks whose next slots are
+spread over ``--spread`` seconds; the real ``worker_loop`` then fires every
+one of them once against the stand-in target (bench/target.py, started here
+in its own process with the given latency / error / timeout mix). Reported:
+
+* throughput -- tasks fired per second until the last run was written;
+* lag p50/p95/p99 -- request start minus cron slot;
+* DB -- result rows written per second, commits per second, mean commit time;
+* CPU -- worker process CPU time / wall time (near 1.0 = CPU-bound);
+* RSS -- peak resident memory of the worker process.
+
+    cd api && python -m bench.load --sizes 1000 10000 100000 --latency-ms 50
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _child(args, out_path: str):
+    import resource
+    import threading
+
+    from prometheus_client import REGISTRY
+    from sqlalchemy import func, insert, select
+
+    import executor as executor_mod
+    import migrations
+    from database import SessionLocal, engine
+    from models import Run, Task
+    from worker import worker_loop
+
+    migrations.upgrade(engine)
+    n = args.tasks
+    base = datetime.utcnow() + timedelta(seconds=args.warmup)
+    slots = {}
+    db = SessionLocal()
+    rows = []
+    for i in range(1, n + 1):
+        # cron slots are whole minutes, so real tasks share slots; here they share whole seconds
+        slot = base + timedelta(seconds=int(args.spread * (i - 1) / n))
+        slots[i] = slot
+        rows.append(dict(id=i, user_id="bench", url=f"{args.target}/hook/{i}", method="POST", body="{}",
+                         schedule_cron="0 0 1 1 *", enabled=True, max_retries=args.retries,
+                         retry_backoff_seconds=0.5, next_run_at=slot))
+        if len(rows) == 5000 or i == n:
+            db.execute(insert(Task), rows)
+            rows = []
+    db.commit()
+    seeded_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    executor_mod.configure(max_concurrency=args.concurrency, per_host=args.concurrency,
+                           pool_size=args.concurrency, timeout=args.timeout)
+    stop = threading.Event()
+    worker = threading.Thread(target=worker_loop, kwargs=dict(
+        max_sleep=0.5, resync_interval=args.warmup + args.spread + 600, stop_event=stop, drain_timeout=args.timeout,
+    ))
+    commits0 = REGISTRY.get_sample_value("taskrunner_db_commit_seconds_count") or 0
+    commit_time0 = REGISTRY.get_sample_value("taskrunner_db_commit_seconds_sum") or 0
+    cpu0 = time.process_time()
+    worker.start()
+    deadline = time.monotonic() + args.warmup + args.spread + args.max_seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        fired = db.scalar(select(func.count(func.distinct(Run.task_id))))
+        db.rollback()  # fresh snapshot next time
+        if fired >= n:
+            break
+    end = datetime.utcnow()
+    cpu = time.process_time() - cpu0
+    stop.set()
+    worker.join()
+
+    first = {}
+    written = 0
+    for task_id, created_at, latency in db.execute(select(Run.task_id, Run.created_at, Run.latency_ms)):
+        written += 1
+        started = created_at - timedelta(milliseconds=latency or 0)
+        if task_id not in first or started < first[task_id]:
+            first[task_id] = started
+    db.close()
+    lags = sorted((first[t] - slots[t]).total_seconds() for t in first)
+    busy = max(1e-9, (end - base).total_seconds())  # from the first slot to the end
+    commits = (REGISTRY.get_sample_value("taskrunner_db_commit_seconds_count") or 0) - commits0
+    commit_time = (REGISTRY.get_sample_value("taskrunner_db_commit_seconds_sum") or 0) - commit_time0
+    wall = busy + args.warmup
+    result = {
+        "tasks": n,
+        "fired": len(first),
+        "tasks_per_s": round(len(first) / busy, 1),
+        "lag_p50_s": round(_percentile(lags, 0.5) or 0, 3),
+        "lag_p95_s": round(_percentile(lags, 0.95) or 0, 3),
+        "lag_p99_s": round(_percentile(lags, 0.99) or 0, 3),
+        "rows_per_s": round(written / busy, 1),
+        "commits_per_s": round(commits / wall, 1),
+        "commit_ms": round(1000 * commit_time / commits, 2) if commits else None,
+        "cpu": round(cpu / wall, 2),
+        "rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+        "seeded_rss_mb": round(seeded_rss / 1024),
+    }
+    with open(out_path, "w") as f:
+        json.dump(result, f)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("bench target did not start")
+
+
+def run_size(n: int, args, target: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "result.json")
+        # one target host: a breaker would turn an overloaded target into instant failures
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/load.db", DISABLE_WORKER="1",
+                   RETENTION_INTERVAL_SECONDS="0", BREAKER_FAILURE_THRESHOLD="0")
+        env.pop("ASYNC_DATABASE_URL", None)
+        cmd = [sys.executable, "-m", "bench.load", "--child", out, "--target", target, "--tasks", str(n)]
+        for name in ("spread", "warmup", "concurrency", "timeout", "retries", "max_seconds"):
+            cmd += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        subprocess.run(cmd, cwd=HERE, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            return json.load(f)
+
+
+COLUMNS = ("tasks", "fired", "tasks_per_s", "lag_p50_s", "lag_p95_s", "lag_p99_s",
+           "rows_per_s", "commits_per_s", "commit_ms", "cpu", "rss_mb")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.load")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--spread", type=float, default=10, help="seconds the slots are spread over")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before the first slot")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=2, help="executor request timeout")
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--max-seconds", type=float, default=300, help="give up after the last slot + this")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    parser.add_argument("--tasks", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        import logging
+        logging.basicConfig(level=os.getenv("LOG_LEVEL", "CRITICAL"))  # no line per failed request
+        _child(args, args.child)
+        return
+
+    port = _free_port()
+    target = subprocess.Popen(
+        [sys.executable, "-m", "bench.target", "--port", str(port), "--latency-ms", str(args.latency_ms),
+         "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+         "--timeout-rate", str(args.timeout_rate), "--seed", "1"],
+        cwd=HERE,
+    )
+    try:
+        _wait_for(port)
+        print(" ".join(f"{c:>13}" for c in COLUMNS))
+        for n in args.sizes:
+            res = run_size(n, args, f"http://127.0.0.1:{port}")
+            print(" ".join(f"{str(res[c]):>13}" for c in COLUMNS), flush=True)
+    finally:
+        target.terminate()
+        target.wait()
+
+
+if __name__ == "__main__":
+    main()
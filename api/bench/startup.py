@@ -0,0 +1,132 @@
+# bench/startup.py
+"""Cold-start benchmark of the API.
+
+Each sample runs in a fresh interpreter against a migrated temporary SQLite
+database (no worker, like production):
+
+* import -- ``import main`` (module imports + ``create_app``);
+* startup -- the app's startup hooks;
+* first /health, first /tasks -- the first requests through the ASGI app in
+  that process (lazy imports, first DB connection), without a server;
+* server ready -- spawning ``uvicorn main:app`` until /health answers, which
+  is what an autoscaled instance pays before taking traffic.
+
+    cd api && python -m bench.startup --repeat 7 --importtime 15
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def get(path):
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+             "root_path": "", "headers": [], "server": ("bench", 80), "client": ("bench", 1)}
+    status = {}
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+    start = time.perf_counter()
+    await main.app(scope, receive, send)
+    assert status["code"] == 200, (path, status)
+    return time.perf_counter() - start
+
+async def startup():
+    start = time.perf_counter()
+    await main.app.router.startup()  # the on_event("startup") hooks, as uvicorn runs them
+    return time.perf_counter() - start
+
+started = asyncio.run(startup())
+health = asyncio.run(get("/health"))
+tasks = asyncio.run(get("/tasks/?limit=1"))
+print(json.dumps({"import": t1 - t0, "startup": started, "first /health": health, "first /tasks": tasks}))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_ready(env: dict, timeout: float = 60) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("server did not come up")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _importtime(env: dict, top: int):
+    """Slowest top-level imports of ``import main`` (cumulative microseconds)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line[12:]:
+            continue
+        _, cumulative, name = line[12:].split("|")
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative), name.strip()))  # direct imports of main
+    print(f"\nslowest imports of main (top {top}):")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.startup")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-server", action="store_true", help="skip the uvicorn readiness samples")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="also list the N slowest imports")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/startup.db", RUN_WORKER="0", MIGRATE_ON_STARTUP="0")
+        env.pop("ASYNC_DATABASE_URL", None)
+        subprocess.run([sys.executable, "migrations.py"], cwd=HERE, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples = {}
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, "-c", _CHILD], cwd=HERE, env=env, capture_output=True,
+                                 text=True, check=True).stdout
+            for name, value in json.loads(out.strip().splitlines()[-1]).items():
+                samples.setdefault(name, []).append(value)
+            if not args.no_server:
+                samples.setdefault("server ready", []).append(_server_ready(env))
+        print(f"{'':>16} {'median ms':>10} {'min ms':>10}")
+        for name, values in samples.items():
+            print(f"{name:>16} {1000 * statistics.median(values):10.1f} {1000 * min(values):10.1f}")
+        if args.importtime:
+            _importtime(env, args.importtime)
+
+
+if __name__ == "__main__":
+    main()
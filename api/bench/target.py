@@ -0,0 +1,71 @@
+# bench/target.py
+"""Stand-in webhook target for load tests.
+
+A tiny ASGI app under uvicorn that answers every request after a simulated
+latency, with a configurable share of 5xx errors and of requests that hang
+(longer than any client timeout):
+
+    cd api && python -m bench.target --port 9100 --latency-ms 50 --jitter-ms 20 \\
+        --error-rate 0.05 --timeout-rate 0.01
+
+``GET /__stats`` returns request counts, e.g. to check what a run delivered.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+
+class Target:
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 0, error_rate: float = 0,
+                 timeout_rate: float = 0, hang_seconds: float = 300, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "hung": 0}
+
+    async def _respond(self, send, status: int, body: bytes, content_type=b"text/plain"):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/__stats":
+            return await self._respond(send, 200, json.dumps(self.stats).encode(), b"application/json")
+        self.stats["requests"] += 1
+        roll = self.random.random()
+        if roll < self.timeout_rate:
+            self.stats["hung"] += 1
+            await asyncio.sleep(self.hang_seconds)
+        delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) if self.jitter_ms else self.latency_ms
+        await asyncio.sleep(delay / 1000)
+        if roll < self.timeout_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return await self._respond(send, 503, b"unavailable")
+        await self._respond(send, 200, b"ok")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.target")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--timeout-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    app = Target(args.latency_ms, args.jitter_ms, args.error_rate, args.timeout_rate, seed=args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False,
+                backlog=4096, timeout_keep_alive=60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bodies.py
+"""Captured response bodies, for tasks with ``capture_body`` set.
+
+The executor streams at most ``BODY_CAPTURE_MAX_BYTES`` of a response (the
+rest is never read) and the worker hands the bytes to ``pack``: they are
+compressed (zstd when the ``zstandard`` package is installed, gzip
+otherwise) and keyed by their sha256, so the thousand identical error pages
+of a failing endpoint are stored once. ``runs`` only carries the hash;
+listings stay as lean as before and a body is loaded when asked for
+(``GET /tasks/{task_id}/runs/{run_id}/body``). Bodies no run refers to any
+more are expired by retention.py.
+"""
+import gzip
+import hashlib
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import ResponseBody
+
+COMPRESSION = os.getenv("BODY_COMPRESSION", "auto")  # auto | zstd | gzip
+ZSTD_LEVEL = int(os.getenv("BODY_ZSTD_LEVEL", "3"))
+GZIP_LEVEL = 6
+CHUNK = 500  # rows per INSERT
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _encoding() -> str:
+    if COMPRESSION == "gzip" or (COMPRESSION == "auto" and _zstd() is None):
+        return "gzip"
+    return "zstd"
+
+
+def pack(data: bytes, truncated: bool = False, content_type: Optional[str] = None) -> dict:
+    """``response_bodies`` row for captured bytes."""
+    digest = hashlib.sha256(data)
+    if truncated:
+        digest.update(b"\0truncated")  # a prefix is not the same body as a complete one
+    encoding = _encoding()
+    if encoding == "zstd":
+        content = _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        content = gzip.compress(data, GZIP_LEVEL, mtime=0)
+    return dict(hash=digest.hexdigest(), encoding=encoding, size=len(data), truncated=truncated,
+                content_type=content_type, content=content)
+
+
+def unpack(row: ResponseBody) -> bytes:
+    if row.encoding == "gzip":
+        return gzip.decompress(row.content)
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError("body is zstd-compressed but the zstandard package is not installed")
+    return zstd.ZstdDecompressor().decompress(row.content)
+
+
+def split(runs: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """Separate the packed bodies (``body`` key, see ``sink.run_values``) from run rows."""
+    if not any("body" in run for run in runs):
+        return runs, []
+    unique = {run["body"]["hash"]: run["body"] for run in runs if run.get("body")}
+    return [{k: v for k, v in run.items() if k != "body"} for run in runs], list(unique.values())
+
+
+def store(db, rows: List[dict]):
+    """INSERT bodies not stored yet (no commit); known hashes are left alone."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        for i in range(0, len(rows), CHUNK):
+            db.execute(insert(ResponseBody).on_conflict_do_nothing(index_elements=["hash"]), rows[i:i + CHUNK])
+        return
+    for i in range(0, len(rows), CHUNK):
+        chunk = rows[i:i + CHUNK]
+        existing = set(db.scalars(select(ResponseBody.hash).where(ResponseBody.hash.in_([r["hash"] for r in chunk]))))
+        db.add_all(ResponseBody(**r) for r in chunk if r["hash"] not in existing)
+    db.flush()
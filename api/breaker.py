@@ -0,0 +1,174 @@
+# breaker.py
+"""Per-destination rate limits and circuit breakers for the executor.
+
+Each URL host gets a token bucket (``HOST_RATE_LIMIT`` requests/s, bursts of
+``HOST_RATE_BURST``) and a circuit breaker:
+
+* closed -- requests flow; ``BREAKER_FAILURE_THRESHOLD`` consecutive failures
+  (transport errors, timeouts, 5xx) open it;
+* open -- requests fail fast without touching the network for
+  ``BREAKER_RESET_SECONDS``;
+* half-open -- then ``BREAKER_HALF_OPEN_PROBES`` requests go through as probes;
+  a success closes the breaker, a failure opens it again.
+
+A request that would wait longer than ``HOST_RATE_MAX_WAIT_SECONDS`` for a
+token fails fast too. Both report how long until the host accepts requests
+again, so the worker times its retry for then instead of burning attempts.
+
+State is per process (each worker and API process keeps its own).
+"""
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+RATE_LIMIT = float(os.getenv("HOST_RATE_LIMIT", "0"))  # requests/s per host, 0 = unlimited
+RATE_BURST = float(os.getenv("HOST_RATE_BURST", "10"))
+RATE_MAX_WAIT_SECONDS = float(os.getenv("HOST_RATE_MAX_WAIT_SECONDS", "5"))
+FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # 0 = no breaker
+RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class TokenBucket:
+    """Reservation-style bucket: ``reserve`` takes a token, possibly one that
+    only refills in the future, and says how long to wait for it."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now: float) -> float:
+        wait = self.wait_time(now)
+        self.tokens -= 1
+        return wait
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_seconds: float = RESET_SECONDS,
+                 half_open_probes: int = HALF_OPEN_PROBES):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probes = 0
+
+    def retry_after(self, now: float) -> float:
+        """Seconds until an open breaker lets a probe through (0 when it does now)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_seconds - now)
+
+    def allow(self, now: float) -> bool:
+        if self.state == OPEN:
+            if self.retry_after(now) > 0:
+                return False
+            self.state, self.probes = HALF_OPEN, 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                return False  # probes in flight, wait for their verdict
+            self.probes += 1
+        return True
+
+    def record(self, ok: bool, now: float):
+        if ok:
+            self.state, self.failures, self.opened_at = CLOSED, 0, None
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.failure_threshold and self.failures >= self.failure_threshold):
+            self.state, self.opened_at = OPEN, now
+
+
+class HostGuard:
+    """Rate limit + breaker of one host."""
+
+    def __init__(self, host: str, rate: float, burst: float, breaker: CircuitBreaker):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.breaker = breaker
+
+
+class Admission(NamedTuple):
+    allowed: bool
+    wait: float = 0.0                    # seconds to sleep before sending (token reserved)
+    retry_after: Optional[float] = None  # rejected: seconds until the host is worth trying again
+    reason: Optional[str] = None
+
+
+class HostGuards:
+    """``HostGuard`` per host, created on first use."""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: float = RATE_BURST,
+                 max_wait: float = RATE_MAX_WAIT_SECONDS, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_seconds: float = RESET_SECONDS, half_open_probes: int = HALF_OPEN_PROBES):
+        self.rate, self.burst, self.max_wait = rate, burst, max_wait
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self._guards: Dict[str, HostGuard] = {}
+        self._lock = threading.Lock()  # acquire/record run on the executor loop, snapshot on API threads
+
+    def _guard(self, host: str) -> HostGuard:
+        guard = self._guards.get(host)
+        if guard is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_seconds, self.half_open_probes)
+            guard = self._guards[host] = HostGuard(host, self.rate, self.burst, breaker)
+        return guard
+
+    def acquire(self, host: str) -> Admission:
+        """Admit one request to ``host``: ``wait`` seconds first, or rejected with ``retry_after``."""
+        now = time.monotonic()
+        with self._lock:
+            guard = self._guard(host)
+            if guard.bucket is not None:
+                wait = guard.bucket.wait_time(now)
+                if wait > self.max_wait:
+                    return Admission(False, retry_after=wait, reason=f"rate limit for {host}")
+            if not guard.breaker.allow(now):
+                return Admission(False, retry_after=guard.breaker.retry_after(now) or self.reset_seconds,
+                                 reason=f"circuit open for {host}")
+            wait = guard.bucket.reserve(now) if guard.bucket is not None else 0.0
+            return Admission(True, wait=wait)
+
+    def record(self, host: str, ok: bool):
+        with self._lock:
+            self._guard(host).breaker.record(ok, time.monotonic())
+
+    def reset(self, host: str) -> bool:
+        with self._lock:
+            guard = self._guards.get(host)
+            if guard is None:
+                return False
+            guard.breaker.record(True, time.monotonic())
+            return True
+
+    def snapshot(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            out = []
+            for host, guard in sorted(self._guards.items()):
+                b = guard.breaker
+                out.append({
+                    "host": host,
+                    "state": b.state,
+                    "consecutive_failures": b.failures,
+                    "retry_after_seconds": round(b.retry_after(now), 3),
+                    "tokens": None if guard.bucket is None else round(min(
+                        guard.bucket.burst, guard.bucket.tokens + (now - guard.bucket.updated) * guard.bucket.rate
+                    ), 3),
+                })
+            return out
@@ -0,0 +1,117 @@
+# cache.py
+"""Bounded LRU caches for per-task work the hot loop would otherwise repeat.
+
+* parsed cron schedules (``croniter`` objects) -- keyed by the expression, so
+  the thousands of tasks sharing ``*/1 * * * *`` share one parsed schedule;
+* decrypted header dicts -- keyed by task id and validated against the task's
+  ``updated_at`` stamp, so an edited task never serves stale headers.
+
+``crud.update_task``/``delete_task`` also drop the header entry explicitly.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Hashable, List, Optional
+
+from utils import decrypt_headers
+
+CACHE_SIZE = int(os.getenv("TASK_CACHE_SIZE", "10000"))
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU map whose entries carry a stamp checked on every read."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key: Hashable, stamp: Any = None, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] != stamp:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, stamp: Any = None):
+        with self._lock:
+            self._data[key] = (stamp, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any], stamp: Any = None) -> Any:
+        value = self.get(key, stamp, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.put(key, value, stamp)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+cron_cache = LRUCache()
+headers_cache = LRUCache()
+_cron_lock = threading.Lock()  # croniter objects are stateful
+
+
+def _parse(cron: str, base: datetime):
+    from croniter import croniter  # imported on first use, not at API startup
+    return croniter(cron, base)
+
+
+def next_fire_time(cron: str, base: datetime) -> Optional[datetime]:
+    """Next slot strictly after ``base`` using a cached parse of ``cron``."""
+    try:
+        itr = cron_cache.get_or_create(cron, lambda: _parse(cron, base))
+        with _cron_lock:
+            itr.set_current(base, force=True)
+            return itr.get_next(datetime)
+    except Exception:
+        return None
+
+
+def prev_fire_times(cron: str, base: datetime, since: datetime, limit: int) -> List[datetime]:
+    """Slots in ``[since, base)``, at most the ``limit`` latest, oldest first."""
+    slots = []
+    try:
+        itr = cron_cache.get_or_create(cron, lambda: _parse(cron, base))
+        with _cron_lock:
+            itr.set_current(base, force=True)
+            while len(slots) < limit:
+                slot = itr.get_prev(datetime)
+                if slot < since:
+                    break
+                slots.append(slot)
+    except Exception:
+        return []
+    return slots[::-1]
+
+
+def task_headers(task) -> dict:
+    """Decrypted headers of a task, decrypting only when the task changed."""
+    raw = getattr(task, "headers_encrypted", None)
+    if not (isinstance(raw, str) and raw.strip()):
+        return {}
+    stamp = getattr(task, "updated_at", None)
+    return headers_cache.get_or_create(task.id, lambda: decrypt_headers(raw), stamp)
+
+
+def invalidate_task(task_id: int):
+    headers_cache.invalidate(task_id)
@@ -1,35 +1,55 @@
-from typing import List, Optional, Dict
+import json
+from functools import lru_cache
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Dict
+from sqlalchemy import bindparam, insert, update
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from models import Task, Run, DeadLetterQueue
-from schemas import TaskCreate
+from models import Task, Run, DeadLetterQueue, SlotExecution
+import retention
+import rollups
+import sketches
+from pagination import Cursor, keyset
+from schemas import TaskBatchUpdate, TaskCreate
+from cache import invalidate_task, next_fire_time
+from scheduler import scheduler
 from utils import encrypt_headers
 
-def get_tasks(db: Session, limit: int = 50, offset: int = 0) -> List[Task]:
-    return db.query(Task).order_by(Task.id).limit(limit).offset(offset).all()
+def _next_run_at(task: Task, slots: Optional[dict] = None) -> Optional[datetime]:
+    """Next slot of an enabled task; ``slots`` memoizes it per cron within a batch."""
+    if not task.enabled or not task.schedule_cron:
+        return None
+    if slots is None:
+        return next_fire_time(task.schedule_cron, datetime.utcnow())
+    if task.schedule_cron not in slots:
+        slots[task.schedule_cron] = next_fire_time(task.schedule_cron, datetime.utcnow())
+    return slots[task.schedule_cron]
+
+def get_tasks(db: Session, limit: int = 50, offset: int = 0, cursor: Optional[Cursor] = None) -> List[Task]:
+    if cursor is None:
+        # offset listing keeps its id order; ids follow creation order, so the
+        # cursor of such a page continues it on (created_at, id)
+        return db.query(Task).order_by(Task.id).offset(offset).limit(limit).all()
+    return keyset(db.query(Task), Task, cursor).limit(limit).all()
 
 def get_task(db: Session, task_id: int) -> Optional[Task]:
     return db.query(Task).filter(Task.id == task_id).first()
 
-def get_runs_for_task(db: Session, task_id: int, limit: int = 100, offset: int = 0) -> List[Run]:
-    return (
-        db.query(Run)
-        .filter(Run.task_id == task_id)
-        .order_by(desc(Run.created_at))
-        .limit(limit)
-        .offset(offset)
-        .all()
-    )
+def get_runs_for_task(db: Session, task_id: int, limit: int = 100, offset: int = 0,
+                      cursor: Optional[Cursor] = None) -> List[Run]:
+    query = keyset(db.query(Run).filter(Run.task_id == task_id), Run, cursor, descending=True)
+    if cursor is None and offset:
+        query = query.offset(offset)
+    return query.limit(limit).all()
 
-def get_dlq_for_task(db: Session, task_id: int, limit: int = 100, offset: int = 0) -> List[DeadLetterQueue]:
-    return (
-        db.query(DeadLetterQueue)
-        .filter(DeadLetterQueue.task_id == task_id)
-        .order_by(desc(DeadLetterQueue.created_at))
-        .limit(limit)
-        .offset(offset)
-        .all()
+def get_dlq_for_task(db: Session, task_id: int, limit: int = 100, offset: int = 0,
+                     cursor: Optional[Cursor] = None) -> List[DeadLetterQueue]:
+    query = keyset(
+        db.query(DeadLetterQueue).filter(DeadLetterQueue.task_id == task_id), DeadLetterQueue, cursor, descending=True
     )
+    if cursor is None and offset:
+        query = query.offset(offset)
+    return query.limit(limit).all()
 
 def delete_dlq(db: Session, dlq_id: int) -> bool:
     row = db.query(DeadLetterQueue).filter(DeadLetterQueue.id == dlq_id).first()
@@ -39,27 +59,42 @@ def delete_dlq(db: Session, dlq_id: int) -> bool:
     db.commit()
     return True
 
-def create_task(db: Session, user_id: str, task_in: TaskCreate) -> Task:
-    headers_enc = None
-    if task_in.headers:
-        headers_enc = encrypt_headers(task_in.headers)
-    db_task = Task(
+def task_values(user_id: str, task_in: TaskCreate, encrypt: Callable = encrypt_headers,
+                slots: Optional[dict] = None) -> dict:
+    """Column values of a new task for ``task_in``."""
+    values = dict(
         user_id=user_id,
         url=task_in.url,
         method=task_in.method.upper(),
-        headers_encrypted=headers_enc,
+        headers_encrypted=encrypt(task_in.headers) if task_in.headers else None,
         body=task_in.body,
         schedule_cron=task_in.schedule_cron,
         enabled=task_in.enabled,
+        max_retries=task_in.max_retries,
+        retry_backoff_seconds=task_in.retry_backoff_seconds,
+        retry_backoff_max_seconds=task_in.retry_backoff_max_seconds,
+        retry_jitter=task_in.retry_jitter,
+        retention_days=task_in.retention_days,
+        misfire_policy=task_in.misfire_policy,
+        capture_body=task_in.capture_body,
     )
+    values["next_run_at"] = _next_run_at(SimpleNamespace(**values), slots)
+    return values
+
+def new_task(user_id: str, task_in: TaskCreate) -> Task:
+    """Unsaved Task for ``task_in`` (shared with crud_async)."""
+    return Task(**task_values(user_id, task_in))
+
+def create_task(db: Session, user_id: str, task_in: TaskCreate) -> Task:
+    db_task = new_task(user_id, task_in)
     db.add(db_task)
     db.commit()
     db.refresh(db_task)
+    scheduler.upsert(db_task)
     return db_task
 
-def update_task(
-    db: Session,
-    task_id: int,
+def apply_update(
+    task: Task,
     *,
     url: Optional[str] = None,
     method: Optional[str] = None,
@@ -67,33 +102,180 @@ def update_task(
     body: Optional[str] = None,
     schedule_cron: Optional[str] = None,
     enabled: Optional[bool] = None,
-) -> Optional[Task]:
-    task = get_task(db, task_id)
-    if not task:
-        return None
+    max_retries: Optional[int] = None,
+    retry_backoff_seconds: Optional[float] = None,
+    retry_backoff_max_seconds: Optional[float] = None,
+    retry_jitter: Optional[float] = None,
+    retention_days: Optional[int] = None,
+    misfire_policy: Optional[str] = None,
+    capture_body: Optional[bool] = None,
+    encrypt: Callable = encrypt_headers,
+) -> Task:
+    """Set the given (non-None) fields on ``task`` (shared with crud_async)."""
     if url is not None:
         task.url = url
     if method is not None:
         task.method = method.upper()
     if headers is not None:
-        task.headers_encrypted = encrypt_headers(headers) if headers else None
+        task.headers_encrypted = encrypt(headers) if headers else None
     if body is not None:
         task.body = body
+    reschedule = (schedule_cron is not None and schedule_cron != task.schedule_cron) or (
+        enabled is not None and enabled != task.enabled
+    )
     if schedule_cron is not None:
         task.schedule_cron = schedule_cron
     if enabled is not None:
         task.enabled = enabled
+    if reschedule:
+        task.next_run_at = _next_run_at(task)
+    if max_retries is not None:
+        task.max_retries = max_retries
+    if retry_backoff_seconds is not None:
+        task.retry_backoff_seconds = retry_backoff_seconds
+    if retry_backoff_max_seconds is not None:
+        task.retry_backoff_max_seconds = retry_backoff_max_seconds
+    if retry_jitter is not None:
+        task.retry_jitter = retry_jitter
+    if retention_days is not None:
+        task.retention_days = retention_days
+    if misfire_policy is not None:
+        task.misfire_policy = misfire_policy
+    if capture_body is not None:
+        task.capture_body = capture_body
+    return task
+
+def update_task(db: Session, task_id: int, **fields) -> Optional[Task]:
+    task = get_task(db, task_id)
+    if not task:
+        return None
+    apply_update(task, **fields)
     db.add(task)
     db.commit()
     db.refresh(task)
+    invalidate_task(task_id)
+    scheduler.upsert(task)
     return task
 
+# ---------- batches ----------
+# One transaction per batch; items that fail validation are reported and
+# skipped, the rest are written with a few multi-row statements.
+BATCH_CHUNK = 1000  # ids per IN (...) / rows per statement
+
+@lru_cache(maxsize=1024)  # thousands of tasks share a handful of expressions
+def _cron_error(cron: Optional[str]) -> Optional[str]:
+    from croniter import croniter
+    if cron and not croniter.is_valid(cron):
+        return f"invalid cron expression: {cron!r}"
+    return None
+
+def _shared_encryptor() -> Callable:
+    """``encrypt_headers`` that encrypts each distinct header set once per batch."""
+    tokens = {}
+    def encrypt(headers: dict) -> str:
+        key = json.dumps(headers, sort_keys=True)
+        if key not in tokens:
+            tokens[key] = encrypt_headers(headers)
+        return tokens[key]
+    return encrypt
+
+def _result(index: int, task_id: Optional[int] = None, error: Optional[str] = None) -> dict:
+    return {"index": index, "ok": error is None, "id": task_id, "error": error}
+
+def create_tasks(db: Session, user_id: str, tasks_in: List[TaskCreate]) -> List[dict]:
+    """Insert many tasks with multi-row INSERT ... RETURNING; per-item results."""
+    results, rows, positions = [None] * len(tasks_in), [], []
+    encrypt, slots, now = _shared_encryptor(), {}, datetime.utcnow()
+    for i, task_in in enumerate(tasks_in):
+        error = _cron_error(task_in.schedule_cron)
+        if error:
+            results[i] = _result(i, error=error)
+            continue
+        rows.append(dict(task_values(user_id, task_in, encrypt, slots), created_at=now, updated_at=now))
+        positions.append(i)
+    stmt = insert(Task).returning(Task.id, sort_by_parameter_order=True)
+    ids = []
+    for start in range(0, len(rows), BATCH_CHUNK):
+        ids += db.scalars(stmt, rows[start:start + BATCH_CHUNK]).all()
+    db.commit()
+    for i, task_id, row in zip(positions, ids, rows):
+        results[i] = _result(i, task_id)
+    scheduler.upsert_many(SimpleNamespace(id=task_id, **row) for task_id, row in zip(ids, rows))
+    return results
+
+def update_tasks(db: Session, updates: List[TaskBatchUpdate]) -> List[dict]:
+    """Apply many partial updates in one transaction; per-item results."""
+    results = [None] * len(updates)
+    valid = []
+    for i, upd in enumerate(updates):
+        error = _cron_error(upd.schedule_cron)
+        if error:
+            results[i] = _result(i, upd.id, error)
+        else:
+            valid.append((i, upd))
+    ids = list({upd.id for _, upd in valid})
+    tasks = {}
+    for start in range(0, len(ids), BATCH_CHUNK):
+        tasks.update((t.id, t) for t in db.query(Task).filter(Task.id.in_(ids[start:start + BATCH_CHUNK])))
+    encrypt = _shared_encryptor()
+    for i, upd in valid:
+        task = tasks.get(upd.id)
+        if task is None:
+            results[i] = _result(i, upd.id, "Task not found")
+            continue
+        apply_update(task, encrypt=encrypt, **upd.model_dump(exclude={"id"}))
+        results[i] = _result(i, upd.id)
+    db.commit()  # the flush groups UPDATEs that set the same columns into executemany
+    touched = [tasks[r["id"]] for r in results if r["ok"]]
+    for task in touched:
+        invalidate_task(task.id)
+    scheduler.upsert_many(touched)
+    return results
+
+def set_enabled(db: Session, ids: List[int], enabled: bool) -> List[dict]:
+    """Enable or disable many tasks; enabling computes each task's next slot."""
+    t = Task.__table__
+    found = {}
+    unique = list(dict.fromkeys(ids))
+    for start in range(0, len(unique), BATCH_CHUNK):
+        chunk = unique[start:start + BATCH_CHUNK]
+        found.update((row.id, row) for row in db.execute(
+            t.select().with_only_columns(t.c.id, t.c.schedule_cron, t.c.enabled, t.c.next_run_at)
+            .where(t.c.id.in_(chunk))
+        ))
+    changed = [SimpleNamespace(id=row.id, schedule_cron=row.schedule_cron, enabled=enabled,
+                               next_run_at=None) for row in found.values() if row.enabled != enabled]
+    slots = {}
+    for task in changed:
+        task.next_run_at = _next_run_at(task, slots)
+    if changed:
+        stmt = (
+            update(t).where(t.c.id == bindparam("tid"))
+            .values(enabled=enabled, next_run_at=bindparam("nxt"), updated_at=datetime.utcnow())
+        )
+        params = [{"tid": task.id, "nxt": task.next_run_at} for task in changed]
+        for start in range(0, len(params), BATCH_CHUNK):
+            db.execute(stmt, params[start:start + BATCH_CHUNK])
+    db.commit()
+    for task in changed:
+        invalidate_task(task.id)
+    scheduler.upsert_many(changed)
+    return [_result(i, task_id, None if task_id in found else "Task not found") for i, task_id in enumerate(ids)]
+
 def delete_task(db: Session, task_id: int) -> bool:
     task = get_task(db, task_id)
     if not task:
         return False
-    db.query(Run).filter(Run.task_id == task_id).delete()
-    db.query(DeadLetterQueue).filter(DeadLetterQueue.task_id == task_id).delete()
+    # stop firing first, then drop history in short transactions
+    task.enabled = False
+    db.commit()
+    scheduler.remove(task_id)
+    retention.delete_in_batches(db, Run, Run.task_id == task_id)
+    retention.delete_in_batches(db, DeadLetterQueue, DeadLetterQueue.task_id == task_id)
+    retention.delete_in_batches(db, SlotExecution, SlotExecution.task_id == task_id)
+    rollups.forget_task(db, task_id)
+    sketches.forget_task(db, task_id)
     db.delete(task)
     db.commit()
+    invalidate_task(task_id)
     return True
@@ -0,0 +1,117 @@
+# crud_async.py
+"""``crud`` for ``AsyncSession`` (the API routes).
+
+Reads and single-row writes are native async queries; multi-step
+housekeeping written against a sync ``Session`` (batched history deletes,
+rollup subtraction) runs through ``run_sync``, which drives the same code over
+the async connection without blocking the event loop.
+"""
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from cache import invalidate_task
+from models import Task, Run, DeadLetterQueue, ResponseBody
+from pagination import Cursor, keyset
+from scheduler import scheduler
+from schemas import TaskBatchUpdate, TaskCreate
+
+
+async def _page(db: AsyncSession, query, limit: int, offset: int, cursor: Optional[Cursor]) -> list:
+    if cursor is None and offset:
+        query = query.offset(offset)
+    return list(await db.scalars(query.limit(limit)))
+
+
+async def get_tasks(db: AsyncSession, limit: int = 50, offset: int = 0,
+                    cursor: Optional[Cursor] = None) -> List[Task]:
+    if cursor is None:
+        query = select(Task).order_by(Task.id)  # offset order, see crud.get_tasks
+    else:
+        query = keyset(select(Task), Task, cursor)
+    return await _page(db, query, limit, offset, cursor)
+
+
+async def get_task(db: AsyncSession, task_id: int) -> Optional[Task]:
+    return await db.get(Task, task_id)
+
+
+async def count_tasks(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(Task))
+
+
+async def get_runs_for_task(db: AsyncSession, task_id: int, limit: int = 100, offset: int = 0,
+                            cursor: Optional[Cursor] = None) -> List[Run]:
+    query = keyset(select(Run).where(Run.task_id == task_id), Run, cursor, descending=True)
+    return await _page(db, query, limit, offset, cursor)
+
+
+async def get_run_body(db: AsyncSession, task_id: int, run_id: int) -> Optional[ResponseBody]:
+    """Captured body of one run (None: no such run, nothing captured, or expired)."""
+    query = (
+        select(ResponseBody)
+        .join(Run, Run.body_hash == ResponseBody.hash)
+        .where(Run.id == run_id, Run.task_id == task_id)
+    )
+    return (await db.execute(query)).scalar_one_or_none()
+
+
+async def get_dlq_for_task(db: AsyncSession, task_id: int, limit: int = 100, offset: int = 0,
+                           cursor: Optional[Cursor] = None) -> List[DeadLetterQueue]:
+    query = keyset(
+        select(DeadLetterQueue).where(DeadLetterQueue.task_id == task_id), DeadLetterQueue, cursor, descending=True
+    )
+    return await _page(db, query, limit, offset, cursor)
+
+
+async def get_dlq_entry(db: AsyncSession, task_id: int, dlq_id: int) -> Optional[DeadLetterQueue]:
+    query = select(DeadLetterQueue).where(DeadLetterQueue.id == dlq_id, DeadLetterQueue.task_id == task_id)
+    return (await db.execute(query)).scalar_one_or_none()
+
+
+async def delete_dlq(db: AsyncSession, dlq_id: int) -> bool:
+    row = await db.get(DeadLetterQueue, dlq_id)
+    if not row:
+        return False
+    await db.delete(row)
+    await db.commit()
+    return True
+
+
+async def create_task(db: AsyncSession, user_id: str, task_in: TaskCreate) -> Task:
+    db_task = crud.new_task(user_id, task_in)
+    db.add(db_task)
+    await db.commit()
+    await db.refresh(db_task)
+    scheduler.upsert(db_task)
+    return db_task
+
+
+async def update_task(db: AsyncSession, task_id: int, **fields) -> Optional[Task]:
+    task = await get_task(db, task_id)
+    if not task:
+        return None
+    crud.apply_update(task, **fields)
+    await db.commit()
+    await db.refresh(task)
+    invalidate_task(task_id)
+    scheduler.upsert(task)
+    return task
+
+
+async def create_tasks(db: AsyncSession, user_id: str, tasks_in: List[TaskCreate]) -> List[dict]:
+    return await db.run_sync(crud.create_tasks, user_id, tasks_in)
+
+
+async def update_tasks(db: AsyncSession, updates: List[TaskBatchUpdate]) -> List[dict]:
+    return await db.run_sync(crud.update_tasks, updates)
+
+
+async def set_enabled(db: AsyncSession, ids: List[int], enabled: bool) -> List[dict]:
+    return await db.run_sync(crud.set_enabled, ids, enabled)
+
+
+async def delete_task(db: AsyncSession, task_id: int) -> bool:
+    return await db.run_sync(crud.delete_task, task_id)
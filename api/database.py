@@ -1,20 +1,107 @@
 # database.py
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
-from models import Base 
+from models import Base
 
 load_dotenv()
 
 # If no DATABASE_URL in .env, fallback to SQLite (easier for testing)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
 
-engine = create_engine(DATABASE_URL, echo=True, future=True)
+# ---------- engine settings (env) ----------
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"                      # log every SQL statement
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))       # seconds, below server idle timeouts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")   # safe with WAL, far fewer fsyncs
+# SQLite's lock is not fair: a writer can lose it repeatedly to a busy worker, so wait long
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _sqlite_on_disk(url: str) -> bool:
+    return _is_sqlite(url) and ":memory:" not in url and not url.rstrip("/").endswith(":")
+
+
+def _install_sqlite_pragmas(sync_engine, url: str, wal: bool, synchronous: str, busy_timeout_ms: int):
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if wal and _sqlite_on_disk(url):
+            cur.execute("PRAGMA journal_mode=WAL")  # readers no longer block on the writer
+        cur.execute(f"PRAGMA synchronous={synchronous}")
+        cur.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cur.close()
+
+
+def engine_options(url: str, *, writer: bool = False, echo: bool = None, **overrides) -> dict:
+    """``create_engine`` keyword arguments for ``url`` from the DB_* settings."""
+    opts = dict(echo=DB_ECHO if echo is None else echo, future=True)
+    if _is_sqlite(url):
+        opts["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if writer:
+            # one connection: writes from this process queue in the pool instead of
+            # contending for SQLite's lock and spinning on SQLITE_BUSY
+            opts.update(pool_size=1, max_overflow=0, pool_timeout=DB_POOL_TIMEOUT)
+    else:
+        opts.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING)
+    opts.update(overrides)
+    return opts
+
+
+def make_engine(url: str = DATABASE_URL, *, writer: bool = False, wal: bool = SQLITE_WAL,
+                synchronous: str = SQLITE_SYNCHRONOUS, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+                **overrides):
+    eng = create_engine(url, **engine_options(url, writer=writer, **overrides))
+    if _is_sqlite(url):
+        _install_sqlite_pragmas(eng, url, wal, synchronous, busy_timeout_ms)
+    return eng
+
+
+def async_url(url: str) -> str:
+    """Same database through an asyncio driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            # asyncpg spells libpq's sslmode as ssl
+            return "postgresql+asyncpg://" + url[len(prefix):].replace("sslmode=", "ssl=")
+    return url
+
+
+def make_async_engine(url: str, **overrides):
+    # SQLite keeps aiosqlite's default NullPool: the async pool's queue is bound to the
+    # event loop that first used it, and connections there are cheap to open
+    eng = create_async_engine(url, **engine_options(url, **overrides))
+    if _is_sqlite(url):
+        _install_sqlite_pragmas(eng.sync_engine, url, SQLITE_WAL, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS)
+    return eng
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# bulk result writes (sink); on Postgres the regular pool serves them
+writer_engine = make_engine(DATABASE_URL, writer=True) if _is_sqlite(DATABASE_URL) else engine
+WriterSessionLocal = sessionmaker(bind=writer_engine, autoflush=False, autocommit=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 # Ensure Base is visible for tests
-__all__ = ["Base", "engine", "SessionLocal"]
+__all__ = ["Base", "engine", "SessionLocal", "writer_engine", "WriterSessionLocal",
+           "async_engine", "AsyncSessionLocal"]
 
 # Dependency for FastAPI routes
 def get_db():
@@ -23,3 +110,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency for async routes
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
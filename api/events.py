@@ -0,0 +1,282 @@
+# events.py
+"""Live feed of run results for the dashboard (served as SSE by routers/events.py).
+
+The result sink publishes every committed batch here: one ``run`` event per
+run, one ``dlq`` event per dead letter. Each subscriber has its own bounded
+buffer (``EVENTS_BUFFER``); a slow consumer loses the oldest run/DLQ events
+(it gets a ``dropped`` event with the count instead) but never the totals:
+a ``summary`` delta is accumulated per subscriber and delivered as one
+coalesced event with each read. Publishing never blocks the worker.
+
+Workers in other processes (``python -m worker``) reach the API's subscribers
+through a broker: set ``EVENTS_BROKER=host:port`` everywhere and run
+``python -m events broker``, a minimal line-based fan-out server standing in
+for Redis pub/sub (lossy, like the buffers: a stalled peer skips messages).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+import metrics
+from utils import process_id
+
+logger = logging.getLogger(__name__)
+
+BUFFER = int(os.getenv("EVENTS_BUFFER", "256"))  # events per subscriber
+MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000"))
+BROKER = os.getenv("EVENTS_BROKER", "")  # host:port, empty = in-process only
+BROKER_QUEUE = 1000  # batches waiting to be sent to the broker
+
+
+def _iso(ts) -> Optional[str]:
+    return ts.isoformat() if isinstance(ts, datetime) else ts
+
+
+def result_events(runs: List[dict], dlq: List[dict]) -> List[dict]:
+    """Feed events for a batch of result rows (see ``sink.record_results``)."""
+    out = [dict(type="run", task_id=r["task_id"], status=r.get("status"), latency_ms=r.get("latency_ms"),
+                response_code=r.get("response_code"), error=r.get("error"), created_at=_iso(r.get("created_at")))
+           for r in runs]
+    out += [dict(type="dlq", task_id=d["task_id"], error=d.get("error"), created_at=_iso(d.get("created_at")))
+            for d in dlq]
+    return out
+
+
+def _empty_summary() -> dict:
+    return dict(type="summary", runs=0, successes=0, failures=0, latency_sum=0, latency_count=0, dlq=0)
+
+
+class Subscriber:
+    """Bounded, coalescing buffer of one consumer; read from its event loop."""
+
+    def __init__(self, task_id: Optional[int] = None, maxlen: int = BUFFER,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.task_id = task_id
+        self.maxlen = maxlen
+        self.dropped = 0
+        self._buffer: deque = deque()
+        self._summary: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event() if loop else None
+
+    def offer(self, events: Iterable[dict]):
+        """Called by publishers on any thread; never blocks."""
+        added = False
+        with self._lock:
+            for ev in events:
+                if self.task_id is not None and ev.get("task_id") != self.task_id:
+                    continue
+                self._fold(ev)
+                if len(self._buffer) >= self.maxlen:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                    metrics.EVENTS_DROPPED.inc()
+                self._buffer.append(ev)
+                added = True
+        if added and self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                pass  # loop closed: the consumer is gone
+
+    def _fold(self, ev: dict):
+        s = self._summary or _empty_summary()
+        if ev["type"] == "run":
+            s["runs"] += 1
+            s["successes" if ev.get("status") == "success" else "failures"] += 1
+            if ev.get("latency_ms"):
+                s["latency_sum"] += ev["latency_ms"]
+                s["latency_count"] += 1
+        elif ev["type"] == "dlq":
+            s["dlq"] += 1
+        else:
+            return
+        self._summary = s
+
+    def take(self) -> List[dict]:
+        """Everything pending: a ``dropped`` notice, the events, then the summary delta."""
+        with self._lock:
+            out = [dict(type="dropped", count=self.dropped)] if self.dropped else []
+            out += self._buffer
+            if self._summary:
+                out.append(self._summary)
+            self._buffer, self._summary, self.dropped = deque(), None, 0
+        return out
+
+    async def next_batch(self, timeout: float) -> List[dict]:
+        """Wait up to ``timeout`` for events ([] on timeout)."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        return self.take()
+
+
+class EventBus:
+    """In-process fan-out to subscribers, optionally bridged through a broker."""
+
+    def __init__(self):
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self.link: Optional["BrokerLink"] = None
+
+    def subscribe(self, task_id: Optional[int] = None, maxlen: int = BUFFER) -> Subscriber:
+        """New subscriber woken on the running event loop; ``OverflowError`` when full."""
+        sub = Subscriber(task_id, maxlen, asyncio.get_running_loop())
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                raise OverflowError("too many live subscribers")
+            self._subscribers.add(sub)
+            metrics.EVENT_SUBSCRIBERS.set(len(self._subscribers))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self._subscribers.discard(sub)
+            metrics.EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+    def publish(self, events: List[dict], forward: bool = True):
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.offer(events)
+        if forward and self.link is not None:
+            self.link.send(events)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+# ---------- cross-process bridge ----------
+def _address(value: str):
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class BrokerLink:
+    """Keeps one connection to the broker: sends local batches, publishes remote ones.
+
+    Batches are JSON lines tagged with the process id so a process ignores its
+    own messages. Sending goes through a bounded queue; when the broker is
+    down or slow, batches are dropped rather than queued without limit.
+    """
+
+    def __init__(self, bus: EventBus, address: str):
+        self.bus = bus
+        self.address = _address(address)
+        self.origin = process_id()
+        self._outbox: "queue.Queue[bytes]" = queue.Queue(BROKER_QUEUE)
+        self._sock: Optional[socket.socket] = None
+
+    def start(self):
+        threading.Thread(target=self._read_loop, name="events-link", daemon=True).start()
+        threading.Thread(target=self._write_loop, name="events-link-send", daemon=True).start()
+
+    def send(self, events: List[dict]):
+        line = json.dumps({"origin": self.origin, "events": events}).encode() + b"\n"
+        try:
+            self._outbox.put_nowait(line)
+        except queue.Full:
+            metrics.EVENTS_DROPPED.inc(len(events))
+
+    def _write_loop(self):
+        while True:
+            line = self._outbox.get()
+            sock = self._sock
+            if sock is None:
+                continue  # not connected: drop
+            try:
+                sock.sendall(line)
+            except OSError:
+                pass  # the read loop notices and reconnects
+
+    def _read_loop(self):
+        backoff = 1.0
+        while True:
+            try:
+                with socket.create_connection(self.address, timeout=5) as sock:
+                    sock.settimeout(None)
+                    self._sock = sock
+                    backoff = 1.0
+                    logger.info("📡 Connected to event broker %s:%s", *self.address)
+                    for line in sock.makefile("rb"):
+                        msg = json.loads(line)
+                        if msg.get("origin") != self.origin:
+                            self.bus.publish(msg.get("events", []), forward=False)
+            except (OSError, ValueError) as e:
+                logger.warning("⚠️ Event broker %s:%s unavailable (%s), retrying in %ss",
+                               *self.address, e, backoff)
+            self._sock = None
+            time.sleep(backoff)
+            backoff = min(30.0, backoff * 2)
+
+
+def start_bridge(address: str = BROKER) -> Optional[BrokerLink]:
+    """Connect the process-wide bus to the broker (once; no-op without ``EVENTS_BROKER``)."""
+    if not address or bus.link is not None:
+        return bus.link
+    with bus._lock:
+        if bus.link is None:
+            bus.link = BrokerLink(bus, address)
+            bus.link.start()
+    return bus.link
+
+
+# ---------- broker stand-in: python -m events broker ----------
+async def serve_broker(host: str, port: int, max_buffer: int = 1 << 20):
+    """Relay every line to every other connection; peers with ``max_buffer`` unsent bytes skip lines."""
+    peers: Set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peers.add(writer)
+        try:
+            while line := await reader.readline():
+                for peer in list(peers):
+                    if peer is not writer and peer.transport.get_write_buffer_size() < max_buffer:
+                        peer.write(line)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            peers.discard(writer)
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port, limit=1 << 24)
+    logger.info("📡 Event broker listening on %s:%s", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m events")
+    parser.add_argument("command", choices=["broker"])
+    parser.add_argument("--listen", default=BROKER or "127.0.0.1:9310", help="host:port")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    asyncio.run(serve_broker(*_address(args.listen)))
+
+
+# process-wide bus: the sink publishes, the SSE route subscribes
+bus = EventBus()
+
+
+def publish_results(runs: List[dict], dlq: List[dict]):
+    """Sink commit listener."""
+    bus.publish(result_events(runs, dlq))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# executor.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+from breaker import HostGuards
+from cache import task_headers
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = int(os.getenv("EXECUTOR_MAX_CONCURRENCY", "100"))
+PER_HOST_CONCURRENCY = int(os.getenv("EXECUTOR_PER_HOST_CONCURRENCY", "10"))
+REQUEST_TIMEOUT = float(os.getenv("EXECUTOR_TIMEOUT_SECONDS", "10"))
+# connection pool, one per destination origin
+POOL_SIZE = int(os.getenv("EXECUTOR_POOL_SIZE", str(PER_HOST_CONCURRENCY)))
+POOL_KEEPALIVE = int(os.getenv("EXECUTOR_POOL_KEEPALIVE", str(POOL_SIZE)))
+KEEPALIVE_SECONDS = float(os.getenv("EXECUTOR_KEEPALIVE_SECONDS", "60"))
+HTTP2 = os.getenv("EXECUTOR_HTTP2", "auto")
+# header carrying the slot's outbox key (see outbox.py), empty = not sent
+IDEMPOTENCY_HEADER = os.getenv("IDEMPOTENCY_HEADER", "Idempotency-Key")
+# bytes of the response kept for tasks with capture_body (see bodies.py); the rest is not read
+BODY_CAPTURE_MAX_BYTES = int(os.getenv("BODY_CAPTURE_MAX_BYTES", "65536"))
+
+
+def _http2_enabled() -> bool:
+    if HTTP2 == "0":
+        return False
+    try:
+        import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+        return True
+    except ImportError:
+        if HTTP2 == "1":
+            logger.warning("EXECUTOR_HTTP2=1 but the h2 package is missing, using HTTP/1.1")
+        return False
+
+
+class Body(NamedTuple):
+    """Captured start of a response body."""
+    data: bytes
+    truncated: bool
+    content_type: Optional[str] = None
+
+
+class Outcome(NamedTuple):
+    """Result of one HTTP attempt.
+
+    The first four fields are the ``(ok, latency, code, err)`` contract the
+    worker and the replay route use; ``connect_ms`` is time spent opening the
+    TCP/TLS connection (0 when a pooled connection was reused) and
+    ``response_ms`` is the rest of ``latency``. ``retry_after`` is set when the
+    request was refused locally (open circuit, rate limit, see breaker.py): it
+    never reached the host, which accepts requests again in that many seconds.
+    ``body`` is only set for tasks that capture bodies.
+    """
+    ok: bool
+    latency: int
+    code: int
+    err: Optional[str]
+    connect_ms: Optional[int] = None
+    response_ms: Optional[int] = None
+    retry_after: Optional[float] = None
+    body: Optional[Body] = None
+
+    def as_tuple(self) -> Tuple[bool, int, int, Optional[str]]:
+        return self.ok, self.latency, self.code, self.err
+
+
+class Request(NamedTuple):
+    """Plain snapshot of a task, safe to hand to the event loop thread."""
+    task_id: int
+    method: str
+    url: str
+    headers: dict
+    body: Optional[str]
+    capture: int = 0  # response bytes to keep, 0 = none
+
+
+def request_for(task, idempotency_key: Optional[str] = None) -> Request:
+    try:
+        headers = task_headers(task)  # decrypted once per task version
+    except Exception as e:
+        logger.error(f"Header decrypt failed: {e}")
+        headers = {}
+    if idempotency_key and IDEMPOTENCY_HEADER and IDEMPOTENCY_HEADER.lower() not in map(str.lower, headers):
+        headers = {**headers, IDEMPOTENCY_HEADER: idempotency_key}  # copy: the cached dict is shared
+    capture = BODY_CAPTURE_MAX_BYTES if getattr(task, "capture_body", None) else 0
+    return Request(task.id, task.method, task.url, headers, task.body, capture)
+
+
+def _host_port(parts) -> str:
+    """``host[:port]`` of a split URL; userinfo is left out so credentials never
+    end up in pool/limiter keys, metric labels or error messages."""
+    host = parts.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"  # IPv6 literal
+    try:
+        port = parts.port
+    except ValueError:
+        port = None  # malformed port: the request itself fails with a proper error
+    return f"{host}:{port}" if port is not None else host
+
+
+def host_of(url: str) -> str:
+    return _host_port(urlsplit(url))
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{_host_port(parts)}"
+
+
+class _ConnectTimer:
+    """httpx trace hook measuring TCP connect + TLS handshake time."""
+
+    def __init__(self):
+        self.started = None
+        self.connect_ms = 0
+
+    async def __call__(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            self.started = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self.started is not None:
+                self.connect_ms = int((time.perf_counter() - self.started) * 1000)
+
+
+async def _read_body(resp: httpx.Response, cap: int) -> Optional[Body]:
+    """Up to ``cap`` bytes of the (decoded) body; without a cap the body is drained unread."""
+    if not cap:
+        async for _ in resp.aiter_bytes():
+            pass  # read to the end so the connection goes back to the pool
+        return None
+    buf = bytearray()
+    async for chunk in resp.aiter_bytes():
+        buf += chunk
+        if len(buf) > cap:
+            # stop here: closing a half-read response drops its connection, which beats
+            # downloading a huge payload we would not keep
+            return Body(bytes(buf[:cap]), True, resp.headers.get("content-type"))
+    return Body(bytes(buf), False, resp.headers.get("content-type"))
+
+
+class Executor:
+    """Runs HTTP calls concurrently on a private asyncio loop.
+
+    Callers stay synchronous: ``submit`` returns a ``concurrent.futures.Future``
+    and ``execute``/``map`` block on it. Concurrency is bounded globally and per
+    destination host, so one slow endpoint cannot starve the others.
+
+    Requests also pass the destination host's token bucket and circuit breaker
+    (``guards``), so a dead or overloaded host fails fast instead of tying up
+    slots for the full timeout.
+
+    Each destination origin gets its own keep-alive ``AsyncClient`` (HTTP/2 when
+    ``h2`` is installed), so repeated calls to the same host reuse connections
+    instead of paying a TCP/TLS handshake every time.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY,
+                 per_host: int = PER_HOST_CONCURRENCY, timeout: float = REQUEST_TIMEOUT,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 pool_size: int = POOL_SIZE, pool_keepalive: int = POOL_KEEPALIVE,
+                 keepalive_seconds: float = KEEPALIVE_SECONDS, http2: Optional[bool] = None,
+                 guards: Optional[HostGuards] = None):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.transport = transport
+        self.limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_keepalive,
+            keepalive_expiry=keepalive_seconds,
+        )
+        self.http2 = _http2_enabled() if http2 is None else http2
+        self.guards = guards or HostGuards()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._global_sem: Optional[asyncio.Semaphore] = None
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}
+
+    # ---------- lifecycle ----------
+    def start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._global_sem = asyncio.Semaphore(self.max_concurrency)
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="executor-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    def shutdown(self, timeout: float = 30):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close_clients(), loop).result(timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        self._host_sems.clear()
+
+    async def _close_clients(self):
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        origin = origin_of(url)
+        client = self._clients.get(origin)
+        if client is None:
+            client = self._clients[origin] = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self.transport,
+            )
+        return client
+
+    # ---------- execution ----------
+    async def _send(self, req: Request) -> Outcome:
+        host = host_of(req.url)
+        admission = self.guards.acquire(host)
+        if not admission.allowed:
+            metrics.REQUESTS.labels("refused").inc()
+            return Outcome(False, 0, 0, admission.reason, retry_after=admission.retry_after)
+        if admission.wait:
+            await asyncio.sleep(admission.wait)  # rate limited: wait for our token, off the semaphores
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = self._host_sems[host] = asyncio.Semaphore(self.per_host)
+        healthy = False
+        try:
+            async with self._global_sem, sem:
+                timer = _ConnectTimer()
+                start = time.perf_counter()
+                try:
+                    with metrics.INFLIGHT.track_inprogress():
+                        async with self._client_for(req.url).stream(
+                            req.method, req.url, headers=req.headers, content=req.body,
+                            extensions={"trace": timer},
+                        ) as resp:
+                            body = await _read_body(resp, req.capture)
+                    healthy = resp.status_code < 500
+                    elapsed = time.perf_counter() - start
+                    metrics.REQUEST_SECONDS.labels(metrics.host_label(host)).observe(elapsed)
+                    metrics.REQUESTS.labels("success").inc()
+                    latency = int(elapsed * 1000)
+                    return Outcome(True, latency, resp.status_code, None,
+                                   timer.connect_ms, max(0, latency - timer.connect_ms), body=body)
+                except Exception as e:
+                    metrics.REQUESTS.labels("failure").inc()
+                    return Outcome(False, 0, 0, str(e) or e.__class__.__name__)
+        finally:
+            self.guards.record(host, healthy)
+
+    def submit(self, task, idempotency_key: Optional[str] = None) -> Future:
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._send(request_for(task, idempotency_key)), self._loop)
+
+    def execute(self, task) -> Outcome:
+        return self.submit(task).result()
+
+    def map(self, tasks) -> List[Outcome]:
+        """Dispatch all tasks at once and return their results in order."""
+        futures = [self.submit(t) for t in tasks]
+        return [f.result() for f in futures]
+
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """Process-wide executor shared by the worker and the API routes."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = Executor()
+        return _executor
+
+
+def configure(**kwargs) -> Executor:
+    """Replace the process-wide executor (e.g. with CLI concurrency settings)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = Executor(**kwargs)
+        return _executor
@@ -0,0 +1,215 @@
+# export.py
+"""Streaming export of run history.
+
+Rows are read through a server-side cursor (``stream_results`` +
+``yield_per``) and encoded batch by batch, so memory stays constant whatever
+the size of the export. Formats:
+
+* ``ndjson`` / ``csv`` -- always available;
+* ``parquet`` / ``arrow`` (Arrow IPC stream) -- need the optional ``pyarrow``.
+
+Served by ``GET /export/runs`` (routers/export.py) and ``python -m export``.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from models import Run
+
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+COLUMNS = ("id", "task_id", "status", "latency_ms", "connect_ms", "response_ms",
+           "response_code", "error", "created_at")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def runs_query(task_ids: Optional[Sequence[int]] = None, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, batch_size: int = BATCH_SIZE):
+    """Runs of ``task_ids`` (all tasks when empty) in [since, until), oldest first."""
+    query = select(*(getattr(Run, c) for c in COLUMNS))
+    if task_ids:
+        query = query.where(Run.task_id.in_(list(task_ids)))
+    if since is not None:
+        query = query.where(Run.created_at >= since)
+    if until is not None:
+        query = query.where(Run.created_at < until)
+    # ix_runs_created_at serves the order; the cursor hands out batch_size rows at a time
+    return query.order_by(Run.created_at, Run.id).execution_options(stream_results=True, yield_per=batch_size)
+
+
+# ---------- encoders: start() / batch(rows) / finish() -> bytes ----------
+class NDJSONEncoder:
+    def start(self) -> bytes:
+        return b""
+
+    def batch(self, rows: List[tuple]) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(COLUMNS, row)), default=_iso) + "\n" for row in rows
+        ).encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class CSVEncoder:
+    def __init__(self):
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+
+    def _take(self) -> bytes:
+        out = self._buf.getvalue().encode()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return out
+
+    def start(self) -> bytes:
+        self._writer.writerow(COLUMNS)
+        return self._take()
+
+    def batch(self, rows: List[tuple]) -> bytes:
+        self._writer.writerows((_iso(v) if isinstance(v, datetime) else v for v in row) for row in rows)
+        return self._take()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file that hands what was written back to the caller."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+
+class ArrowEncoder:
+    """Parquet (one row group per batch) or an Arrow IPC stream, via pyarrow."""
+
+    def __init__(self, fmt: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+        self._pa, self._pq, self._fmt = pa, pq, fmt
+        self.schema = pa.schema([
+            ("id", pa.int64()), ("task_id", pa.int64()), ("status", pa.string()),
+            ("latency_ms", pa.int64()), ("connect_ms", pa.int64()), ("response_ms", pa.int64()),
+            ("response_code", pa.int64()), ("error", pa.string()), ("created_at", pa.timestamp("us")),
+        ])
+        self._sink = _Chunks()
+        self._writer = None
+
+    def start(self) -> bytes:
+        if self._fmt == "parquet":
+            self._writer = self._pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+        else:
+            self._writer = self._pa.ipc.new_stream(self._sink, self.schema)
+        return self._sink.take()
+
+    def batch(self, rows: List[tuple]) -> bytes:
+        columns = list(zip(*rows))
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(col, type=field.type) for col, field in zip(columns, self.schema)],
+            schema=self.schema,
+        )
+        self._writer.write_table(table)
+        return self._sink.take()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+def encoder(fmt: str):
+    """Encoder for ``fmt``; raises ``ValueError`` (unknown) or ``RuntimeError`` (pyarrow missing)."""
+    if fmt == "ndjson":
+        return NDJSONEncoder()
+    if fmt == "csv":
+        return CSVEncoder()
+    if fmt in ("parquet", "arrow"):
+        return ArrowEncoder(fmt)
+    raise ValueError(f"unknown format {fmt!r}, expected one of {', '.join(MEDIA_TYPES)}")
+
+
+def _iso(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"not serializable: {type(value).__name__}")
+
+
+# ---------- drivers ----------
+def iter_export(db, enc, query) -> Iterable[bytes]:
+    """Encoded chunks of ``query`` read with a sync ``Session``."""
+    yield enc.start()
+    for partition in db.execute(query).partitions():
+        yield enc.batch(partition)
+    yield enc.finish()
+
+
+async def aiter_export(db, enc, query):
+    """Same over an ``AsyncSession`` (``AsyncSession.stream`` keeps the cursor server-side)."""
+    yield enc.start()
+    result = await db.stream(query)
+    async for partition in result.partitions():
+        yield enc.batch(partition)
+    yield enc.finish()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m export", description="Export run history.")
+    parser.add_argument("--task-id", type=int, action="append", help="repeat for several tasks (default: all)")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--format", choices=sorted(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        enc = encoder(args.format)
+    except RuntimeError as e:
+        parser.error(str(e))
+    from database import SessionLocal
+    query = runs_query(args.task_id, args.since, args.until, args.batch_size)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    db = SessionLocal()
+    try:
+        for chunk in iter_export(db, enc, query):
+            out.write(chunk)
+    finally:
+        db.close()
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# leases.py
+"""Lease-based claiming of schedule slots across worker processes.
+
+Every worker keeps its own scheduler heap, so several workers see the same
+slot come due. Before firing, a worker claims ``(task, slot)`` with a single
+conditional UPDATE on ``tasks``: it only succeeds if the slot was not fired
+yet and nobody else holds a live lease on the task. The winner holds the
+lease while the attempt (and its retries) are in flight and renews it with a
+heartbeat; if it dies, the lease expires and other workers take over. The
+same UPDATE advances ``next_run_at`` so the due index stays current, and
+the won slots are written to the outbox (outbox.py) in that transaction, so
+a slot lost with its worker is fired again by ``recover``.
+
+On Postgres candidate rows are locked with ``FOR UPDATE SKIP LOCKED`` so
+competing workers skip each other instead of queueing; SQLite serializes
+writers, which makes the same conditional UPDATE atomic there.
+
+Optional sharding (``WORKER_SHARDS``/``WORKER_SHARD_INDEX``): a worker claims
+tasks of its own shard immediately and only takes over other shards' slots
+that are still unfired ``WORKER_TAKEOVER_SECONDS`` after they came due.
+"""
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, or_, select, true, update
+
+import outbox
+from models import SlotExecution, Task
+from utils import process_id
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = float(os.getenv("WORKER_LEASE_SECONDS", "60"))
+SHARDS = int(os.getenv("WORKER_SHARDS", "1"))
+SHARD_INDEX = int(os.getenv("WORKER_SHARD_INDEX", "0"))
+TAKEOVER_SECONDS = float(os.getenv("WORKER_TAKEOVER_SECONDS", "30"))
+
+# lease bookkeeping is not an edit: keep the version stamp the header cache checks
+_KEEP_VERSION = {"updated_at": Task.updated_at}
+
+
+class LeaseManager:
+    def __init__(self, worker_id: Optional[str] = None, lease_seconds: float = LEASE_SECONDS,
+                 shards: int = SHARDS, shard_index: int = SHARD_INDEX,
+                 takeover_seconds: float = TAKEOVER_SECONDS):
+        self.worker_id = worker_id or process_id()
+        self.lease = timedelta(seconds=lease_seconds)
+        self.shards = max(1, shards)
+        self.shard_index = shard_index
+        self.takeover = timedelta(seconds=takeover_seconds)
+
+    # ---------- sharding ----------
+    def owns_shard(self, task_id: int) -> bool:
+        return self.shards == 1 or task_id % self.shards == self.shard_index
+
+    def claim_delay(self, task_id: int, slot: datetime, now: datetime) -> float:
+        """Seconds to wait before trying to claim this slot (0 = claim now)."""
+        if self.owns_shard(task_id):
+            return 0.0
+        return max(0.0, (slot + self.takeover - now).total_seconds())
+
+    # ---------- claiming ----------
+    def _claimable(self, slot: datetime, now: datetime):
+        return and_(
+            or_(Task.last_fired_slot.is_(None), Task.last_fired_slot < slot),
+            or_(Task.lease_owner.is_(None), Task.lease_owner == self.worker_id, Task.lease_expires_at < now),
+        )
+
+    def claim(self, db, slots: Iterable[Tuple], now: datetime) -> Set[int]:
+        """Claim ``(task_id, slot[, next_slot])`` tuples; returns the ids this worker won (committed).
+
+        When ``next_slot`` is given the winner also stores it as ``next_run_at``,
+        and only if ``next_run_at`` still is ``slot``: a slot taken from a heap
+        entry built before the task was edited or disabled elsewhere neither
+        fires nor overwrites the slot the edit stored. Won slots are recorded
+        as ``running`` in the outbox.
+        """
+        by_slot = defaultdict(list)
+        for task_id, slot, *rest in slots:
+            by_slot[(slot, rest[0] if rest else None)].append(task_id)
+        if not by_slot:
+            return set()
+
+        dialect = db.get_bind().dialect
+        won_slots: List[Tuple[int, datetime]] = []
+        opts = dict(synchronize_session=False)
+        for (slot, next_slot), ids in by_slot.items():
+            values = dict(last_fired_slot=slot, lease_owner=self.worker_id,
+                          lease_expires_at=now + self.lease, **_KEEP_VERSION)
+            cond = and_(Task.id.in_(ids), self._claimable(slot, now))
+            if next_slot is not None:
+                values["next_run_at"] = next_slot
+                cond = and_(cond, Task.next_run_at == slot)
+            if dialect.name == "postgresql":
+                locked = select(Task.id).where(cond).with_for_update(skip_locked=True).scalar_subquery()
+                stmt = update(Task).where(Task.id.in_(locked)).values(**values).returning(Task.id)
+                won = list(db.scalars(stmt, execution_options=opts))
+            elif dialect.update_returning:
+                stmt = update(Task).where(cond).values(**values).returning(Task.id)
+                won = list(db.scalars(stmt, execution_options=opts))
+            else:
+                won = []
+                for task_id in ids:
+                    stmt = update(Task).where(Task.id == task_id, cond).values(**values)
+                    res = db.execute(stmt, execution_options=opts)
+                    if res.rowcount:
+                        won.append(task_id)
+            won_slots += [(task_id, slot) for task_id in won]
+        outbox.record_claims(db, self.worker_id, won_slots, now + self.lease, now)
+        db.commit()
+        lost = sum(len(ids) for ids in by_slot.values()) - len(won_slots)
+        if lost:
+            logger.debug("%s slot(s) already claimed by other workers", lost)
+        return {task_id for task_id, _ in won_slots}
+
+    def renew(self, db, now: datetime, keys: Iterable[str] = ()) -> int:
+        """Heartbeat: extend every lease this worker holds and its outstanding slots (``keys``)."""
+        res = db.execute(
+            update(Task)
+            .where(Task.lease_owner == self.worker_id)
+            .values(lease_expires_at=now + self.lease, **_KEEP_VERSION),
+            execution_options={"synchronize_session": False},
+        )
+        outbox.renew(db, keys, now + self.lease)
+        db.commit()
+        return res.rowcount
+
+    def release(self, db, task_ids: List[int], keys: Iterable[str] = ()):
+        """Give up leases once a task's attempt chain finished (success or DLQ); ``keys`` are done."""
+        keys = list(keys)
+        if not task_ids and not keys:
+            return
+        if task_ids:
+            db.execute(
+                update(Task)
+                .where(Task.id.in_(task_ids), Task.lease_owner == self.worker_id)
+                .values(lease_owner=None, lease_expires_at=None, **_KEEP_VERSION),
+                execution_options={"synchronize_session": False},
+            )
+        outbox.complete(db, keys, datetime.utcnow())
+        db.commit()
+
+    def release_all(self, db):
+        """Drop every lease this worker holds and requeue its unfinished slots (clean shutdown)."""
+        db.execute(
+            update(Task)
+            .where(Task.lease_owner == self.worker_id)
+            .values(lease_owner=None, lease_expires_at=None, **_KEEP_VERSION),
+            execution_options={"synchronize_session": False},
+        )
+        outbox.requeue(db, self.worker_id)
+        db.commit()
+
+    # ---------- outbox recovery ----------
+    def recover(self, db, now: datetime, limit: int = outbox.RECOVERY_BATCH) -> List[Tuple[int, str]]:
+        """Claim pending/abandoned slots of this shard (other shards' after the takeover grace)."""
+        where = true()
+        if self.shards > 1:
+            where = or_(SlotExecution.task_id % self.shards == self.shard_index,
+                        SlotExecution.slot < now - self.takeover)
+        return outbox.recover(db, self.worker_id, now, now + self.lease, where, limit)
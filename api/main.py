@@ -1,64 +1,86 @@
 import os
-from fastapi import FastAPI
-from database import engine
-from sqlalchemy.orm import Session
-from database import get_db
-from fastapi import Depends, HTTPException
-from models import Base
-from routers import tasks
-from seeds import seed
-import seeds.seed as seeder
-# import asyncio  # not needed anymore, but safe to keep if you want
-from worker import start_worker_background
-app = FastAPI()
-Base.metadata.create_all(bind=engine)
-
-app.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
-
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+import events
+import metrics
+
+# The scheduler runs in its own process (python -m worker); RUN_WORKER=1 also
+# starts it inside the API process (single-instance / local setups).
+RUN_WORKER = os.getenv("RUN_WORKER", "0") == "1" and os.getenv("DISABLE_WORKER") != "1"
+# Schema upgrades are a deploy step (python migrations.py); this is for local convenience.
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "0") == "1"
+
+
+def create_app(run_worker: bool = RUN_WORKER, migrate: bool = MIGRATE_ON_STARTUP) -> FastAPI:
+    """Build the API. Nothing touches the database or starts threads until startup."""
+    from routers import analytics, dlq, export, hosts, tasks
+    from routers import events as events_router
+
+    app = FastAPI()
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:5173",
+            "http://127.0.0.1:5173",
+            "https://task-runner.netlify.app",
+        ],
+        allow_origin_regex=None,      # set to r".*" only for quick debugging (not for prod)
+        allow_credentials=True,
+        allow_methods=["*"],          # <-- lets OPTIONS/POST/GET/etc through
+        allow_headers=["*"],          # <-- lets custom headers through
+        expose_headers=["X-Next-Cursor", "X-Body-Truncated"],  # keyset pagination, run bodies
+        max_age=600,                  # cache preflight (optional)
+    )
+
+    app.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
+    app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
+    app.include_router(export.router, prefix="/export", tags=["export"])
+    app.include_router(hosts.router, prefix="/hosts", tags=["hosts"])
+    app.include_router(dlq.router, prefix="/dlq", tags=["dlq"])
+    app.include_router(events_router.router, prefix="/events", tags=["events"])
+
+    @app.on_event("startup")
+    async def startup():
+        if migrate:
+            import migrations
+            from database import engine
+            migrations.upgrade(engine)
+        events.start_bridge()  # live feed from workers running elsewhere
+        if run_worker:
+            from worker import start_worker_background
+            start_worker_background()
+
+    @app.post("/seed")
+    def seed_database():
+        from scheduler import scheduler
+        from seeds import seed
+        try:
+            seed.run_seed()   # ✅ now it exists
+            scheduler.request_resync()  # in-process worker; a standalone one refreshes on its own
+            return {"status": "Database seeded successfully!"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Seed failed: {str(e)}")
+
+    @app.get("/")
+    def root():
+        return {"message": "Webhook Runner API running!"}
+
+    @app.get("/ping")
+    def ping():
+        return {"message": "pong"}
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        body, content_type = metrics.render()
+        return Response(body, media_type=content_type)
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    return app
+
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "https://task-runner.netlify.app",
-    ],
-    allow_origin_regex=None,      # set to r".*" only for quick debugging (not for prod)
-    allow_credentials=True,
-    allow_methods=["*"],          # <-- lets OPTIONS/POST/GET/etc through
-    allow_headers=["*"],          # <-- lets custom headers through
-    max_age=600,                  # cache preflight (optional)
-)
-
-from routers import analytics
-app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
-
-
-@app.on_event("startup")
-async def startup():
-    if os.getenv("DISABLE_WORKER") == "1":
-        return
-    # No loop argument needed for start_worker_background
-    start_worker_background()
-
-@app.post("/seed")
-def seed_database():
-    try:
-        seed.run_seed()   # ✅ now it exists
-        return {"status": "Database seeded successfully!"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Seed failed: {str(e)}")
-
-@app.get("/")
-def root():
-    return {"message": "Webhook Runner API running with worker!"}
-
-@app.get("/ping")
-def ping():
-    return {"message": "pong"}
-
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+app = create_app()  # uvicorn main:app (or uvicorn --factory main:create_app)
@@ -0,0 +1,75 @@
+# metrics.py
+"""Prometheus metrics for the worker hot path, the executor and the DB.
+
+Served by ``GET /metrics`` on the API (which also covers the in-process
+worker) and, for ``python -m worker``, by an exporter on
+``WORKER_METRICS_PORT`` (+ process index when running several processes).
+
+What to look at:
+
+* ``taskrunner_worker_tick_seconds`` / ``_due_tasks`` -- CPU in the loop;
+* ``taskrunner_schedule_lag_seconds`` -- dispatch time minus cron slot;
+* ``taskrunner_db_commit_seconds`` -- flush + commit of every session;
+* ``taskrunner_request_seconds{host}`` / ``_inflight_requests`` -- network.
+"""
+import logging
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# one label value per destination host; turn off when tasks hit very many hosts
+HOST_LABELS = os.getenv("METRICS_HOST_LABELS", "1") == "1"
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+_FAST = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+_SLOW = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_LAG = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+
+TICK_SECONDS = Histogram("taskrunner_worker_tick_seconds", "Duration of one worker loop pass", buckets=_FAST)
+DUE_TASKS = Histogram("taskrunner_worker_due_tasks", "Slots that came due in one pass",
+                      buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000))
+SCHEDULE_LAG = Histogram("taskrunner_schedule_lag_seconds", "Dispatch time minus the cron slot", buckets=_LAG)
+QUEUE_DEPTH = Gauge("taskrunner_queue_depth", "Items waiting in the worker's queues", ["queue"])
+INFLIGHT = Gauge("taskrunner_inflight_requests", "HTTP requests being sent by the executor")
+REQUEST_SECONDS = Histogram("taskrunner_request_seconds", "HTTP request latency per destination host",
+                            ["host"], buckets=_SLOW)
+REQUESTS = Counter("taskrunner_requests_total", "HTTP attempts by outcome", ["outcome"])
+DB_COMMIT_SECONDS = Histogram("taskrunner_db_commit_seconds", "Session flush + commit latency", buckets=_FAST)
+RESULTS_WRITTEN = Counter("taskrunner_results_written_total", "Rows written by the result sink", ["table"])
+DLQ = Counter("taskrunner_dlq_total", "Tasks moved to the dead-letter queue")
+DLQ_REPLAYED = Counter("taskrunner_dlq_replayed_total", "Dead letters fired again by bulk replays", ["outcome"])
+EVENT_SUBSCRIBERS = Gauge("taskrunner_event_subscribers", "Live feed connections")
+EVENTS_DROPPED = Counter("taskrunner_events_dropped_total", "Live feed events dropped for slow consumers")
+
+
+def host_label(host: str) -> str:
+    return host if HOST_LABELS else "*"
+
+
+# ---------- DB commit timing for every Session (sync and the ones behind AsyncSession) ----------
+@event.listens_for(Session, "before_commit")
+def _commit_started(session):
+    session.info["_commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_done(session):
+    started = session.info.pop("_commit_started", None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def render():
+    """Body and content type for ``/metrics``."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_exporter(port: int):
+    """Serve ``/metrics`` of this process on ``port`` (standalone workers)."""
+    start_http_server(port)
+    logger.info("📈 Metrics exporter on :%s", port)
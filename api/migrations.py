@@ -0,0 +1,107 @@
+# migrations.py
+"""Additive schema upgrades for databases created by older versions.
+
+``create_all`` only creates missing tables; columns added to existing models
+later are appended here with ``ALTER TABLE ... ADD COLUMN``. New columns are
+nullable and the code treats NULL as "use the default". Indexes declared on
+existing tables are created the same way.
+
+Run standalone with ``python migrations.py``.
+"""
+import logging
+
+from sqlalchemy import bindparam, func, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from models import Base, Run, Task
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(engine):
+    """Returns the ``(table, column)`` pairs that were added."""
+    insp = inspect(engine)
+    added = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl_type = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl_type}"))
+                logger.info("🧱 Added column %s.%s", table.name, col.name)
+                added.add((table.name, col.name))
+    return added
+
+
+def add_missing_indexes(engine):
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                logger.info("🧱 Added index %s", index.name)
+
+
+def _backfill_last_runs(db, batch_size: int = 1000):
+    t, r = Task.__table__, Run.__table__
+    latest = select(r.c.task_id, func.max(r.c.created_at).label("ts")).group_by(r.c.task_id).subquery()
+    rows = db.execute(
+        select(r.c.task_id, r.c.created_at, r.c.status)
+        .join(latest, (r.c.task_id == latest.c.task_id) & (r.c.created_at == latest.c.ts))
+    ).all()
+    params = list({task_id: {"tid": task_id, "ts": ts, "st": st} for task_id, ts, st in rows}.values())
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam("tid"))
+        .values(last_run_at=bindparam("ts"), last_status=bindparam("st"), updated_at=t.c.updated_at)
+    )
+    for i in range(0, len(params), batch_size):
+        db.execute(stmt, params[i:i + batch_size])
+
+
+def backfill(engine, new_tables, new_columns=()):
+    """Populate derived tables and columns that did not exist before this upgrade."""
+    if "run_rollups" in new_tables:
+        import rollups
+        with Session(engine) as db:
+            rollups.rebuild(db)
+            db.commit()
+        logger.info("🧮 Backfilled run_rollups from runs")
+    if ("tasks", "last_run_at") in new_columns:
+        with Session(engine) as db:
+            _backfill_last_runs(db)
+            db.commit()
+        logger.info("🧮 Backfilled tasks.last_run_at from runs")
+    if ("tasks", "next_run_at") in new_columns:
+        from scheduler import assign_next_runs
+        with Session(engine) as db:
+            n = assign_next_runs(db)
+        logger.info("🧮 Backfilled tasks.next_run_at for %s tasks", n)
+
+
+def upgrade(engine):
+    insp = inspect(engine)
+    new_tables = {t.name for t in Base.metadata.sorted_tables if not insp.has_table(t.name)}
+    if "runs" in new_tables and engine.dialect.name == "postgresql":
+        import retention
+        if retention.PARTITIONED:
+            Base.metadata.create_all(bind=engine, tables=[Task.__table__])  # runs references tasks
+            with engine.begin() as conn:
+                retention.create_partitioned_runs(conn)
+    Base.metadata.create_all(bind=engine)
+    new_columns = add_missing_columns(engine)
+    add_missing_indexes(engine)
+    backfill(engine, new_tables, new_columns)
+
+
+if __name__ == "__main__":
+    from database import engine
+    logging.basicConfig(level=logging.INFO)
+    upgrade(engine)
@@ -1,6 +1,6 @@
 # models.py
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, BigInteger, Index, LargeBinary
 import datetime
 
 Base = declarative_base()
@@ -16,6 +16,30 @@ class Task(Base):
     schedule_cron = Column(String, nullable=True)
     enabled = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # retry policy (NULL -> worker defaults)
+    max_retries = Column(Integer, nullable=True, default=3)
+    retry_backoff_seconds = Column(Float, nullable=True, default=1.0)
+    retry_backoff_max_seconds = Column(Float, nullable=True, default=60.0)
+    retry_jitter = Column(Float, nullable=True, default=0.0)
+    # multi-worker claiming (see leases.py)
+    last_fired_slot = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    # denormalized schedule state: the worker's "what is due" query reads
+    # (enabled, next_run_at) instead of aggregating runs
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True)
+    next_run_at = Column(DateTime, nullable=True)
+    retention_days = Column(Integer, nullable=True)  # run history TTL, NULL -> RUN_RETENTION_DAYS
+    misfire_policy = Column(String, nullable=True)   # fire_once | fire_all | skip, NULL -> MISFIRE_POLICY
+    capture_body = Column(Boolean, nullable=True)    # keep response bodies (see bodies.py), NULL -> off
+
+    __table_args__ = (
+        Index("ix_tasks_enabled_next_run_at", "enabled", "next_run_at"),
+        Index("ix_tasks_created_at_id", "created_at", "id"),  # keyset pagination
+        Index("ix_tasks_updated_at", "updated_at"),  # worker refresh (scheduler.refresh)
+    )
 
 class Run(Base):
     __tablename__ = "runs"
@@ -23,8 +47,27 @@ class Run(Base):
     task_id = Column(Integer, ForeignKey("tasks.id"), index=True)
     status = Column(String)
     latency_ms = Column(Integer, default=0)
+    connect_ms = Column(Integer, nullable=True)   # TCP/TLS setup, 0 on a reused connection
+    response_ms = Column(Integer, nullable=True)  # latency_ms - connect_ms
     response_code = Column(Integer, nullable=True)
     error = Column(Text, nullable=True)
+    body_hash = Column(String(64), nullable=True)  # -> response_bodies, only with capture_body
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# newest-first keyset pagination of a task's history (see pagination.py)
+Index("ix_runs_task_id_created_at_id", Run.task_id, Run.created_at.desc(), Run.id.desc())
+Index("ix_runs_created_at", Run.created_at)  # retention (see retention.py)
+Index("ix_runs_body_hash", Run.body_hash)  # orphaned body expiry
+
+class ResponseBody(Base):
+    """Captured response body, compressed and shared by every run that got the same bytes."""
+    __tablename__ = "response_bodies"
+    hash = Column(String(64), primary_key=True)  # sha256 of the captured bytes (+ truncation)
+    encoding = Column(String, nullable=False)     # zstd | gzip
+    size = Column(Integer, nullable=False)        # captured bytes, before compression
+    truncated = Column(Boolean, default=False)    # the response was longer than the capture cap
+    content_type = Column(String, nullable=True)
+    content = Column(LargeBinary, nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 class DeadLetterQueue(Base):
@@ -33,3 +76,58 @@ class DeadLetterQueue(Base):
     task_id = Column(Integer, ForeignKey("tasks.id"))
     error = Column(Text)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+Index("ix_dlq_task_id_created_at_id",
+      DeadLetterQueue.task_id, DeadLetterQueue.created_at.desc(), DeadLetterQueue.id.desc())
+
+class SlotExecution(Base):
+    """Claimed or queued cron slot of a task (the outbox, see outbox.py)."""
+    __tablename__ = "slot_executions"
+    id = Column(Integer, primary_key=True)
+    key = Column(String, nullable=False, unique=True)  # idempotency key: task + slot
+    task_id = Column(Integer, ForeignKey("tasks.id"), index=True)
+    slot = Column(DateTime, nullable=False)
+    state = Column(String, nullable=False, default="pending")  # pending | running | done
+    owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    deliveries = Column(Integer, default=0)  # times a worker picked it up
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+Index("ix_slot_executions_state_lease", SlotExecution.state, SlotExecution.lease_expires_at)
+
+# upper bounds (ms) of the latency histogram buckets kept in RunRollup
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class RunRollup(Base):
+    """Run counts and latency stats per task (0 = all tasks) and time bucket."""
+    __tablename__ = "run_rollups"
+    task_id = Column(Integer, primary_key=True)
+    granularity = Column(String, primary_key=True)   # minute | hour | day
+    bucket_start = Column(DateTime, primary_key=True)
+    total = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    latency_count = Column(Integer, default=0)        # runs with a non-zero latency
+    latency_sum = Column(BigInteger, default=0)
+    latency_min = Column(Integer, nullable=True)
+    latency_max = Column(Integer, nullable=True)
+    le_50 = Column(Integer, default=0)
+    le_100 = Column(Integer, default=0)
+    le_250 = Column(Integer, default=0)
+    le_500 = Column(Integer, default=0)
+    le_1000 = Column(Integer, default=0)
+    le_2500 = Column(Integer, default=0)
+    le_5000 = Column(Integer, default=0)
+    le_10000 = Column(Integer, default=0)
+    le_inf = Column(Integer, default=0)
+
+class LatencySketch(Base):
+    """Serialized latency sketch per series/bucket, one row per writing process."""
+    __tablename__ = "latency_sketches"
+    task_id = Column(Integer, primary_key=True)      # 0 = all tasks
+    granularity = Column(String, primary_key=True)   # minute | hour | day
+    bucket_start = Column(DateTime, primary_key=True)
+    worker_id = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    data = Column(Text, nullable=False)
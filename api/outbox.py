@@ -0,0 +1,182 @@
+# outbox.py
+"""Durable record of claimed cron slots: at-least-once execution.
+
+Every slot a worker claims gets a ``slot_executions`` row in the same
+transaction as the claim (see leases.py):
+
+* ``pending`` -- queued, nobody picked it up yet (misfire catch-up, shutdown);
+* ``running`` -- owned by a worker until ``lease_expires_at``; the owner keeps
+  extending the lease while the attempt or one of its retries is outstanding;
+* ``done`` -- the attempt chain ended (success or DLQ).
+
+A worker that dies mid-tick leaves ``running`` rows whose lease runs out, and
+a slot whose dispatch failed is never renewed. The ``recover`` pass (on
+startup, then with every resync) claims such rows and the ``pending`` ones in
+batches -- one SELECT and one UPDATE per batch -- and fires them again.
+Requests carry the row's key in an ``Idempotency-Key`` header, so receivers
+can drop the duplicates at-least-once delivery implies.
+
+Misfires -- slots nobody fired within ``MISFIRE_GRACE_SECONDS`` because no
+worker was running (or all were far behind) -- are settled in bulk before the
+scheduler loads, per task ``misfire_policy`` (NULL -> ``MISFIRE_POLICY``):
+
+* ``fire_once`` -- fire the latest missed slot once;
+* ``fire_all`` -- fire every missed slot, at most ``MISFIRE_MAX_CATCHUP``;
+* ``skip`` -- fire nothing and continue with the next future slot.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from cache import next_fire_time, prev_fire_times
+from models import SlotExecution, Task
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE = "pending", "running", "done"
+FIRE_ONCE, FIRE_ALL, SKIP = "fire_once", "fire_all", "skip"
+
+MISFIRE_POLICY = os.getenv("MISFIRE_POLICY", FIRE_ONCE)
+MISFIRE_GRACE_SECONDS = float(os.getenv("MISFIRE_GRACE_SECONDS", "60"))
+MISFIRE_MAX_CATCHUP = int(os.getenv("MISFIRE_MAX_CATCHUP", "100"))
+RECOVERY_BATCH = int(os.getenv("OUTBOX_RECOVERY_BATCH", "1000"))
+CHUNK = 500  # keys per IN (...)
+
+_NO_SYNC = {"synchronize_session": False}
+
+
+def slot_key(task_id: int, slot: datetime) -> str:
+    """Idempotency key of one slot of one task (stable across retries and workers)."""
+    return f"task-{task_id}-{slot:%Y%m%dT%H%M%S}"
+
+
+def _insert_missing(db, rows: List[dict]):
+    """INSERT rows whose key is new; existing slots are left alone."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        for i in range(0, len(rows), CHUNK):
+            db.execute(insert(SlotExecution).on_conflict_do_nothing(index_elements=["key"]), rows[i:i + CHUNK])
+        return
+    # portable fallback: no conflict clause, look the keys up first
+    for i in range(0, len(rows), CHUNK):
+        chunk = rows[i:i + CHUNK]
+        existing = set(db.scalars(select(SlotExecution.key).where(SlotExecution.key.in_([r["key"] for r in chunk]))))
+        db.add_all(SlotExecution(**r) for r in chunk if r["key"] not in existing)
+    db.flush()
+
+
+def _update_keys(db, keys: Iterable[str], *where, **values):
+    keys = list(keys)
+    for i in range(0, len(keys), CHUNK):
+        db.execute(
+            update(SlotExecution).where(SlotExecution.key.in_(keys[i:i + CHUNK]), *where).values(**values),
+            execution_options=_NO_SYNC,
+        )
+
+
+# ---------- owner side (called through LeaseManager, no commit here) ----------
+def record_claims(db, worker_id: str, claims: Iterable[Tuple[int, datetime]], lease_until: datetime,
+                  now: datetime) -> List[str]:
+    """``running`` rows for slots just won through the ``tasks`` claim."""
+    rows = [dict(key=slot_key(task_id, slot), task_id=task_id, slot=slot, state=RUNNING, owner=worker_id,
+                 lease_expires_at=lease_until, deliveries=1, created_at=now) for task_id, slot in claims]
+    _insert_missing(db, rows)
+    return [row["key"] for row in rows]
+
+
+def renew(db, keys: Iterable[str], lease_until: datetime):
+    _update_keys(db, keys, SlotExecution.state == RUNNING, lease_expires_at=lease_until)
+
+
+def complete(db, keys: Iterable[str], now: datetime):
+    _update_keys(db, keys, SlotExecution.state != DONE,
+                 state=DONE, owner=None, lease_expires_at=None, finished_at=now)
+
+
+def requeue(db, worker_id: str) -> int:
+    """Hand this worker's unfinished slots back (clean shutdown)."""
+    res = db.execute(
+        update(SlotExecution)
+        .where(SlotExecution.owner == worker_id, SlotExecution.state == RUNNING)
+        .values(state=PENDING, owner=None, lease_expires_at=None),
+        execution_options=_NO_SYNC,
+    )
+    return res.rowcount
+
+
+# ---------- recovery ----------
+def recover(db, worker_id: str, now: datetime, lease_until: datetime, where=None,
+            limit: int = RECOVERY_BATCH) -> List[Tuple[int, str]]:
+    """Claim up to ``limit`` pending or abandoned slots (committed) -> ``(task_id, key)``."""
+    o = SlotExecution
+    cond = or_(o.state == PENDING, and_(o.state == RUNNING, o.lease_expires_at < now))
+    if where is not None:
+        cond = and_(cond, where)
+    values = dict(state=RUNNING, owner=worker_id, lease_expires_at=lease_until, deliveries=o.deliveries + 1)
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql":
+        locked = select(o.id).where(cond).order_by(o.slot).limit(limit).with_for_update(skip_locked=True)
+        stmt = update(o).where(o.id.in_(locked.scalar_subquery())).values(**values).returning(o.task_id, o.key)
+        rows = db.execute(stmt, execution_options=_NO_SYNC).all()
+    else:
+        ids = list(db.scalars(select(o.id).where(cond).order_by(o.slot).limit(limit)))
+        if dialect.update_returning:
+            stmt = update(o).where(o.id.in_(ids), cond).values(**values).returning(o.task_id, o.key)
+            rows = db.execute(stmt, execution_options=_NO_SYNC).all() if ids else []
+        else:
+            rows = []
+            for row_id in ids:
+                if db.execute(update(o).where(o.id == row_id, cond).values(**values), execution_options=_NO_SYNC).rowcount:
+                    rows.append(db.execute(select(o.task_id, o.key).where(o.id == row_id)).one())
+    db.commit()
+    if rows:
+        logger.info("♻️ Recovered %s slot(s) from the outbox", len(rows))
+    return [(task_id, key) for task_id, key in rows]
+
+
+# ---------- misfires ----------
+def apply_misfires(db, now: Optional[datetime] = None, grace_seconds: float = MISFIRE_GRACE_SECONDS,
+                   max_catchup: int = MISFIRE_MAX_CATCHUP, batch_size: int = CHUNK) -> dict:
+    """Settle every overdue task in one pass (committed); queued slots wait as ``pending``.
+
+    Each task moves to its next future slot and ``last_fired_slot`` to its
+    latest missed one, so a worker still holding an old slot in its heap can
+    no longer claim it.
+    """
+    now = now or datetime.utcnow()
+    t = Task.__table__
+    rows = db.execute(
+        select(t.c.id, t.c.schedule_cron, t.c.next_run_at, t.c.misfire_policy)
+        .where(t.c.enabled == True, t.c.schedule_cron.isnot(None),
+               t.c.next_run_at < now - timedelta(seconds=grace_seconds))
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        return {}
+    params, queued = [], []
+    for task_id, cron, missed_from, policy in rows:
+        policy = policy or MISFIRE_POLICY
+        slots = prev_fire_times(cron, now, missed_from, max_catchup if policy == FIRE_ALL else 1)
+        params.append({"tid": task_id, "old": missed_from, "nxt": next_fire_time(cron, now),
+                       "last": slots[-1] if slots else missed_from})
+        if policy != SKIP:
+            queued += [dict(key=slot_key(task_id, slot), task_id=task_id, slot=slot, state=PENDING,
+                            deliveries=0, created_at=now) for slot in slots]
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam("tid"), t.c.next_run_at == bindparam("old"))
+        .values(next_run_at=bindparam("nxt"), last_fired_slot=bindparam("last"), updated_at=t.c.updated_at)
+    )
+    for i in range(0, len(params), batch_size):
+        db.execute(stmt, params[i:i + batch_size])
+    _insert_missing(db, queued)
+    db.commit()
+    logger.info("⏰ Misfired: %s task(s), %s slot(s) queued", len(rows), len(queued))
+    return {"tasks": len(rows), "queued": len(queued)}
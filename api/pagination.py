@@ -0,0 +1,52 @@
+# pagination.py
+"""Keyset pagination on ``(created_at, id)``.
+
+A cursor is the sort key of the last row of a page, encoded as an opaque
+URL-safe string. The next page starts strictly after it, so deep pages cost
+one index seek instead of scanning and discarding ``offset`` rows.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(row) -> str:
+    raw = json.dumps([row.created_at.isoformat(), row.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ``ValueError`` on anything that is not a cursor we issued."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+
+
+def keyset(query, model, cursor: Optional[Cursor], descending: bool = False):
+    """Order ``query`` by (created_at, id) and, with a cursor, start after it."""
+    created_at, row_id = model.created_at, model.id
+    if cursor is not None:
+        ts, last_id = cursor
+        if descending:
+            after = or_(created_at < ts, and_(created_at == ts, row_id < last_id))
+        else:
+            after = or_(created_at > ts, and_(created_at == ts, row_id > last_id))
+        query = query.filter(after)
+    if descending:
+        return query.order_by(created_at.desc(), row_id.desc())
+    return query.order_by(created_at, row_id)
+
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    """Cursor for the page after ``rows``, None when this was the last page."""
+    if len(rows) < limit or not rows:
+        return None
+    return encode_cursor(rows[-1])
@@ -0,0 +1,254 @@
+# replay.py
+"""Bulk DLQ replay as background jobs.
+
+A job selects dead letters by task, time range and error class, fires them
+again on the shared executor and, chunk by chunk (``REPLAY_CHUNK`` rows),
+writes the runs and deletes the letters that now succeeded in one
+transaction. Failed replays stay in the DLQ (with a new failed run), so a
+job can simply be started again.
+
+* at most ``concurrency`` requests of a job are in flight and at most
+  ``rate`` are started per second, so a replay after an outage does not
+  flood the hosts that just recovered -- or starve the worker's own slots;
+* rows are read by id (keyset) up to the newest id at start: letters added
+  while the job runs are left for the next one;
+* letters of tasks deleted in the meantime are dropped (``skipped``);
+* jobs live in this process (``REPLAY_MAX_JOBS`` run at once, the last
+  ``REPLAY_KEEP_JOBS`` are kept for progress queries).
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import and_, delete, func, not_, or_, select
+
+import metrics
+from database import SessionLocal, WriterSessionLocal
+from models import DeadLetterQueue, Task
+from sink import notify_committed, record_results, run_values
+
+logger = logging.getLogger(__name__)
+
+CHUNK = int(os.getenv("REPLAY_CHUNK", "200"))
+DEFAULT_CONCURRENCY = int(os.getenv("REPLAY_CONCURRENCY", "20"))
+MAX_CONCURRENCY = int(os.getenv("REPLAY_MAX_CONCURRENCY", "100"))
+DEFAULT_RATE = float(os.getenv("REPLAY_RATE", "50"))  # requests started per second, 0 = unlimited
+MAX_RATE = float(os.getenv("REPLAY_MAX_RATE", "1000"))
+MAX_JOBS = int(os.getenv("REPLAY_MAX_JOBS", "2"))
+KEEP_JOBS = int(os.getenv("REPLAY_KEEP_JOBS", "100"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+# error class -> LIKE patterns on lower(error); a letter gets the first class that matches
+ERROR_CLASSES = OrderedDict([
+    ("circuit_open", ["circuit open%"]),
+    ("rate_limited", ["rate limit%"]),
+    ("timeout", ["%timeout%", "%timed out%"]),
+    ("connection", ["%connect%", "%name or service%", "%refused%", "%reset by peer%"]),
+    ("other", []),  # anything else
+])
+
+
+def _matches(name: str):
+    error = func.lower(func.coalesce(DeadLetterQueue.error, ""))
+    return or_(*[error.like(p) for p in ERROR_CLASSES[name]])
+
+
+def error_class_filter(name: str):
+    """SQL condition selecting the letters of one ``ERROR_CLASSES`` entry."""
+    if name not in ERROR_CLASSES:
+        raise ValueError(f"unknown error class {name!r}")
+    earlier = [c for c in ERROR_CLASSES if c != "other"]
+    earlier = earlier[:earlier.index(name)] if name != "other" else earlier
+    cond = [not_(_matches(c)) for c in earlier]
+    if name != "other":
+        cond.append(_matches(name))
+    return and_(*cond)
+
+
+class ReplayJob:
+    """One bulk replay; ``progress()`` is safe to call from any thread."""
+
+    def __init__(self, task_ids: Optional[List[int]] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, error_class: Optional[str] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE, chunk: int = CHUNK,
+                 executor=None, session_factory=SessionLocal, writer_factory=WriterSessionLocal):
+        if error_class is not None:
+            error_class_filter(error_class)  # validate early
+        self.id = uuid.uuid4().hex
+        self.task_ids = list(task_ids) if task_ids else None
+        self.since, self.until, self.error_class = since, until, error_class
+        self.concurrency = max(1, min(concurrency, MAX_CONCURRENCY))
+        self.rate = max(0.0, min(rate, MAX_RATE))
+        self.chunk = chunk
+        self.executor = executor
+        self.session_factory = session_factory
+        self.writer_factory = writer_factory
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.total = self.processed = self.succeeded = self.failed = self.skipped = self.deleted = 0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._cancel = threading.Event()
+        self._next_start = 0.0
+
+    # ---------- selection ----------
+    def _where(self, max_id: int):
+        d = DeadLetterQueue
+        cond = [d.id <= max_id]
+        if self.task_ids:
+            cond.append(d.task_id.in_(self.task_ids))
+        if self.since:
+            cond.append(d.created_at >= self.since)
+        if self.until:
+            cond.append(d.created_at < self.until)
+        if self.error_class:
+            cond.append(error_class_filter(self.error_class))
+        return cond
+
+    # ---------- running ----------
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        self.state, self.started_at = RUNNING, datetime.utcnow()
+        logger.info("🔁 DLQ replay %s started (concurrency %s, %s/s)", self.id, self.concurrency, self.rate or "∞")
+        db = self.session_factory()
+        try:
+            max_id = db.scalar(select(func.max(DeadLetterQueue.id))) or 0
+            where = self._where(max_id)
+            self.total = db.scalar(select(func.count()).select_from(DeadLetterQueue).where(*where))
+            last_id = 0
+            while not self._cancel.is_set():
+                rows = db.execute(
+                    select(DeadLetterQueue.id, DeadLetterQueue.task_id)
+                    .where(DeadLetterQueue.id > last_id, *where)
+                    .order_by(DeadLetterQueue.id).limit(self.chunk)
+                ).all()
+                db.rollback()  # do not hold a read snapshot while requests are out
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                self._replay_chunk(db, rows)
+            self.state = CANCELLED if self._cancel.is_set() else DONE
+        except Exception as e:
+            self.state, self.error = FAILED, str(e)
+            logger.exception("DLQ replay %s failed", self.id)
+        finally:
+            db.close()
+            self.finished_at = datetime.utcnow()
+        logger.info("🔁 DLQ replay %s %s: %s", self.id, self.state, self.progress())
+
+    def _pace(self):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if self._next_start > now:
+            time.sleep(self._next_start - now)
+        self._next_start = max(now, self._next_start) + 1 / self.rate
+
+    def _replay_chunk(self, db, rows):
+        from executor import Outcome, get_executor  # not imported with the API routes
+        tasks = {t.id: t for t in db.query(Task).filter(Task.id.in_({r.task_id for r in rows}))}
+        db.expunge_all()
+        db.rollback()
+        executor = self.executor or get_executor()
+        slots = threading.BoundedSemaphore(self.concurrency)
+        pending, orphans = [], []
+        for row in rows:
+            if self._cancel.is_set():
+                break
+            task = tasks.get(row.task_id)
+            if task is None:
+                orphans.append(row.id)  # task deleted since: nothing to replay, drop the letter
+                continue
+            self._pace()
+            slots.acquire()
+            future: Future = executor.submit(task)
+            future.add_done_callback(lambda _: slots.release())
+            pending.append((row, future))
+        runs, done_ids = [], []
+        for row, future in pending:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = Outcome(False, 0, 0, str(e))
+            runs.append(run_values(row.task_id, outcome))
+            if outcome.ok:
+                done_ids.append(row.id)
+            metrics.DLQ_REPLAYED.labels("success" if outcome.ok else "failure").inc()
+        self._write(runs, done_ids + orphans)
+        self.processed += len(pending) + len(orphans)
+        self.succeeded += len(done_ids)
+        self.failed += len(pending) - len(done_ids)
+        self.skipped += len(orphans)
+        self.deleted += len(done_ids) + len(orphans)
+
+    def _write(self, runs: List[dict], remove_ids: List[int]):
+        """Runs of the chunk and removal of the settled letters, one transaction."""
+        if not runs and not remove_ids:
+            return
+        db = self.writer_factory()
+        try:
+            record_results(db, runs)
+            if remove_ids:
+                db.execute(delete(DeadLetterQueue).where(DeadLetterQueue.id.in_(remove_ids)),
+                           execution_options={"synchronize_session": False})
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        notify_committed(runs)
+
+    def progress(self) -> dict:
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds() if self.started_at else 0
+        return dict(
+            id=self.id, state=self.state, error=self.error,
+            filters=dict(task_ids=self.task_ids, since=self.since, until=self.until, error_class=self.error_class),
+            concurrency=self.concurrency, rate_per_second=self.rate,
+            total=self.total, processed=self.processed, remaining=max(0, self.total - self.processed),
+            succeeded=self.succeeded, failed=self.failed, skipped=self.skipped, deleted=self.deleted,
+            replays_per_second=round(self.processed / elapsed, 1) if elapsed else 0.0,
+            created_at=self.created_at, started_at=self.started_at, finished_at=self.finished_at,
+        )
+
+
+class ReplayManager:
+    """Runs jobs on background threads and remembers recent ones."""
+
+    def __init__(self, max_jobs: int = MAX_JOBS, keep: int = KEEP_JOBS):
+        self.max_jobs = max_jobs
+        self.keep = keep
+        self._jobs: "OrderedDict[str, ReplayJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, job: ReplayJob) -> ReplayJob:
+        """Start ``job``; ``OverflowError`` when ``max_jobs`` are already running."""
+        with self._lock:
+            if sum(j.state in (QUEUED, RUNNING) for j in self._jobs.values()) >= self.max_jobs:
+                raise OverflowError("too many replays running")
+            self._jobs[job.id] = job
+            finished = [k for k, j in self._jobs.items() if j.state not in (QUEUED, RUNNING)]
+            for key in finished[:max(0, len(self._jobs) - self.keep)]:
+                del self._jobs[key]
+        threading.Thread(target=job.run, name=f"dlq-replay-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[ReplayJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[ReplayJob]:
+        return list(reversed(self._jobs.values()))
+
+
+# process-wide manager used by the /dlq routes
+replays = ReplayManager()
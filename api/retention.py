@@ -0,0 +1,257 @@
+# retention.py
+"""Expiry of run history and fine-grained statistics.
+
+* ``runs`` older than ``RUN_RETENTION_DAYS`` (or the task's own
+  ``retention_days``) are deleted in small batches, one commit per batch, so
+  a pass never holds long locks. Their statistics survive: every run is folded
+  into ``run_rollups``/``latency_sketches`` when it is written (sink
+  listeners), so expired runs are already compacted.
+* minute rollups/sketches are kept ``ROLLUP_MINUTE_RETENTION_DAYS``, hour ones
+  ``ROLLUP_HOUR_RETENTION_DAYS``; day buckets are kept forever. Old windows are
+  then answered from coarser buckets (edges finer than an hour/day are lost).
+* ``DLQ_RETENTION_DAYS`` (default 0 = keep) expires dead letters.
+* finished outbox rows (``slot_executions``, see outbox.py) are kept
+  ``OUTBOX_RETENTION_DAYS``.
+* captured response bodies (see bodies.py) go once no run refers to them.
+
+On Postgres ``RUNS_PARTITIONED=1`` creates ``runs`` range-partitioned by day on
+a fresh database; expiry then drops whole partitions once every task's TTL
+has passed them, and the batched deletes only handle per-task TTLs.
+
+Runs in the worker (``RETENTION_INTERVAL_SECONDS``) or once via
+``python -m retention``. A TTL of 0 disables that rule.
+"""
+import argparse
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select, text
+
+from models import DeadLetterQueue, LatencySketch, ResponseBody, Run, RunRollup, SlotExecution, Task
+from outbox import DONE
+
+logger = logging.getLogger(__name__)
+
+RUN_RETENTION_DAYS = float(os.getenv("RUN_RETENTION_DAYS", "30"))
+DLQ_RETENTION_DAYS = float(os.getenv("DLQ_RETENTION_DAYS", "0"))
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+ROLLUP_MINUTE_RETENTION_DAYS = float(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "7"))
+ROLLUP_HOUR_RETENTION_DAYS = float(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "90"))
+BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+PARTITIONED = os.getenv("RUNS_PARTITIONED", "0") == "1"
+PARTITIONS_AHEAD_DAYS = 7
+BODY_GRACE = timedelta(hours=1)  # a body stored this recently may belong to a run still being written
+
+_PARTITION_RE = re.compile(r"^runs_p(\d{8})$")
+
+
+# ---------- batched deletes ----------
+def delete_in_batches(db, model, *where, batch_size: int = BATCH_SIZE, key=None) -> int:
+    """DELETE matching rows ``batch_size`` at a time, committing each batch."""
+    key = model.id if key is None else key
+    total = 0
+    while True:
+        ids = select(key).where(*where).limit(batch_size)
+        # materialize the ids: LIMIT inside a DELETE subquery is not portable
+        batch = list(db.scalars(ids))
+        if not batch:
+            return total
+        db.execute(delete(model).where(key.in_(batch)), execution_options={"synchronize_session": False})
+        db.commit()
+        total += len(batch)
+        if len(batch) < batch_size:
+            return total
+
+
+def _cutoff(now: datetime, days: float) -> Optional[datetime]:
+    return now - timedelta(days=days) if days and days > 0 else None
+
+
+def expire_runs(db, now: datetime, global_days: float = RUN_RETENTION_DAYS, batch_size: int = BATCH_SIZE) -> int:
+    deleted = 0
+    overrides = db.execute(select(Task.id, Task.retention_days).where(Task.retention_days.isnot(None))).all()
+    for task_id, days in overrides:
+        cutoff = _cutoff(now, days)
+        if cutoff is not None:
+            deleted += delete_in_batches(db, Run, Run.task_id == task_id, Run.created_at < cutoff,
+                                         batch_size=batch_size)
+    cutoff = _cutoff(now, global_days)
+    if cutoff is not None:
+        has_override = select(Task.id).where(Task.retention_days.isnot(None))
+        deleted += delete_in_batches(db, Run, Run.created_at < cutoff, Run.task_id.not_in(has_override),
+                                     batch_size=batch_size)
+    return deleted
+
+
+def expire_dlq(db, now: datetime, days: float = DLQ_RETENTION_DAYS, batch_size: int = BATCH_SIZE) -> int:
+    cutoff = _cutoff(now, days)
+    if cutoff is None:
+        return 0
+    return delete_in_batches(db, DeadLetterQueue, DeadLetterQueue.created_at < cutoff, batch_size=batch_size)
+
+
+def expire_outbox(db, now: datetime, days: float = OUTBOX_RETENTION_DAYS, batch_size: int = BATCH_SIZE) -> int:
+    cutoff = _cutoff(now, days)
+    if cutoff is None:
+        return 0
+    return delete_in_batches(db, SlotExecution, SlotExecution.state == DONE, SlotExecution.finished_at < cutoff,
+                             batch_size=batch_size)
+
+
+def expire_bodies(db, now: datetime, grace: timedelta = BODY_GRACE, batch_size: int = BATCH_SIZE) -> int:
+    """Captured bodies no run refers to any more (their runs expired or were deleted)."""
+    referenced = select(Run.id).where(Run.body_hash == ResponseBody.hash).exists()
+    return delete_in_batches(db, ResponseBody, ~referenced, ResponseBody.created_at < now - grace,
+                             batch_size=batch_size, key=ResponseBody.hash)
+
+
+def expire_stats(db, now: datetime, minute_days: float = ROLLUP_MINUTE_RETENTION_DAYS,
+                 hour_days: float = ROLLUP_HOUR_RETENTION_DAYS) -> int:
+    """Drop minute/hour buckets past their TTL (composite keys, so one DELETE per granularity)."""
+    deleted = 0
+    for gran, days in (("minute", minute_days), ("hour", hour_days)):
+        cutoff = _cutoff(now, days)
+        if cutoff is None:
+            continue
+        for model in (RunRollup, LatencySketch):
+            res = db.execute(delete(model).where(model.granularity == gran, model.bucket_start < cutoff))
+            deleted += res.rowcount or 0
+        db.commit()
+    return deleted
+
+
+# ---------- Postgres partitions ----------
+def is_partitioned(db) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'runs'"
+    )).first())
+
+
+def _partition_ddl(day) -> str:
+    return (f"CREATE TABLE IF NOT EXISTS runs_p{day:%Y%m%d} PARTITION OF runs "
+            f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')")
+
+
+def create_partitioned_runs(conn, now: Optional[datetime] = None, ahead_days: int = PARTITIONS_AHEAD_DAYS):
+    """Create ``runs`` partitioned by day (fresh Postgres databases, see migrations),
+    with partitions for the next ``ahead_days`` so early rows do not land in the default one."""
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    ddl = str(CreateTable(Run.__table__).compile(dialect=conn.dialect))
+    # the partition key must be part of the primary key
+    ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, created_at)").rstrip().rstrip(";")
+    conn.execute(text(ddl + " PARTITION BY RANGE (created_at)"))
+    conn.execute(text("CREATE TABLE runs_default PARTITION OF runs DEFAULT"))
+    for index in Run.__table__.indexes:
+        conn.execute(CreateIndex(index))
+    today = (now or datetime.utcnow()).date()
+    for i in range(ahead_days + 1):
+        conn.execute(text(_partition_ddl(today + timedelta(days=i))))
+    logger.info("🧱 Created runs partitioned by day")
+
+
+def ensure_partitions(db, now: datetime, ahead_days: int = PARTITIONS_AHEAD_DAYS) -> int:
+    """Create the missing day partitions, one transaction each; returns how many failed.
+
+    Creating a partition fails once ``runs_default`` holds rows of its day (the
+    housekeeper was down or disabled for longer than ``ahead_days``). Those
+    rows stay in the default partition, where the batched deletes expire them.
+    """
+    failed = 0
+    day = now.date()
+    for i in range(ahead_days + 1):
+        start = day + timedelta(days=i)
+        try:
+            db.execute(text(_partition_ddl(start)))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            failed += 1
+            logger.warning("⚠️ Could not create partition runs_p%s: %s", f"{start:%Y%m%d}", e)
+    return failed
+
+
+def drop_partitions(db, now: datetime, global_days: float = RUN_RETENTION_DAYS) -> int:
+    """Drop day partitions older than every applicable TTL (global and per-task)."""
+    if not global_days or global_days <= 0:
+        return 0
+    longest = db.scalar(select(func.max(Task.retention_days))) or 0
+    cutoff = _cutoff(now, max(global_days, longest)).date()
+    names = db.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'runs'"
+    )).all()
+    dropped = 0
+    for name in names:
+        m = _PARTITION_RE.match(name)
+        if m and datetime.strptime(m.group(1), "%Y%m%d").date() + timedelta(days=1) <= cutoff:
+            db.execute(text(f"DROP TABLE {name}"))
+            dropped += 1
+    db.commit()
+    return dropped
+
+
+# ---------- driver ----------
+def run_once(db, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+    stats = {}
+    if is_partitioned(db):
+        try:
+            stats["partitions_failed"] = ensure_partitions(db, now)
+            stats["partitions_dropped"] = drop_partitions(db, now)
+        except Exception as e:  # never let partition upkeep block the expiry below
+            db.rollback()
+            logger.exception("Partition maintenance failed: %s", e)
+    stats["runs"] = expire_runs(db, now)
+    stats["dlq"] = expire_dlq(db, now)
+    stats["outbox"] = expire_outbox(db, now)
+    stats["bodies"] = expire_bodies(db, now)
+    stats["stats"] = expire_stats(db, now)
+    if any(stats.values()):
+        logger.info("🧹 Retention pass removed %s", stats)
+    return stats
+
+
+def retention_loop(stop_event: threading.Event, interval: float = INTERVAL_SECONDS):
+    from database import SessionLocal
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            run_once(db)
+        except Exception as e:
+            db.rollback()
+            logger.exception("Retention error: %s", e)
+        finally:
+            db.close()
+        stop_event.wait(interval)
+
+
+def start_background(stop_event: threading.Event, interval: float = INTERVAL_SECONDS):
+    if interval <= 0:
+        return None
+    t = threading.Thread(target=retention_loop, args=(stop_event, interval), name="retention", daemon=True)
+    t.start()
+    return t
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m retention", description="Run one retention pass.")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        print(run_once(db))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
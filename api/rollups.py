@@ -0,0 +1,202 @@
+# rollups.py
+"""Incrementally maintained run statistics.
+
+Every batch written through ``sink.record_results`` is folded into
+``run_rollups`` rows per task (and task 0 = all tasks) for minute, hour and
+day buckets. Reads cover a time range with the coarsest buckets that fit, so
+a summary touches O(days + 24 + 60) rows instead of the whole ``runs`` table.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import LATENCY_BUCKETS_MS, Run, RunRollup
+
+ALL_TASKS = 0
+GRANULARITIES = ("minute", "hour", "day")
+HIST_COLUMNS = tuple(f"le_{b}" for b in LATENCY_BUCKETS_MS) + ("le_inf",)
+SUM_COLUMNS = ("total", "successes", "failures", "latency_count", "latency_sum") + HIST_COLUMNS
+
+_table = RunRollup.__table__
+_KEY = ("task_id", "granularity", "bucket_start")
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    ts = _naive_utc(ts).replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        ts = ts.replace(minute=0)
+    if granularity == "day":
+        ts = ts.replace(hour=0)
+    return ts
+
+
+def _step(granularity: str) -> timedelta:
+    return {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}[granularity]
+
+
+def _hist_column(latency: int) -> str:
+    for bound, col in zip(LATENCY_BUCKETS_MS, HIST_COLUMNS):
+        if latency <= bound:
+            return col
+    return "le_inf"
+
+
+# ---------- write path ----------
+def _aggregate(runs: Iterable[dict]) -> List[dict]:
+    acc: Dict[Tuple, dict] = {}
+    for run in runs:
+        created = run.get("created_at") or datetime.utcnow()
+        latency = run.get("latency_ms") or 0
+        ok = run.get("status") == "success"
+        for task_id in (run["task_id"], ALL_TASKS):
+            for gran in GRANULARITIES:
+                key = (task_id, gran, truncate(created, gran))
+                row = acc.get(key)
+                if row is None:
+                    row = acc[key] = dict(zip(_KEY, key), latency_min=None, latency_max=None,
+                                          **{c: 0 for c in SUM_COLUMNS})
+                row["total"] += 1
+                row["successes" if ok else "failures"] += 1
+                if latency:
+                    row["latency_count"] += 1
+                    row["latency_sum"] += latency
+                    row[_hist_column(latency)] += 1
+                    row["latency_min"] = latency if row["latency_min"] is None else min(row["latency_min"], latency)
+                    row["latency_max"] = latency if row["latency_max"] is None else max(row["latency_max"], latency)
+    return list(acc.values())
+
+
+def _upsert(db, rows: List[dict]):
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(_table)
+        ex, cur = stmt.excluded, _table.c
+        set_ = {c: cur[c] + ex[c] for c in SUM_COLUMNS}
+        set_["latency_min"] = case(
+            (cur.latency_min.is_(None), ex.latency_min),
+            (ex.latency_min < cur.latency_min, ex.latency_min),
+            else_=cur.latency_min,
+        )
+        set_["latency_max"] = case(
+            (cur.latency_max.is_(None), ex.latency_max),
+            (ex.latency_max > cur.latency_max, ex.latency_max),
+            else_=cur.latency_max,
+        )
+        db.execute(stmt.on_conflict_do_update(index_elements=list(_KEY), set_=set_), rows)
+        return
+    # portable fallback: read-modify-write per bucket
+    for row in rows:
+        existing = db.get(RunRollup, tuple(row[k] for k in _KEY))
+        if existing is None:
+            db.add(RunRollup(**row))
+            continue
+        for c in SUM_COLUMNS:
+            setattr(existing, c, (getattr(existing, c) or 0) + row[c])
+        if row["latency_min"] is not None:
+            existing.latency_min = min(filter(None, (existing.latency_min, row["latency_min"])))
+            existing.latency_max = max(filter(None, (existing.latency_max, row["latency_max"])))
+    db.flush()
+
+
+def record(db, runs: List[dict], dlq: List[dict]):
+    """``sink`` listener: fold a batch of new runs into the rollups."""
+    if runs:
+        _upsert(db, _aggregate(runs))
+
+
+def forget_task(db, task_id: int):
+    """Drop a deleted task's rollups and subtract them from the all-tasks series.
+
+    Min/max of the all-tasks series cannot be un-merged and are left as they are.
+    """
+    own = RunRollup.__table__.alias("own")
+    match = and_(
+        own.c.task_id == task_id,
+        own.c.granularity == _table.c.granularity,
+        own.c.bucket_start == _table.c.bucket_start,
+    )
+    db.execute(
+        update(_table)
+        .where(_table.c.task_id == ALL_TASKS, select(own.c.task_id).where(match).exists())
+        .values({c: _table.c[c] - select(own.c[c]).where(match).scalar_subquery() for c in SUM_COLUMNS})
+    )
+    db.execute(delete(_table).where(_table.c.task_id == task_id))
+
+
+def rebuild(db, batch_size: int = 5000):
+    """Recompute all rollups from ``runs`` (backfill for existing databases).
+
+    Destructive once retention has expired runs: their buckets would be lost.
+    """
+    db.execute(delete(_table))
+    cols = (Run.task_id, Run.status, Run.latency_ms, Run.created_at)
+    batch = []
+    for row in db.execute(select(*cols).execution_options(yield_per=batch_size)):
+        batch.append(dict(row._mapping))
+        if len(batch) >= batch_size:
+            _upsert(db, _aggregate(batch))
+            batch = []
+    if batch:
+        _upsert(db, _aggregate(batch))
+
+
+# ---------- read path ----------
+def _ceil(ts: datetime, granularity: str) -> datetime:
+    t = truncate(ts, granularity)
+    return t if t == ts else t + _step(granularity)
+
+
+def plan(start: datetime, end: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """Cover [start, end) with the coarsest aligned buckets: ``(granularity, lo, hi)``."""
+    if start >= end:
+        return []
+    for gran in ("day", "hour"):
+        lo, hi = _ceil(start, gran), truncate(end, gran)
+        if lo < hi:
+            return plan(start, lo) + [(gran, lo, hi)] + plan(hi, end)
+    return [("minute", start, end)]
+
+
+def bounds(since: Optional[datetime], until: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """Minute-aligned [start, end) for an optional window (open ends = all time / now)."""
+    start = truncate(since, "minute") if since else datetime(1970, 1, 1)
+    end = _ceil(_naive_utc(until), "minute") if until else truncate(datetime.utcnow(), "minute") + _step("minute")
+    return start, end
+
+
+def summarize(db, task_id: Optional[int] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> dict:
+    """Aggregate rollups over [since, until) for one task or all tasks."""
+    series = ALL_TASKS if task_id is None else task_id
+    start, end = bounds(since, until)
+
+    totals = {c: 0 for c in SUM_COLUMNS}
+    lat_min = lat_max = None
+    c = _table.c
+    aggregates = [func.coalesce(func.sum(c[col]), 0) for col in SUM_COLUMNS] + [func.min(c.latency_min), func.max(c.latency_max)]
+    for gran, lo, hi in plan(start, end):
+        row = db.execute(
+            select(*aggregates).where(
+                c.task_id == series, c.granularity == gran, c.bucket_start >= lo, c.bucket_start < hi
+            )
+        ).one()
+        for col, value in zip(SUM_COLUMNS, row):
+            totals[col] += value or 0
+        mn, mx = row[-2], row[-1]
+        if mn is not None:
+            lat_min = mn if lat_min is None else min(lat_min, mn)
+        if mx is not None:
+            lat_max = mx if lat_max is None else max(lat_max, mx)
+
+    totals["latency_min"] = lat_min
+    totals["latency_max"] = lat_max
+    return totals
@@ -1,26 +1,62 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database import get_db
-from models import Task, Run
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+import crud_async
+from models import Task, LATENCY_BUCKETS_MS
+import rollups
+import sketches
 
 router = APIRouter()
 
 @router.get("/summary")
-def get_summary(db: Session = Depends(get_db)):
-    total_tasks = db.query(Task).count()
-    total_runs = db.query(Run).count()
-    successes = db.query(Run).filter(Run.status == "success").count()
-    failures = db.query(Run).filter(Run.status == "failure").count()
+async def get_summary(
+    task_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Served from the run_rollups buckets, never from a scan of runs
+    if task_id is not None:
+        if not await db.get(Task, task_id):
+            raise HTTPException(status_code=404, detail="Task not found")
+        total_tasks = 1
+    else:
+        total_tasks = await crud_async.count_tasks(db)
+    stats = await db.run_sync(rollups.summarize, task_id=task_id, since=since, until=until)
 
-    # Compute average latency
-    latencies = [r.latency_ms for r in db.query(Run.latency_ms).all() if r.latency_ms]
-    avg_latency = sum(latencies) / len(latencies) if latencies else 0
+    total_runs = stats["total"]
+    successes = stats["successes"]
+    avg_latency = stats["latency_sum"] / stats["latency_count"] if stats["latency_count"] else 0
+    bounds = [str(b) for b in LATENCY_BUCKETS_MS] + ["inf"]
 
     return {
         "total_tasks": total_tasks,
         "total_runs": total_runs,
         "successes": successes,
-        "failures": failures,
+        "failures": stats["failures"],
         "success_rate": round((successes / total_runs) * 100, 2) if total_runs > 0 else 0,
         "average_latency_ms": round(avg_latency, 2),
+        "latency_count": stats["latency_count"],  # lets live clients fold /events/runs deltas in
+        "min_latency_ms": stats["latency_min"],
+        "max_latency_ms": stats["latency_max"],
+        "latency_histogram": {b: stats[col] for b, col in zip(bounds, rollups.HIST_COLUMNS)},
     }
+
+
+@router.get("/latency")
+async def get_latency_percentiles(
+    task_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    q: List[float] = Query(default=[0.5, 0.95, 0.99]),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Latency percentiles over a window, merged from the per-bucket sketches."""
+    if any(not 0 <= x <= 1 for x in q):
+        raise HTTPException(status_code=422, detail="quantiles must be between 0 and 1")
+    if task_id is not None and not await db.get(Task, task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    sk = await db.run_sync(sketches.window, task_id=task_id, since=since, until=until)
+    return {"task_id": task_id, **sketches.percentiles(sk, q)}
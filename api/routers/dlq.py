@@ -0,0 +1,47 @@
+from typing import List
+from fastapi import APIRouter, HTTPException
+
+import replay
+import schemas
+
+router = APIRouter()
+
+
+# POST /dlq/replays -> start a bulk replay in the background (202 + job progress)
+@router.post("/replays", status_code=202)
+def start_replay(body: schemas.DLQReplayRequest) -> dict:
+    job = replay.ReplayJob(
+        task_ids=body.task_ids, since=body.since, until=body.until, error_class=body.error_class,
+        concurrency=body.concurrency or replay.DEFAULT_CONCURRENCY,
+        rate=replay.DEFAULT_RATE if body.rate is None else body.rate,
+    )
+    try:
+        replay.replays.start(job)
+    except OverflowError:
+        raise HTTPException(status_code=429, detail=f"At most {replay.MAX_JOBS} replays run at once")
+    return job.progress()
+
+
+# GET /dlq/replays -> recent replays of this process, newest first
+@router.get("/replays")
+def list_replays() -> List[dict]:
+    return [job.progress() for job in replay.replays.list()]
+
+
+# GET /dlq/replays/{job_id} -> progress (total, processed, succeeded, failed, skipped, deleted, rate)
+@router.get("/replays/{job_id}")
+def get_replay(job_id: str) -> dict:
+    job = replay.replays.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Replay not found")
+    return job.progress()
+
+
+# POST /dlq/replays/{job_id}/cancel -> stop after the requests in flight
+@router.post("/replays/{job_id}/cancel")
+def cancel_replay(job_id: str) -> dict:
+    job = replay.replays.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Replay not found")
+    job.cancel()
+    return job.progress()
@@ -0,0 +1,36 @@
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+import events
+
+router = APIRouter()
+
+KEEPALIVE_SECONDS = 15
+
+
+def _frame(ev: dict) -> str:
+    return f"event: {ev['type']}\ndata: {json.dumps(ev)}\n\n"
+
+
+# GET /events/runs?task_id= -> Server-Sent Events: run, dlq, summary (delta), dropped
+@router.get("/runs")
+async def stream_runs(request: Request, task_id: Optional[int] = None):
+    try:
+        sub = events.bus.subscribe(task_id)
+    except OverflowError:
+        raise HTTPException(status_code=503, detail="Too many live subscribers")
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                batch = await sub.next_batch(KEEPALIVE_SECONDS)
+                # one write per batch; a comment line keeps proxies from closing idle streams
+                yield "".join(_frame(ev) for ev in batch) if batch else ": keep-alive\n\n"
+        finally:
+            events.bus.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
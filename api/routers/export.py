@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from database import AsyncSessionLocal
+import export
+
+router = APIRouter()
+
+_EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "parquet": "parquet", "arrow": "arrows"}
+
+
+# GET /export/runs?task_id=1&task_id=2&since=...&until=...&format=csv
+@router.get("/runs")
+async def export_runs(
+    task_id: Optional[List[int]] = Query(default=None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = "ndjson",
+):
+    """Stream runs (all tasks unless ``task_id`` is given), oldest first, in constant memory."""
+    try:
+        enc = export.encoder(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    query = export.runs_query(task_id, since, until)
+
+    async def body():
+        # own session: the response body outlives the request's dependencies
+        async with AsyncSessionLocal() as db:
+            async for chunk in export.aiter_export(db, enc, query):
+                if chunk:
+                    yield chunk
+
+    headers = {"Content-Disposition": f'attachment; filename="runs.{_EXTENSIONS[format]}"'}
+    return StreamingResponse(body(), media_type=export.MEDIA_TYPES[format], headers=headers)
@@ -0,0 +1,20 @@
+from typing import List
+from fastapi import APIRouter, HTTPException
+
+router = APIRouter()
+
+
+# GET /hosts/breakers -> rate limit / circuit state per destination host (this process)
+@router.get("/breakers")
+def list_breakers() -> List[dict]:
+    from executor import get_executor
+    return get_executor().guards.snapshot()
+
+
+# POST /hosts/breakers/{host}/reset -> close a breaker by hand (host was fixed)
+@router.post("/breakers/{host}/reset")
+def reset_breaker(host: str):
+    from executor import get_executor
+    if not get_executor().guards.reset(host.lower()):
+        raise HTTPException(status_code=404, detail="Host not seen")
+    return {"ok": True}
@@ -1,37 +1,90 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-
-from database import get_db
-import crud
+import asyncio
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+import bodies
+import crud_async
 import schemas
-from models import Run
-from worker import execute_task  # reuse the worker's HTTP executor
+from pagination import decode_cursor, next_cursor
+from sink import notify_committed, record_results, run_values
 
 router = APIRouter()
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_BATCH = int(os.getenv("TASK_BATCH_MAX", "10000"))
+
+
+def _cursor(cursor: Optional[str]):
+    if not cursor:
+        return None  # absent or empty (?cursor=): first page
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page(response: Response, rows, limit: int):
+    # pass the header value back as ?cursor= to get the next page
+    nxt = next_cursor(rows, limit)
+    if nxt:
+        response.headers[NEXT_CURSOR_HEADER] = nxt
+    return rows
+
 # GET /tasks
 @router.get("/", response_model=List[schemas.TaskOut])
-def list_tasks(limit: int = 50, offset: int = 0, db: Session = Depends(get_db)):
-    return crud.get_tasks(db, limit=limit, offset=offset)
+async def list_tasks(response: Response, limit: int = 50, offset: int = 0, cursor: Optional[str] = None,
+                     db: AsyncSession = Depends(get_async_db)):
+    rows = await crud_async.get_tasks(db, limit=limit, offset=offset, cursor=_cursor(cursor))
+    return _page(response, rows, limit)
 
 # POST /tasks
 @router.post("/", response_model=schemas.TaskOut)
-def create_task(task_in: schemas.TaskCreate, db: Session = Depends(get_db)):
-    return crud.create_task(db, user_id="dev_user", task_in=task_in)
+async def create_task(task_in: schemas.TaskCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.create_task(db, user_id="dev_user", task_in=task_in)
+
+# ---------- batches (declared before /{task_id} so "batch" is not read as an id) ----------
+def _check_batch(items: list):
+    if len(items) > MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH} items per batch")
+
+# POST /tasks/batch
+@router.post("/batch", response_model=List[schemas.BatchItemOut])
+async def create_tasks(tasks_in: List[schemas.TaskCreate], db: AsyncSession = Depends(get_async_db)):
+    _check_batch(tasks_in)
+    return await crud_async.create_tasks(db, user_id="dev_user", tasks_in=tasks_in)
+
+# PATCH /tasks/batch
+@router.patch("/batch", response_model=List[schemas.BatchItemOut])
+async def patch_tasks(updates: List[schemas.TaskBatchUpdate], db: AsyncSession = Depends(get_async_db)):
+    _check_batch(updates)
+    return await crud_async.update_tasks(db, updates)
+
+# POST /tasks/batch/enable, /tasks/batch/disable
+@router.post("/batch/enable", response_model=List[schemas.BatchItemOut])
+async def enable_tasks(body: schemas.TaskIds, db: AsyncSession = Depends(get_async_db)):
+    _check_batch(body.ids)
+    return await crud_async.set_enabled(db, body.ids, True)
+
+@router.post("/batch/disable", response_model=List[schemas.BatchItemOut])
+async def disable_tasks(body: schemas.TaskIds, db: AsyncSession = Depends(get_async_db)):
+    _check_batch(body.ids)
+    return await crud_async.set_enabled(db, body.ids, False)
 
 # GET /tasks/{task_id}
 @router.get("/{task_id}", response_model=schemas.TaskOut)
-def get_task(task_id: int, db: Session = Depends(get_db)):
-    task = crud.get_task(db, task_id)
+async def get_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
+    task = await crud_async.get_task(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
 # PATCH /tasks/{task_id}
 @router.patch("/{task_id}", response_model=schemas.TaskOut)
-def patch_task(task_id: int, task_upd: schemas.TaskUpdate, db: Session = Depends(get_db)):
-    task = crud.update_task(
+async def patch_task(task_id: int, task_upd: schemas.TaskUpdate, db: AsyncSession = Depends(get_async_db)):
+    task = await crud_async.update_task(
         db,
         task_id,
         url=task_upd.url,
@@ -40,6 +93,13 @@ def patch_task(task_id: int, task_upd: schemas.TaskUpdate, db: Session = Depends
         body=task_upd.body,
         schedule_cron=task_upd.schedule_cron,
         enabled=task_upd.enabled,
+        max_retries=task_upd.max_retries,
+        retry_backoff_seconds=task_upd.retry_backoff_seconds,
+        retry_backoff_max_seconds=task_upd.retry_backoff_max_seconds,
+        retry_jitter=task_upd.retry_jitter,
+        retention_days=task_upd.retention_days,
+        misfire_policy=task_upd.misfire_policy,
+        capture_body=task_upd.capture_body,
     )
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -47,71 +107,60 @@ def patch_task(task_id: int, task_upd: schemas.TaskUpdate, db: Session = Depends
 
 # DELETE /tasks/{task_id}
 @router.delete("/{task_id}")
-def remove_task(task_id: int, db: Session = Depends(get_db)):
-    ok = crud.delete_task(db, task_id)
+async def remove_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await crud_async.delete_task(db, task_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"ok": True}
 
 # GET /tasks/{task_id}/runs
 @router.get("/{task_id}/runs", response_model=List[schemas.RunOut])
-def list_runs(task_id: int, limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
-    if not crud.get_task(db, task_id):
+async def list_runs(task_id: int, response: Response, limit: int = 100, offset: int = 0,
+                    cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    if not await crud_async.get_task(db, task_id):
         raise HTTPException(status_code=404, detail="Task not found")
-    return crud.get_runs_for_task(db, task_id=task_id, limit=limit, offset=offset)
+    rows = await crud_async.get_runs_for_task(db, task_id=task_id, limit=limit, offset=offset, cursor=_cursor(cursor))
+    return _page(response, rows, limit)
+
+# GET /tasks/{task_id}/runs/{run_id}/body -> captured response body (capture_body tasks only)
+@router.get("/{task_id}/runs/{run_id}/body")
+async def get_run_body(task_id: int, run_id: int, db: AsyncSession = Depends(get_async_db)):
+    row = await crud_async.get_run_body(db, task_id, run_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="No body captured for this run")
+    try:
+        content = await asyncio.to_thread(bodies.unpack, row)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(content, media_type=row.content_type or "application/octet-stream",
+                    headers={"X-Body-Truncated": "1" if row.truncated else "0"})
 
 # GET /tasks/{task_id}/dlq
 @router.get("/{task_id}/dlq", response_model=List[schemas.DLQOut])
-def list_dlq(task_id: int, limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
-    if not crud.get_task(db, task_id):
+async def list_dlq(task_id: int, response: Response, limit: int = 100, offset: int = 0,
+                   cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    if not await crud_async.get_task(db, task_id):
         raise HTTPException(status_code=404, detail="Task not found")
-    return crud.get_dlq_for_task(db, task_id=task_id, limit=limit, offset=offset)
+    rows = await crud_async.get_dlq_for_task(db, task_id=task_id, limit=limit, offset=offset, cursor=_cursor(cursor))
+    return _page(response, rows, limit)
 
 # POST /tasks/{task_id}/dlq/{dlq_id}/replay  -> run immediately and remove from DLQ
 @router.post("/{task_id}/dlq/{dlq_id}/replay")
-def replay_dlq(task_id: int, dlq_id: int, db: Session = Depends(get_db)):
-    task = crud.get_task(db, task_id)
+async def replay_dlq(task_id: int, dlq_id: int, db: AsyncSession = Depends(get_async_db)):
+    task = await crud_async.get_task(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    entry = await crud_async.get_dlq_entry(db, task_id, dlq_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="DLQ entry not found")
 
-    # Execute once now (same logic as worker HTTP call)
-    ok, latency, code, err = execute_task(task)
-    r = Run(
-        task_id=task.id,
-        status="success" if ok else "failure",
-        latency_ms=latency,
-        response_code=code,
-        error=err,
-    )
-    db.add(r)
+    # Execute once now on the worker's executor loop; awaiting its future keeps this loop free
+    from executor import get_executor  # httpx is only imported once something is sent
+    outcome = await asyncio.wrap_future(get_executor().submit(task))
+    ok, latency, code, err = outcome.as_tuple()
+    runs = [run_values(task.id, outcome)]
+    await db.run_sync(record_results, runs=runs)
     # remove DLQ row regardless of outcome (or keep if you prefer)
-    crud.delete_dlq(db, dlq_id)
-    db.commit()
+    await crud_async.delete_dlq(db, entry.id)  # commits the run with the removal
+    notify_committed(runs)
     return {"ok": ok, "response_code": code, "error": err, "latency_ms": latency}
-
-from fastapi import Body
-
-@router.patch("/{task_id}", response_model=schemas.TaskOut)
-def update_task(task_id: int, task_in: schemas.TaskCreate, db: Session = Depends(get_db)):
-    task = crud.get_task(db, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    task = crud.update_task(db, task_id=task_id, task_in=task_in)
-    return task
-
-
-@router.get("/{task_id}/dlq")
-def list_dlq(task_id: int, limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
-    if not crud.get_task(db, task_id):
-        raise HTTPException(status_code=404, detail="Task not found")
-    return crud.get_dlq_for_task(db, task_id=task_id, limit=limit, offset=offset)
-
-
-@router.post("/{task_id}/dlq/{dlq_id}/replay")
-def replay_dlq(task_id: int, dlq_id: int, db: Session = Depends(get_db)):
-    if not crud.get_task(db, task_id):
-        raise HTTPException(status_code=404, detail="Task not found")
-    ok = crud.replay_from_dlq(db, task_id=task_id, dlq_id=dlq_id)
-    if not ok:
-        raise HTTPException(status_code=404, detail="DLQ entry not found")
-    return {"ok": True}
@@ -0,0 +1,300 @@
+# scheduler.py
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+
+from cache import next_fire_time  # cached croniter parse
+from models import Task
+from outbox import FIRE_ALL, MISFIRE_POLICY
+
+logger = logging.getLogger(__name__)
+
+
+class Job(NamedTuple):
+    """One attempt to run. ``slot`` is the cron slot for first attempts that still
+    have to be claimed (see leases.py); retries of a claimed slot carry None."""
+    task_id: int
+    attempt: int = 1
+    slot: Optional[datetime] = None
+    next_slot: Optional[datetime] = None  # persisted as next_run_at when the slot is claimed
+    key: Optional[str] = None  # outbox key of a claimed slot (see outbox.py)
+
+
+class Scheduler:
+    """In-memory min-heap of next fire times, one live entry per task.
+
+    Heap entries are invalidated lazily: ``_due_at`` holds the authoritative
+    fire time per task, and popped entries that no longer match it are dropped.
+    This keeps create/update/delete O(log n) and ``pop_due`` proportional to the
+    number of due tasks instead of the total number of tasks.
+
+    Failed attempts are re-enqueued on a separate retry heap with their attempt
+    number, so backoff never blocks the worker thread.
+
+    The crud hooks only reach a scheduler in the same process (``RUN_WORKER=1``);
+    a standalone worker picks up edits from other processes with ``refresh``.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._retries = []
+        self._due_at: Dict[int, datetime] = {}
+        self._cron: Dict[int, str] = {}
+        self._policy: Dict[int, str] = {}  # misfire policy, only fire_all changes what pops
+        self._version: Dict[int, datetime] = {}  # tasks.updated_at last applied, see refresh
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._loaded = False
+        self._resync_requested = False
+        self._woken = False
+
+    # ---------- bulk load ----------
+    def load(self, db, horizon_seconds: Optional[float] = None):
+        """(Re)build the heap from ``tasks.next_run_at``.
+
+        One range scan on the ``(enabled, next_run_at)`` index. With a horizon
+        only slots due within it are loaded; the caller must resync more often
+        than that so later tasks are picked up before they come due.
+        """
+        assign_next_runs(db)
+        query = select(Task.id, Task.schedule_cron, Task.next_run_at, Task.misfire_policy, Task.updated_at).where(
+            Task.enabled == True, Task.next_run_at.isnot(None)
+        )
+        if horizon_seconds is not None:
+            query = query.where(Task.next_run_at <= datetime.utcnow() + timedelta(seconds=horizon_seconds))
+        rows = db.execute(query).all()
+        with self._cond:
+            self._heap = []
+            self._due_at.clear()
+            self._cron.clear()
+            self._policy.clear()
+            self._version.clear()
+            for task_id, cron, fire_at, policy, version in rows:
+                if not cron:
+                    continue
+                self._version[task_id] = version
+                self._due_at[task_id] = fire_at
+                self._cron[task_id] = cron
+                self._policy[task_id] = policy or MISFIRE_POLICY
+                self._heap.append((fire_at, next(self._seq), task_id))
+            heapq.heapify(self._heap)
+            self._loaded = True
+            self._resync_requested = False
+            self._cond.notify_all()
+        logger.info("🗓️ Scheduler loaded %s tasks", len(self._due_at))
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def request_resync(self):
+        """Ask the worker to rebuild the heap from the DB (e.g. after bulk seeding)."""
+        with self._cond:
+            self._resync_requested = True
+            self._cond.notify_all()
+
+    @property
+    def resync_requested(self) -> bool:
+        return self._resync_requested
+
+    def refresh(self, db, since: datetime) -> int:
+        """Apply tasks edited since ``since`` by any process; returns how many changed.
+
+        One range scan on ``tasks.updated_at``. Versions already applied are
+        skipped, so callers can overlap windows to cover late commits and clock
+        skew. The row's ``next_run_at`` wins: the API recomputes it on every
+        schedule change.
+        """
+        assign_next_runs(db)  # rows written outside crud (seeds)
+        rows = db.execute(
+            select(Task.id, Task.enabled, Task.schedule_cron, Task.next_run_at, Task.misfire_policy, Task.updated_at)
+            .where(Task.updated_at >= since)
+        ).all()
+        changed = 0
+        with self._cond:
+            for task_id, enabled, cron, fire_at, policy, version in rows:
+                if self._version.get(task_id) == version:
+                    continue
+                self._version[task_id] = version
+                changed += 1
+                if not enabled or not cron or fire_at is None:
+                    self._due_at.pop(task_id, None)
+                    self._cron.pop(task_id, None)
+                    continue
+                self._policy[task_id] = policy or MISFIRE_POLICY
+                if self._due_at.get(task_id) == fire_at:
+                    self._cron[task_id] = cron
+                else:
+                    self._push(task_id, cron, fire_at)
+            if changed:
+                self._cond.notify_all()
+        if changed:
+            logger.info("🗓️ Scheduler refreshed %s edited task(s)", changed)
+        return changed
+
+    # ---------- incremental invalidation ----------
+    def upsert(self, task):
+        """Reschedule a single task after it was created or changed."""
+        self.upsert_many([task])
+
+    def upsert_many(self, tasks: Iterable):
+        """Reschedule tasks after a batch write, under one lock and one wakeup."""
+        if not self._loaded:
+            return  # no worker in this process, nothing to keep in sync
+        with self._cond:
+            for task in tasks:
+                self._upsert_locked(task)
+            self._cond.notify_all()
+
+    def _upsert_locked(self, task):
+        cron = task.schedule_cron
+        if not task.enabled or not cron:
+            self._due_at.pop(task.id, None)
+            self._cron.pop(task.id, None)
+            return
+        self._policy[task.id] = getattr(task, "misfire_policy", None) or MISFIRE_POLICY
+        if self._cron.get(task.id) == cron and task.id in self._due_at:
+            return  # schedule unchanged, keep the current slot
+        fire_at = getattr(task, "next_run_at", None) or next_fire_time(cron, datetime.utcnow())
+        if fire_at is None:
+            self._due_at.pop(task.id, None)
+            self._cron.pop(task.id, None)
+            return
+        self._push(task.id, cron, fire_at)
+
+    def remove(self, task_id: int):
+        if not self._loaded:
+            return
+        with self._cond:
+            self._due_at.pop(task_id, None)
+            self._cron.pop(task_id, None)
+            self._policy.pop(task_id, None)
+            self._version.pop(task_id, None)
+            self._cond.notify_all()
+
+    def _push(self, task_id: int, cron: str, fire_at: datetime):
+        self._due_at[task_id] = fire_at
+        self._cron[task_id] = cron
+        heapq.heappush(self._heap, (fire_at, next(self._seq), task_id))
+
+    # ---------- consumption ----------
+    def pop_due(self, now: datetime) -> List[int]:
+        """Return ids of tasks whose slot is <= now and schedule their next slot."""
+        return [task_id for task_id, _, _ in self.pop_due_slots(now)]
+
+    def pop_due_slots(self, now: datetime) -> List[Tuple[int, datetime, Optional[datetime]]]:
+        """Like ``pop_due`` but returns ``(task_id, slot, next_slot)`` triples."""
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, task_id = heapq.heappop(self._heap)
+                if self._due_at.get(task_id) != fire_at:
+                    continue  # stale entry (task changed or removed)
+                cron = self._cron[task_id]
+                nxt = next_fire_time(cron, fire_at)
+                if nxt is not None and nxt <= now and self._policy.get(task_id) != FIRE_ALL:
+                    # we fell behind (worker busy): collapse the missed slots into this one;
+                    # slots missed while no worker ran are settled by outbox.apply_misfires
+                    nxt = next_fire_time(cron, now)
+                due.append((task_id, fire_at, nxt))
+                if nxt is None:
+                    self._due_at.pop(task_id, None)
+                    self._cron.pop(task_id, None)
+                else:
+                    self._push(task_id, cron, nxt)
+        return due
+
+    def schedule_retry(self, task_id: int, attempt: int, delay_seconds: float, key: Optional[str] = None):
+        """Re-enqueue ``attempt`` of a task (of outbox slot ``key``) to run after ``delay_seconds``."""
+        self.defer(Job(task_id, attempt, key=key), delay_seconds)
+
+    def defer(self, job: Job, delay_seconds: float):
+        """Put a job on the delayed queue (retries, slots waiting for shard takeover)."""
+        fire_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+        with self._cond:
+            heapq.heappush(self._retries, (fire_at, next(self._seq), job))
+            self._cond.notify_all()
+
+    def pop_retries(self, now: datetime) -> List[Job]:
+        """Return delayed jobs whose time has come."""
+        due = []
+        with self._cond:
+            while self._retries and self._retries[0][0] <= now:
+                due.append(heapq.heappop(self._retries)[2])
+        return due
+
+    @property
+    def pending_retries(self) -> int:
+        return len(self._retries)
+
+    def seconds_until_next(self, now: datetime) -> Optional[float]:
+        with self._cond:
+            while self._heap and self._due_at.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            deadlines = [entries[0][0] for entries in (self._heap, self._retries) if entries]
+            if not deadlines:
+                return None
+            return max(0.0, (min(deadlines) - now).total_seconds())
+
+    def wake(self):
+        """Interrupt ``wait`` (e.g. because an in-flight request completed)."""
+        with self._cond:
+            self._woken = True
+            self._cond.notify_all()
+
+    def wait(self, max_sleep: float):
+        """Sleep until the earliest deadline, a schedule change, or ``max_sleep``."""
+        with self._cond:  # RLock, so seconds_until_next can re-enter
+            if self._resync_requested or self._woken:
+                self._woken = False
+                return
+            timeout = self.seconds_until_next(datetime.utcnow())
+            if timeout is None or timeout > max_sleep:
+                timeout = max_sleep
+            if timeout > 0:
+                self._cond.wait(timeout)
+            self._woken = False
+
+    def __len__(self):
+        return len(self._due_at)
+
+
+def assign_next_runs(db, batch_size: int = 1000) -> int:
+    """Give enabled tasks without a ``next_run_at`` their next slot (committed).
+
+    Covers rows written outside ``crud`` (seeders, old databases) and is the
+    backfill after the column was added. The base is the last run, else the
+    creation time, so a task that never ran fires at its first slot.
+    """
+    t = Task.__table__
+    rows = db.execute(
+        select(t.c.id, t.c.schedule_cron, t.c.last_run_at, t.c.created_at).where(
+            t.c.enabled == True, t.c.next_run_at.is_(None), t.c.schedule_cron.isnot(None)
+        )
+    ).all()
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam("tid"), t.c.next_run_at.is_(None))
+        .values(next_run_at=bindparam("nxt"), updated_at=t.c.updated_at)  # not an edit
+    )
+    params = []
+    for task_id, cron, last_run_at, created_at in rows:
+        nxt = next_fire_time(cron, last_run_at or created_at or now)
+        if nxt is not None:
+            params.append({"tid": task_id, "nxt": nxt})
+    for i in range(0, len(params), batch_size):
+        db.execute(stmt, params[i:i + batch_size])
+    db.commit()
+    return len(params)
+
+
+# process-wide scheduler shared by the worker thread and the crud hooks
+scheduler = Scheduler()
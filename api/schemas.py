@@ -1,8 +1,10 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from datetime import datetime
 from pydantic import BaseModel, Field, ConfigDict
 
 # ---------- Task ----------
+MISFIRE_PATTERN = "^(fire_once|fire_all|skip)$"  # see outbox.py
+
 class TaskCreate(BaseModel):
     url: str
     method: str = Field(pattern="^(GET|POST|PUT|DELETE|PATCH)$")
@@ -10,6 +12,13 @@ class TaskCreate(BaseModel):
     body: Optional[str] = None
     schedule_cron: Optional[str] = None
     enabled: bool = True
+    max_retries: int = Field(default=3, ge=0, le=20)
+    retry_backoff_seconds: float = Field(default=1.0, ge=0)
+    retry_backoff_max_seconds: float = Field(default=60.0, ge=0)
+    retry_jitter: float = Field(default=0.0, ge=0, le=1)
+    retention_days: Optional[int] = Field(default=None, ge=1)
+    misfire_policy: Optional[str] = Field(default=None, pattern=MISFIRE_PATTERN)
+    capture_body: bool = False
 
 class TaskUpdate(BaseModel):
     url: Optional[str] = None
@@ -18,6 +27,26 @@ class TaskUpdate(BaseModel):
     body: Optional[str] = None
     schedule_cron: Optional[str] = None
     enabled: Optional[bool] = None
+    max_retries: Optional[int] = Field(default=None, ge=0, le=20)
+    retry_backoff_seconds: Optional[float] = Field(default=None, ge=0)
+    retry_backoff_max_seconds: Optional[float] = Field(default=None, ge=0)
+    retry_jitter: Optional[float] = Field(default=None, ge=0, le=1)
+    retention_days: Optional[int] = Field(default=None, ge=1)
+    misfire_policy: Optional[str] = Field(default=None, pattern=MISFIRE_PATTERN)
+    capture_body: Optional[bool] = None
+
+class TaskBatchUpdate(TaskUpdate):
+    id: int
+
+class TaskIds(BaseModel):
+    ids: List[int]
+
+class BatchItemOut(BaseModel):
+    """Outcome of one item of a batch request (``index`` into the request array)."""
+    index: int
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
 
 class TaskOut(BaseModel):
     id: int
@@ -27,6 +56,16 @@ class TaskOut(BaseModel):
     schedule_cron: Optional[str] = None
     enabled: bool
     created_at: datetime
+    max_retries: Optional[int] = None
+    retry_backoff_seconds: Optional[float] = None
+    retry_backoff_max_seconds: Optional[float] = None
+    retry_jitter: Optional[float] = None
+    retention_days: Optional[int] = None
+    misfire_policy: Optional[str] = None
+    capture_body: Optional[bool] = None
+    last_run_at: Optional[datetime] = None
+    last_status: Optional[str] = None
+    next_run_at: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
 
 # ---------- Run ----------
@@ -35,8 +74,11 @@ class RunOut(BaseModel):
     task_id: int
     status: str
     latency_ms: int
+    connect_ms: Optional[int] = None
+    response_ms: Optional[int] = None
     response_code: Optional[int] = None
     error: Optional[str] = None
+    body_hash: Optional[str] = None  # body at GET /tasks/{task_id}/runs/{id}/body
     created_at: datetime
     failure_class: Optional[str] = None
     failure_explanation: Optional[str] = None
@@ -49,3 +91,12 @@ class DLQOut(BaseModel):
     error: str
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
+
+class DLQReplayRequest(BaseModel):
+    """Bulk replay filters (all optional, combined with AND), see replay.py."""
+    task_ids: Optional[List[int]] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    error_class: Optional[str] = Field(default=None, pattern="^(circuit_open|rate_limited|timeout|connection|other)$")
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    rate: Optional[float] = Field(default=None, ge=0, description="requests started per second, 0 = unlimited")
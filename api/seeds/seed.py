@@ -6,14 +6,16 @@ from sqlalchemy import text
 
 # allow running as: python seeds/seed.py from the api dir
 from database import engine, SessionLocal
-from models import Base, Task, Run
+from models import Task
+from sink import record_results
+import migrations
 
 BATCH = 200
 TOTAL_TASKS = 1000
 RUNS_PER_TASK_AVG = 5   # ~ 5k runs total (distributed randomly)
 
 def utcnow():
-    return datetime.now(UTC)
+    return datetime.now(UTC).replace(tzinfo=None)  # naive UTC, like the models
 
 def create_tasks(session: Session, start_index=1, end_index=TOTAL_TASKS):
     tasks = []
@@ -69,7 +71,7 @@ def create_runs(session: Session):
             latency = random.randint(180, 4800) if is_success else random.randint(400, 1500)
 
             base_time += timedelta(seconds=random.randint(10, 90))
-            to_add.append(Run(
+            to_add.append(dict(
                 task_id=task_id,
                 status="success" if is_success else "failure",
                 latency_ms=latency,
@@ -78,15 +80,15 @@ def create_runs(session: Session):
                 created_at=base_time
             ))
 
-            # batch insert
+            # batch insert (through the sink write path so rollups stay in sync)
             if len(to_add) >= BATCH * 5:
-                session.add_all(to_add)
+                record_results(session, runs=to_add)
                 session.commit()
                 total_runs += len(to_add)
                 to_add = []
 
     if to_add:
-        session.add_all(to_add)
+        record_results(session, runs=to_add)
         session.commit()
         total_runs += len(to_add)
 
@@ -94,7 +96,7 @@ def create_runs(session: Session):
 
 def main():
     print("🔧 Creating tables (if missing)…")
-    Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
     db = SessionLocal()
     try:
         # If tasks already exist, skip task creation
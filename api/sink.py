@@ -0,0 +1,239 @@
+# sink.py
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import bindparam, insert, or_, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+import bodies
+import events
+import metrics
+import rollups
+import sketches
+from database import WriterSessionLocal
+from models import Run, DeadLetterQueue, Task
+
+logger = logging.getLogger(__name__)
+
+MAX_ROWS = int(os.getenv("SINK_MAX_ROWS", "500"))
+MAX_DELAY_SECONDS = float(os.getenv("SINK_MAX_DELAY_SECONDS", "1.0"))
+
+# called as fn(db, runs, dlq) inside the write transaction, before commit
+_listeners: List[Callable] = []
+
+
+def add_listener(fn: Callable):
+    """Register a hook that sees every batch of run/DLQ rows as it is written."""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+# called as fn(runs, dlq) after the batch is committed (never inside the transaction)
+_commit_listeners: List[Callable] = []
+
+
+def add_commit_listener(fn: Callable):
+    """Register a hook that sees every batch once it is durable (e.g. the live feed)."""
+    if fn not in _commit_listeners:
+        _commit_listeners.append(fn)
+
+
+def touch_tasks(db, runs: List[dict], dlq: List[dict]):
+    """Listener: keep ``tasks.last_run_at``/``last_status`` in step with the newest run.
+
+    The guard on ``last_run_at`` makes out-of-order batches (several workers)
+    harmless; ``updated_at`` is kept so this is not seen as an edit.
+    """
+    latest = {}
+    for run in runs:
+        created = run.get("created_at")
+        if created is None:
+            continue
+        prev = latest.get(run["task_id"])
+        if prev is None or created >= prev["ts"]:
+            latest[run["task_id"]] = {"tid": run["task_id"], "ts": created, "st": run.get("status")}
+    if not latest:
+        return
+    t = Task.__table__
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam("tid"), or_(t.c.last_run_at.is_(None), t.c.last_run_at <= bindparam("ts")))
+        .values(last_run_at=bindparam("ts"), last_status=bindparam("st"), updated_at=t.c.updated_at)
+    )
+    db.execute(stmt, list(latest.values()))
+
+
+add_listener(rollups.record)
+add_listener(sketches.record)
+add_listener(touch_tasks)
+add_commit_listener(events.publish_results)
+
+
+def run_values(task_id, outcome) -> dict:
+    """Column values for a ``runs`` row (stamped now, not at flush time)."""
+    body = bodies.pack(*outcome.body) if outcome.body is not None else None
+    return dict(
+        task_id=task_id,
+        status="success" if outcome.ok else "failure",
+        latency_ms=outcome.latency,
+        response_code=outcome.code,
+        error=outcome.err,
+        connect_ms=outcome.connect_ms,
+        response_ms=outcome.response_ms,
+        body_hash=body["hash"] if body else None,
+        body=body,  # packed response_bodies row, split off by the sink
+        created_at=datetime.utcnow(),
+    )
+
+
+def dlq_values(task_id, error) -> dict:
+    return dict(task_id=task_id, error=error or "unknown", created_at=datetime.utcnow())
+
+
+def record_results(db, runs: List[dict] = (), dlq: List[dict] = ()):
+    """Bulk-insert run and DLQ rows (executemany) and run the write listeners.
+
+    This is the single write path for results; the caller owns the commit.
+    """
+    runs, dlq = list(runs), list(dlq)
+    rows, captured = bodies.split(runs)
+    bodies.store(db, captured)
+    if rows:
+        db.execute(insert(Run), rows)
+    if dlq:
+        db.execute(insert(DeadLetterQueue), dlq)
+    for fn in _listeners:
+        fn(db, runs, dlq)
+
+
+def notify_committed(runs: List[dict] = (), dlq: List[dict] = ()):
+    """Run the commit listeners; for writers that committed ``record_results`` themselves."""
+    for fn in _commit_listeners:
+        try:
+            fn(list(runs), list(dlq))
+        except Exception:
+            logger.exception("Commit listener %s failed", getattr(fn, "__name__", fn))
+
+
+class ResultSink:
+    """Buffers Run/DLQ rows and flushes them in one transaction.
+
+    A flush happens when ``max_rows`` rows are buffered or the oldest buffered
+    row is ``max_delay`` seconds old, so the worker pays one commit per batch
+    instead of one per HTTP attempt. ``close`` flushes whatever is left.
+    """
+
+    def __init__(self, session_factory=WriterSessionLocal, max_rows: int = MAX_ROWS,
+                 max_delay: float = MAX_DELAY_SECONDS):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._runs: List[dict] = []
+        self._dlq: List[dict] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add_run(self, row: dict):
+        self._add(self._runs, row)
+
+    def add_dlq(self, row: dict):
+        self._add(self._dlq, row)
+
+    def _add(self, buf: List[dict], row: dict):
+        with self._lock:
+            buf.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def __len__(self):
+        return len(self._runs) + len(self._dlq)
+
+    def seconds_until_flush(self) -> Optional[float]:
+        """None when empty, 0 when a flush is due."""
+        with self._lock:
+            if self._oldest is None:
+                return None
+            if len(self._runs) + len(self._dlq) >= self.max_rows:
+                return 0.0
+            return max(0.0, self._oldest + self.max_delay - time.monotonic())
+
+    def flush_if_due(self) -> int:
+        if self.seconds_until_flush() == 0.0:
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        """Write everything buffered so far.
+
+        If the database rejects the batch (a run for a task deleted while its
+        attempt was in flight, ...) the rows are retried one by one and the
+        rejected ones dropped. Any other failure keeps every row for the next try.
+        """
+        with self._flush_lock:
+            with self._lock:
+                runs, dlq = self._runs, self._dlq
+                self._runs, self._dlq, self._oldest = [], [], None
+            if not runs and not dlq:
+                return 0
+            try:
+                try:
+                    self._write(runs, dlq)
+                    return len(runs) + len(dlq)
+                except (IntegrityError, DataError):
+                    logger.warning("⚠️ Result batch rejected, retrying %s rows one by one", len(runs) + len(dlq))
+                    return self._write_each(runs, dlq)
+            except Exception:
+                with self._lock:
+                    self._runs[:0] = runs
+                    self._dlq[:0] = dlq
+                    self._oldest = time.monotonic()
+                logger.exception("Result flush failed, %s rows kept in buffer", len(runs) + len(dlq))
+                raise
+
+    def _write(self, runs: List[dict], dlq: List[dict]):
+        db = self.session_factory()
+        try:
+            record_results(db, runs, dlq)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        metrics.RESULTS_WRITTEN.labels("runs").inc(len(runs))
+        metrics.RESULTS_WRITTEN.labels("dlq").inc(len(dlq))
+        notify_committed(runs, dlq)
+
+    def _write_each(self, runs: List[dict], dlq: List[dict]) -> int:
+        """Write rows singly, dropping those the database rejects; written rows
+        leave ``runs``/``dlq`` so a later failure only keeps the rest."""
+        written = 0
+        for buf, kind in ((runs, "run"), (dlq, "DLQ")):
+            while buf:
+                row = buf[0]
+                try:
+                    self._write([row] if kind == "run" else [], [row] if kind == "DLQ" else [])
+                    written += 1
+                except (IntegrityError, DataError) as e:
+                    logger.error("❌ Dropped %s row for task %s: %s", kind, row.get("task_id"), e.orig)
+                buf.pop(0)
+        return written
+
+    def close(self):
+        try:
+            flushed = self.flush()
+            if flushed:
+                logger.info("💾 Flushed %s buffered results on shutdown", flushed)
+        except Exception:
+            pass  # already logged
+
+
+# process-wide sink used by the worker
+sink = ResultSink()
+atexit.register(sink.close)
@@ -0,0 +1,227 @@
+# sketches.py
+"""Mergeable latency quantile sketches (DDSketch-style).
+
+Values are counted in logarithmic bins with a fixed relative accuracy, so a
+sketch has bounded size no matter how many values it saw, and two sketches
+merge by adding bin counts. Each process writes its own row per
+(series, granularity, bucket), so writers in different processes never touch
+the same row; threads of one process (worker flush, replays) serialize on the
+row lock. Reads merge the rows of every process and every bucket in the window.
+"""
+import json
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+
+from models import LatencySketch
+from rollups import ALL_TASKS, GRANULARITIES, bounds, plan, truncate
+from utils import process_id
+
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self._collapse()
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different accuracy")
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for bound, pick in (("min", min), ("max", max)):
+            theirs = getattr(other, bound)
+            if theirs is not None:
+                mine = getattr(self, bound)
+                setattr(self, bound, theirs if mine is None else pick(mine, theirs))
+        self._collapse()
+
+    def subtract(self, other: "DDSketch"):
+        """Take out the values of ``other``, a sketch earlier merged into this one.
+
+        Bins collapsed since then cannot be split and min/max are left as they are.
+        """
+        for key, n in other.bins.items():
+            left = self.bins.get(key, 0) - n
+            if left > 0:
+                self.bins[key] = left
+            else:
+                self.bins.pop(key, None)
+        self.zero_count = max(0, self.zero_count - other.zero_count)
+        self.count = self.zero_count + sum(self.bins.values())
+
+    def _collapse(self):
+        # fold the lowest bins together so memory stays bounded (the tail we care about is high)
+        if len(self.bins) <= self.max_bins:
+            return
+        keys = sorted(self.bins)
+        overflow = keys[: len(keys) - self.max_bins + 1]
+        target = overflow[-1]
+        self.bins[target] = sum(self.bins.pop(k) for k in overflow[:-1]) + self.bins[target]
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "a": self.relative_accuracy, "z": self.zero_count, "n": self.count,
+            "min": self.min, "max": self.max, "b": self.bins,
+        })
+
+    @classmethod
+    def from_json(cls, raw: str) -> "DDSketch":
+        data = json.loads(raw)
+        sk = cls(relative_accuracy=data["a"])
+        sk.bins = {int(k): v for k, v in data["b"].items()}
+        sk.zero_count, sk.count = data["z"], data["n"]
+        sk.min, sk.max = data["min"], data["max"]
+        return sk
+
+
+_EMPTY = DDSketch().to_json()
+
+
+# ---------- write path ----------
+def record(db, runs: List[dict], dlq: List[dict]):
+    """``sink`` listener: add latencies of a batch to this process' sketch rows."""
+    batch: Dict[tuple, DDSketch] = {}
+    for run in runs:
+        latency = run.get("latency_ms") or 0
+        if not latency:
+            continue  # failed attempts carry no latency (same rule as the average)
+        created = run.get("created_at") or datetime.utcnow()
+        for task_id in (run["task_id"], ALL_TASKS):
+            for gran in GRANULARITIES:
+                key = (task_id, gran, truncate(created, gran))
+                batch.setdefault(key, DDSketch()).add(latency)
+    if not batch:
+        return
+
+    worker_id = process_id()
+    _insert_missing(db, [
+        dict(task_id=k[0], granularity=k[1], bucket_start=k[2], worker_id=worker_id, count=0, data=_EMPTY)
+        for k in batch
+    ])
+    tasks = {k[0] for k in batch}
+    buckets = {k[2] for k in batch}
+    rows = db.scalars(
+        select(LatencySketch).where(
+            LatencySketch.worker_id == worker_id,
+            LatencySketch.task_id.in_(tasks),
+            LatencySketch.bucket_start.in_(buckets),
+        ).with_for_update()
+    )
+    for row in rows:
+        sk = batch.get((row.task_id, row.granularity, row.bucket_start))
+        if sk is None:
+            continue
+        merged = DDSketch.from_json(row.data)
+        merged.merge(sk)
+        row.count, row.data = merged.count, merged.to_json()
+    db.flush()
+
+
+def _insert_missing(db, rows: List[dict]):
+    """Create empty rows for new keys, so the merge can lock an existing row."""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        db.execute(insert(LatencySketch).on_conflict_do_nothing(), rows)
+        return
+    # portable fallback: no conflict clause, so only new keys are inserted
+    for row in rows:
+        key = tuple(row[k] for k in ("task_id", "granularity", "bucket_start", "worker_id"))
+        if db.get(LatencySketch, key) is None:
+            db.add(LatencySketch(**row))
+    db.flush()
+
+
+def forget_task(db, task_id: int):
+    """Drop a deleted task's sketches and take its values out of the all-tasks series.
+
+    A task's row and the all-tasks row of the same process and bucket saw the
+    same values, so they subtract exactly (see ``DDSketch.subtract``).
+    """
+    own = aliased(LatencySketch)
+    pairs = db.execute(
+        select(LatencySketch, own.data)
+        .join(own, and_(
+            own.granularity == LatencySketch.granularity,
+            own.bucket_start == LatencySketch.bucket_start,
+            own.worker_id == LatencySketch.worker_id,
+        ))
+        .where(LatencySketch.task_id == ALL_TASKS, own.task_id == task_id)
+        .with_for_update(of=LatencySketch)
+    ).all()
+    for total, raw in pairs:
+        remaining = DDSketch.from_json(total.data)
+        remaining.subtract(DDSketch.from_json(raw))
+        total.count, total.data = remaining.count, remaining.to_json()
+    db.execute(delete(LatencySketch).where(LatencySketch.task_id == task_id))
+    db.flush()
+
+
+# ---------- read path ----------
+def window(db, task_id: Optional[int] = None, since: Optional[datetime] = None,
+           until: Optional[datetime] = None) -> DDSketch:
+    """Merge every process' sketches covering [since, until) for one series."""
+    series = ALL_TASKS if task_id is None else task_id
+    start, end = bounds(since, until)
+    merged = DDSketch()
+    for gran, lo, hi in plan(start, end):
+        rows = db.scalars(
+            select(LatencySketch.data).where(
+                LatencySketch.task_id == series,
+                LatencySketch.granularity == gran,
+                LatencySketch.bucket_start >= lo,
+                LatencySketch.bucket_start < hi,
+            )
+        )
+        for raw in rows:
+            merged.merge(DDSketch.from_json(raw))
+    return merged
+
+
+def percentiles(sk: DDSketch, quantiles: Iterable[float] = (0.5, 0.95, 0.99)) -> dict:
+    out = {"count": sk.count}
+    for q in quantiles:
+        value = sk.quantile(q)
+        out[f"p{round(q * 100, 3):g}"] = None if value is None else round(value, 2)
+    return out
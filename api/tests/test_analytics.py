@@ -0,0 +1,162 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import Base, engine, SessionLocal
+from models import LatencySketch, Run, RunRollup
+from sink import record_results
+import crud
+import retention
+import rollups
+import schemas
+import sketches
+from sketches import DDSketch
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def _run(task_id, status, latency, created_at):
+    return dict(task_id=task_id, status=status, latency_ms=latency, created_at=created_at)
+
+
+def _seed_runs():
+    db = SessionLocal()
+    t1 = crud.create_task(db, "dev_user", schemas.TaskCreate(url="http://a", method="GET"))
+    t2 = crud.create_task(db, "dev_user", schemas.TaskCreate(url="http://b", method="GET"))
+    now = datetime.utcnow()
+    record_results(db, runs=[
+        _run(t1.id, "success", 100, now - timedelta(days=3)),
+        _run(t1.id, "failure", 0, now - timedelta(hours=5)),
+        _run(t2.id, "success", 300, now - timedelta(minutes=3)),
+    ])
+    record_results(db, runs=[_run(t2.id, "success", 20000, now - timedelta(minutes=2))])
+    db.commit()
+    ids = t1.id, t2.id
+    db.close()
+    return ids
+
+
+def test_summary_is_served_from_rollups():
+    _seed_runs()
+    data = client.get("/analytics/summary").json()
+    assert data["total_tasks"] == 2
+    assert data["total_runs"] == 4
+    assert data["successes"] == 3
+    assert data["failures"] == 1
+    assert data["average_latency_ms"] == round((100 + 300 + 20000) / 3, 2)
+    assert data["min_latency_ms"] == 100 and data["max_latency_ms"] == 20000
+    assert data["latency_histogram"]["100"] == 1
+    assert data["latency_histogram"]["inf"] == 1
+
+
+def test_summary_task_and_time_filters():
+    t1, t2 = _seed_runs()
+    assert client.get("/analytics/summary", params={"task_id": t1}).json()["total_runs"] == 2
+
+    since = (datetime.utcnow() - timedelta(hours=6)).isoformat()
+    data = client.get("/analytics/summary", params={"since": since}).json()
+    assert data["total_runs"] == 3
+
+    data = client.get("/analytics/summary", params={"task_id": t2, "since": since}).json()
+    assert data["total_runs"] == 2
+
+
+def test_plan_uses_coarse_buckets():
+    start = datetime(2024, 1, 1, 22, 30)
+    end = datetime(2024, 1, 5, 1, 15)
+    segments = rollups.plan(start, end)
+    assert [g for g, _, _ in segments] == ["minute", "hour", "day", "hour", "minute"]
+    assert segments[0][1] == start and segments[-1][2] == end
+
+
+def test_deleting_a_task_subtracts_its_rollups():
+    t1, _ = _seed_runs()
+    db = SessionLocal()
+    crud.delete_task(db, t1)
+    assert db.query(RunRollup).filter(RunRollup.task_id == t1).count() == 0
+    assert db.query(LatencySketch).filter(LatencySketch.task_id == t1).count() == 0
+    assert sketches.window(db, task_id=t1).count == 0  # a task reusing the id starts empty
+    db.close()
+    assert client.get("/analytics/summary").json()["total_runs"] == 2
+    assert client.get("/analytics/latency").json()["count"] == 2
+
+
+def test_sketch_quantiles_are_accurate_and_mergeable():
+    a, b = DDSketch(), DDSketch()
+    for v in range(1, 5001):
+        (a if v % 2 else b).add(v)
+    a.merge(DDSketch.from_json(b.to_json()))
+    assert a.count == 5000
+    for q, expected in ((0.5, 2500), (0.95, 4750), (0.99, 4950)):
+        assert abs(a.quantile(q) - expected) / expected < 0.02
+
+
+def test_latency_percentiles_endpoint():
+    t1, t2 = _seed_runs()
+    data = client.get("/analytics/latency").json()
+    assert data["count"] == 3
+    assert abs(data["p50"] - 300) / 300 < 0.02
+
+    data = client.get("/analytics/latency", params={"task_id": t1}).json()
+    assert data["count"] == 1 and abs(data["p50"] - 100) < 2
+
+
+def test_retention_expires_runs_but_keeps_their_statistics():
+    t1, t2 = _seed_runs()
+    db = SessionLocal()
+    crud.update_task(db, t2, retention_days=1)
+    later = datetime.utcnow() + timedelta(days=2)
+    assert retention.expire_runs(db, later, global_days=30, batch_size=1) == 2  # t2's runs only
+    assert {r.task_id for r in db.query(Run)} == {t1}
+
+    assert retention.expire_runs(db, later + timedelta(days=30), global_days=30) == 2
+    assert db.query(Run).count() == 0
+    db.close()
+    # summaries come from rollups, which outlive the raw runs
+    assert client.get("/analytics/summary").json()["total_runs"] == 4
+
+
+def test_retention_prunes_fine_grained_rollups():
+    _seed_runs()
+    db = SessionLocal()
+    retention.expire_stats(db, datetime.utcnow() + timedelta(days=1), minute_days=1, hour_days=0)
+    assert db.query(RunRollup).filter(RunRollup.granularity == "minute").count() == 0
+    assert db.query(RunRollup).filter(RunRollup.granularity == "hour").count() > 0
+    db.close()
+
+
+def test_export_streams_runs_as_ndjson_and_csv():
+    t1, t2 = _seed_runs()
+    resp = client.get("/export/runs", params={"task_id": t2})
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [r["latency_ms"] for r in rows] == [300, 20000]  # oldest first
+
+    since = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    lines = client.get("/export/runs", params={"format": "csv", "since": since}).text.splitlines()
+    assert lines[0].startswith("id,task_id,status") and len(lines) == 1 + 3
+
+    assert client.get("/export/runs", params={"format": "xml"}).status_code == 400
+
+
+def test_export_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    _seed_runs()
+    resp = client.get("/export/runs", params={"format": "parquet"})
+    table = pq.read_table(io.BytesIO(resp.content))
+    assert table.num_rows == 4 and table.column_names[:3] == ["id", "task_id", "status"]
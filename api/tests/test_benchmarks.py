@@ -0,0 +1,69 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Query micro-benchmarks; bigger datasets: BENCH_TASKS=10000 make backend-bench
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from sqlalchemy import insert
+
+from database import Base, engine, SessionLocal
+from models import Task
+from pagination import decode_cursor, next_cursor
+from sink import record_results
+import crud
+import rollups
+import sketches
+
+TASKS = int(os.getenv("BENCH_TASKS", "200"))
+RUNS_PER_TASK = int(os.getenv("BENCH_RUNS_PER_TASK", "20"))
+
+
+@pytest.fixture(scope="module")
+def db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    now = datetime.utcnow()
+    session.execute(insert(Task), [
+        dict(user_id="bench", url=f"http://bench/{i}", method="GET", schedule_cron="*/5 * * * *")
+        for i in range(TASKS)
+    ])
+    runs = [
+        dict(task_id=t, status="success" if r % 10 else "failure", latency_ms=20 + (r * 37) % 900,
+             created_at=now - timedelta(minutes=r * 17))
+        for t in range(1, TASKS + 1) for r in range(RUNS_PER_TASK)
+    ]
+    for i in range(0, len(runs), 5000):
+        record_results(session, runs=runs[i:i + 5000])
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_list_tasks_keyset_page(benchmark, db):
+    first = crud.get_tasks(db, limit=50)
+    cursor = decode_cursor(next_cursor(first, 50))
+    page = benchmark(crud.get_tasks, db, 50, 0, cursor)
+    assert page[0].id == first[-1].id + 1
+
+
+def test_runs_for_task(benchmark, db):
+    runs = benchmark(crud.get_runs_for_task, db, TASKS // 2, 100)
+    assert len(runs) == min(100, RUNS_PER_TASK)
+
+
+def test_summary_from_rollups(benchmark, db):
+    since = datetime.utcnow() - timedelta(days=30)
+    summary = benchmark(rollups.summarize, db, None, since)
+    assert summary["total"] == TASKS * RUNS_PER_TASK
+
+
+def test_latency_window_from_sketches(benchmark, db):
+    since = datetime.utcnow() - timedelta(days=30)
+    sk = benchmark(sketches.window, db, None, since)
+    assert sk.count == TASKS * RUNS_PER_TASK
@@ -0,0 +1,85 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import socket
+import threading
+import time
+from datetime import datetime
+
+from database import Base, engine, SessionLocal
+from events import BrokerLink, EventBus, result_events, serve_broker
+from sink import ResultSink
+import crud
+import events
+import schemas
+
+
+def _run(task_id, status="success", latency=100):
+    return dict(task_id=task_id, status=status, latency_ms=latency, created_at=datetime.utcnow())
+
+
+def test_slow_subscriber_drops_oldest_but_keeps_summary():
+    async def scenario():
+        bus = EventBus()
+        sub = bus.subscribe(maxlen=3)
+        only_2 = bus.subscribe(task_id=2)
+        bus.publish(result_events([_run(1), _run(2, "failure", 300), _run(1), _run(1), _run(1, latency=None)],
+                                  [dict(task_id=2, error="boom")]))
+        batch = await sub.next_batch(1)
+        assert batch[0] == {"type": "dropped", "count": 3}
+        assert [ev["type"] for ev in batch[1:]] == ["run", "run", "dlq", "summary"]
+        assert batch[-1] == dict(type="summary", runs=5, successes=4, failures=1,
+                                 latency_sum=600, latency_count=4, dlq=1)
+        assert [ev["type"] for ev in await only_2.next_batch(1)] == ["run", "dlq", "summary"]
+        assert await sub.next_batch(0.01) == []
+        bus.unsubscribe(sub)
+        assert len(bus) == 1
+    asyncio.run(scenario())
+
+
+def test_sink_publishes_after_commit():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    task = crud.create_task(db, "dev_user", schemas.TaskCreate(url="http://a", method="GET"))
+    db.close()
+
+    async def scenario():
+        sub = events.bus.subscribe(task.id)
+        try:
+            sink = ResultSink()
+            sink.add_run(_run(task.id))
+            sink.add_dlq(dict(task_id=task.id, error="boom", created_at=datetime.utcnow()))
+            await asyncio.to_thread(sink.flush)
+            batch = await sub.next_batch(1)
+        finally:
+            events.bus.unsubscribe(sub)
+        assert [ev["type"] for ev in batch] == ["run", "dlq", "summary"]
+        assert batch[0]["task_id"] == task.id and isinstance(batch[0]["created_at"], str)
+    asyncio.run(scenario())
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_broker_bridges_buses():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    threading.Thread(target=lambda: asyncio.run(serve_broker("127.0.0.1", port)), daemon=True).start()
+
+    async def scenario():
+        api, worker = EventBus(), EventBus()
+        for bus in (api, worker):
+            bus.link = BrokerLink(bus, f"127.0.0.1:{port}")
+            bus.link.origin += f"-{id(bus)}"  # two "processes" in one
+            bus.link.start()
+        sub = api.subscribe()
+        deadline = time.monotonic() + 10
+        while not (api.link._sock and worker.link._sock) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.1)  # both connections accepted by the broker
+        worker.publish(result_events([_run(7)], []))
+        batch = await sub.next_batch(5)
+        assert [ev["type"] for ev in batch] == ["run", "summary"]
+        assert batch[0]["task_id"] == 7
+    asyncio.run(scenario())
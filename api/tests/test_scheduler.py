@@ -0,0 +1,100 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from cache import LRUCache, cron_cache, next_fire_time, task_headers
+from scheduler import Scheduler
+from utils import encrypt_headers
+
+
+def _task(task_id, cron="*/1 * * * *", enabled=True):
+    return SimpleNamespace(id=task_id, schedule_cron=cron, enabled=enabled)
+
+
+def _loaded_scheduler():
+    s = Scheduler()
+    s._loaded = True  # skip the DB load, tasks are added through upsert
+    return s
+
+
+def test_pop_due_only_returns_due_tasks_and_reschedules():
+    s = _loaded_scheduler()
+    s.upsert(_task(1))
+    s.upsert(_task(2, cron="0 0 1 1 *"))  # yearly
+
+    now = datetime.utcnow() + timedelta(minutes=1, seconds=1)
+    assert s.pop_due(now) == [1]
+    assert s.pop_due(now) == []  # task 1 moved to its next slot
+    assert len(s) == 2
+
+
+def test_update_and_delete_invalidate_entries():
+    s = _loaded_scheduler()
+    s.upsert(_task(1))
+    s.upsert(_task(2))
+    s.upsert(_task(1, cron="0 0 1 1 *"))  # schedule changed
+    s.remove(2)
+
+    now = datetime.utcnow() + timedelta(minutes=2)
+    assert s.pop_due(now) == []
+    assert len(s) == 1
+
+
+def test_disabled_task_is_unscheduled():
+    s = _loaded_scheduler()
+    s.upsert(_task(1))
+    s.upsert(_task(1, enabled=False))
+    assert s.seconds_until_next(datetime.utcnow()) is None
+
+
+def test_cron_cache_shares_parsed_schedules():
+    base = datetime(2024, 1, 1, 0, 7)
+    assert next_fire_time("*/5 * * * *", base) == datetime(2024, 1, 1, 0, 10)
+    parsed = cron_cache.get("*/5 * * * *")
+    assert next_fire_time("*/5 * * * *", datetime(2024, 1, 1, 0, 1)) == datetime(2024, 1, 1, 0, 5)
+    assert cron_cache.get("*/5 * * * *") is parsed
+    assert next_fire_time("not a cron", base) is None
+
+
+def test_header_cache_is_keyed_by_task_version():
+    v1, v2 = datetime(2024, 1, 1), datetime(2024, 1, 2)
+    task = SimpleNamespace(id=42, headers_encrypted=encrypt_headers({"X-A": "1"}), updated_at=v1)
+    assert task_headers(task) == {"X-A": "1"}
+    task.headers_encrypted = encrypt_headers({"X-A": "2"})
+    assert task_headers(task) == {"X-A": "1"}  # same version -> cached
+    task.updated_at = v2
+    assert task_headers(task) == {"X-A": "2"}
+
+
+def test_lru_cache_evicts_least_recently_used():
+    c = LRUCache(maxsize=2)
+    c.put("a", 1)
+    c.put("b", 2)
+    c.get("a")
+    c.put("c", 3)
+    assert c.get("b") is None and c.get("a") == 1 and len(c) == 2
+
+
+def test_upgrade_adds_and_backfills_schedule_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:  # schema of a database from before these columns
+        conn.execute(text("CREATE TABLE tasks (id INTEGER PRIMARY KEY, url VARCHAR NOT NULL, method VARCHAR, "
+                          "schedule_cron VARCHAR, enabled BOOLEAN, created_at DATETIME)"))
+        conn.execute(text("CREATE TABLE runs (id INTEGER PRIMARY KEY, task_id INTEGER, status VARCHAR, "
+                          "latency_ms INTEGER, created_at DATETIME)"))
+        conn.execute(text("INSERT INTO tasks VALUES (1, 'http://a.test/', 'GET', '*/5 * * * *', 1, '2024-01-01 00:00:00')"))
+        conn.execute(text("INSERT INTO runs VALUES (1, 1, 'failure', 0, '2024-01-01 00:05:00'), "
+                          "(2, 1, 'success', 10, '2024-01-01 00:10:00')"))
+
+    migrations.upgrade(engine)
+
+    assert "ix_tasks_enabled_next_run_at" in {ix["name"] for ix in inspect(engine).get_indexes("tasks")}
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT last_run_at, last_status, next_run_at FROM tasks")).one()
+    assert row[0].startswith("2024-01-01 00:10:00") and row[1] == "success"
+    assert row[2].startswith("2024-01-01 00:15:00")
@@ -0,0 +1,40 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import subprocess
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("worker", "seeds", "migrations", "executor", "httpx", "croniter", "cryptography")
+
+
+def _import_main(db_url: str) -> dict:
+    code = "import json, sys, main; print(json.dumps(sorted(m for m in %r if m in sys.modules)))" % (HEAVY,)
+    env = dict(os.environ, DATABASE_URL=db_url)
+    env.pop("ASYNC_DATABASE_URL", None)
+    out = subprocess.run([sys.executable, "-c", code], cwd=API_DIR, env=env, capture_output=True, text=True,
+                         check=True)
+    return {"loaded": json.loads(out.stdout.strip().splitlines()[-1]), "stdout": out.stdout}
+
+
+def test_importing_the_app_has_no_side_effects(tmp_path):
+    db = tmp_path / "cold.db"
+    result = _import_main(f"sqlite:///{db}")
+    assert result["loaded"] == []  # see bench/startup.py for timings
+    assert "FERNET_KEY" not in result["stdout"]
+    assert not db.exists() or not inspect(create_engine(f"sqlite:///{db}")).get_table_names()
+
+
+def test_factory_migrates_only_when_asked():
+    from database import Base, engine
+    from main import create_app
+    Base.metadata.drop_all(bind=engine)
+    with TestClient(create_app(run_worker=False, migrate=False)) as client:
+        assert client.get("/health").json() == {"status": "ok"}
+        assert "tasks" not in inspect(engine).get_table_names()
+    with TestClient(create_app(run_worker=False, migrate=True)):
+        assert "tasks" in inspect(engine).get_table_names()
+    Base.metadata.drop_all(bind=engine)
@@ -1,11 +1,17 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from main import app
 from database import Base, engine, SessionLocal
-from models import Task
+from models import Task, Run, DeadLetterQueue
+import executor
 
 client = TestClient(app)
 
@@ -50,3 +56,184 @@ def test_list_runs_empty_state():
     resp = client.get(f"/tasks/{task_id}/runs")
     assert resp.status_code == 200
     assert resp.json() == []
+
+
+def test_runs_cursor_pagination_walks_every_row_once():
+    task_id = client.post("/tasks/", json={"url": "http://x.com", "method": "GET"}).json()["id"]
+    db = SessionLocal()
+    t0 = datetime(2024, 1, 1)
+    # pairs of runs share a timestamp, so the id tie-breaker matters
+    db.add_all([Run(task_id=task_id, status="success", latency_ms=i, created_at=t0 + timedelta(seconds=i // 2))
+                for i in range(7)])
+    db.commit()
+    db.close()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+        resp = client.get(f"/tasks/{task_id}/runs", params=params)
+        assert resp.status_code == 200
+        seen += [r["id"] for r in resp.json()]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == list(range(7, 0, -1))
+
+    # offset paging still works
+    resp = client.get(f"/tasks/{task_id}/runs", params={"limit": 2, "offset": 2})
+    assert [r["id"] for r in resp.json()] == [5, 4]
+
+
+def test_offset_listing_keeps_id_order():
+    db = SessionLocal()
+    t0 = datetime(2024, 1, 1)
+    db.add_all([Task(id=1, url="http://x.com", method="GET", created_at=t0 + timedelta(hours=1)),
+                Task(id=2, url="http://x.com", method="GET", created_at=t0)])  # e.g. imported history
+    db.commit()
+    db.close()
+    assert [t["id"] for t in client.get("/tasks/", params={"limit": 1}).json()] == [1]
+    assert [t["id"] for t in client.get("/tasks/", params={"limit": 1, "offset": 1}).json()] == [2]
+
+
+def test_invalid_cursor_is_rejected():
+    resp = client.get("/tasks/", params={"cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+    assert client.get("/tasks/", params={"cursor": ""}).status_code == 200  # first page
+
+
+def test_patch_and_delete_task():
+    task_id = client.post("/tasks/", json={"url": "http://x.com", "method": "GET"}).json()["id"]
+    resp = client.patch(f"/tasks/{task_id}", json={"schedule_cron": "*/5 * * * *", "max_retries": 1})
+    assert resp.status_code == 200
+    assert resp.json()["schedule_cron"] == "*/5 * * * *" and resp.json()["next_run_at"] is not None
+    assert client.delete(f"/tasks/{task_id}").json() == {"ok": True}
+    assert client.get(f"/tasks/{task_id}").status_code == 404
+
+
+def test_metrics_endpoint_exposes_request_and_commit_timings():
+    from prometheus_client import REGISTRY
+    executor.configure(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    try:
+        before = REGISTRY.get_sample_value("taskrunner_request_seconds_count", {"host": "metrics.test"}) or 0
+        executor.get_executor().execute(SimpleNamespace(id=1, method="GET", url="http://metrics.test/",
+                                                        headers_encrypted=None, body=None))
+        client.post("/tasks/", json={"url": "http://x.com", "method": "GET"})  # one commit
+        resp = client.get("/metrics")
+        assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain")
+        assert REGISTRY.get_sample_value("taskrunner_request_seconds_count", {"host": "metrics.test"}) == before + 1
+        assert "taskrunner_db_commit_seconds_count" in resp.text
+    finally:
+        executor.configure()
+
+
+def test_batch_create_update_and_toggle():
+    resp = client.post("/tasks/batch", json=[
+        {"url": "http://a.com", "method": "GET", "schedule_cron": "*/5 * * * *", "headers": {"X-Key": "1"}},
+        {"url": "http://b.com", "method": "GET", "schedule_cron": "not a cron"},
+        {"url": "http://c.com", "method": "POST", "headers": {"X-Key": "1"}},
+    ])
+    assert resp.status_code == 200
+    results = resp.json()
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert "invalid cron" in results[1]["error"]
+    a, c = results[0]["id"], results[2]["id"]
+    assert client.get(f"/tasks/{a}").json()["next_run_at"] is not None
+
+    db = SessionLocal()
+    headers = [t.headers_encrypted for t in db.query(Task).order_by(Task.id)]
+    db.close()
+    assert headers[0] == headers[1]  # identical headers are encrypted once per batch
+
+    resp = client.patch("/tasks/batch", json=[
+        {"id": c, "schedule_cron": "0 * * * *"},
+        {"id": 9999, "enabled": False},
+    ])
+    assert [r["ok"] for r in resp.json()] == [True, False]
+    assert client.get(f"/tasks/{c}").json()["schedule_cron"] == "0 * * * *"
+
+    resp = client.post("/tasks/batch/disable", json={"ids": [a, c, 9999]})
+    assert [r["ok"] for r in resp.json()] == [True, True, False]
+    task = client.get(f"/tasks/{a}").json()
+    assert task["enabled"] is False and task["next_run_at"] is None
+    client.post("/tasks/batch/enable", json={"ids": [a]})
+    assert client.get(f"/tasks/{a}").json()["next_run_at"] is not None
+
+
+def test_replay_dlq_awaits_the_shared_executor():
+    sent = []
+    executor.configure(transport=httpx.MockTransport(lambda request: sent.append(1) or httpx.Response(204)))
+    try:
+        task_id = client.post("/tasks/", json={"url": "http://x.com", "method": "GET"}).json()["id"]
+        other_id = client.post("/tasks/", json={"url": "http://y.com", "method": "GET"}).json()["id"]
+        db = SessionLocal()
+        row = DeadLetterQueue(task_id=task_id, error="boom")
+        db.add(row)
+        db.commit()
+        dlq_id = row.id
+        db.close()
+
+        assert client.post(f"/tasks/{task_id}/dlq/9999/replay").status_code == 404
+        assert client.post(f"/tasks/{other_id}/dlq/{dlq_id}/replay").status_code == 404  # not its letter
+        assert sent == []
+        resp = client.post(f"/tasks/{task_id}/dlq/{dlq_id}/replay")
+        assert resp.json()["ok"] is True and resp.json()["response_code"] == 204
+        assert client.get(f"/tasks/{task_id}/dlq").json() == []
+        assert [r["status"] for r in client.get(f"/tasks/{task_id}/runs").json()] == ["success"]
+    finally:
+        executor.configure()
+
+
+def test_bulk_replay_runs_in_the_background_with_progress():
+    executor.configure(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    try:
+        task_id = client.post("/tasks/", json={"url": "http://x.com", "method": "GET"}).json()["id"]
+        db = SessionLocal()
+        db.add_all(DeadLetterQueue(task_id=task_id, error="ReadTimeout") for _ in range(3))
+        db.commit()
+        db.close()
+
+        assert client.post("/dlq/replays", json={"error_class": "nope"}).status_code == 422
+        resp = client.post("/dlq/replays", json={"task_ids": [task_id], "rate": 0})
+        assert resp.status_code == 202
+        job_id = resp.json()["id"]
+        deadline = time.monotonic() + 5
+        while (progress := client.get(f"/dlq/replays/{job_id}").json())["state"] in ("queued", "running"):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert (progress["state"], progress["total"], progress["succeeded"], progress["deleted"]) == ("done", 3, 3, 3)
+        assert client.get(f"/tasks/{task_id}/dlq").json() == []
+        assert client.get("/dlq/replays").json()[0]["id"] == job_id
+        assert client.get("/dlq/replays/missing").status_code == 404
+    finally:
+        executor.configure()
+
+
+def test_captured_bodies_are_deduplicated_and_loaded_lazily():
+    import retention
+    from executor import Body, Outcome
+    from models import ResponseBody
+    from sink import record_results
+    from worker import run_values
+
+    task_id = client.post("/tasks/", json={"url": "http://x.com", "method": "GET", "capture_body": True}).json()["id"]
+    assert client.get(f"/tasks/{task_id}").json()["capture_body"] is True
+    error_page = Body(b"<h1>502 Bad Gateway</h1>" * 50, False, "text/html")
+    db = SessionLocal()
+    record_results(db, runs=[run_values(task_id, Outcome(True, 5, 502, None, body=error_page)) for _ in range(3)]
+                   + [run_values(task_id, Outcome(False, 0, 0, "boom"))])
+    db.commit()
+    assert db.query(ResponseBody).count() == 1
+
+    runs = client.get(f"/tasks/{task_id}/runs").json()
+    with_body = [r for r in runs if r["body_hash"]]
+    assert len(with_body) == 3 and "content" not in with_body[0]
+    resp = client.get(f"/tasks/{task_id}/runs/{with_body[0]['id']}/body")
+    assert resp.content == error_page.data and resp.headers["content-type"].startswith("text/html")
+    assert resp.headers["X-Body-Truncated"] == "0"
+    no_body = next(r for r in runs if not r["body_hash"])
+    assert client.get(f"/tasks/{task_id}/runs/{no_body['id']}/body").status_code == 404
+
+    db.query(Run).delete()
+    db.commit()
+    assert retention.expire_bodies(db, datetime.utcnow() + timedelta(hours=2)) == 1
+    db.close()
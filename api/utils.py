@@ -1,19 +1,39 @@
 # utils.py
-import json, os
-from cryptography.fernet import Fernet
+import json, logging, os, socket, threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-KEY = os.getenv("FERNET_KEY")
-if not KEY:
-    KEY = Fernet.generate_key().decode()
-    print(f"⚠️ Generated new FERNET_KEY: {KEY} (save this in .env for reuse)")
+logger = logging.getLogger(__name__)
 
-fernet = Fernet(KEY.encode())
+_fernet = None
+_fernet_lock = threading.Lock()
+
+def get_fernet():
+    """Fernet for task headers, built on first use (cryptography is not imported at startup).
+
+    Without FERNET_KEY a throwaway key is generated: headers encrypted with it
+    cannot be read after a restart.
+    """
+    global _fernet
+    if _fernet is None:
+        with _fernet_lock:
+            if _fernet is None:
+                from cryptography.fernet import Fernet
+                key = os.getenv("FERNET_KEY")
+                if not key:
+                    key = Fernet.generate_key().decode()
+                    logger.warning("⚠️ FERNET_KEY is not set, using a temporary key (set one in .env to keep "
+                                   "stored headers readable across restarts)")
+                _fernet = Fernet(key.encode())
+    return _fernet
+
+def process_id() -> str:
+    """Identifies this process (sketch rows, task leases); evaluated per call so forks differ."""
+    return f"{socket.gethostname()}:{os.getpid()}"
 
 def encrypt_headers(headers: dict) -> str:
-    return fernet.encrypt(json.dumps(headers).encode()).decode()
+    return get_fernet().encrypt(json.dumps(headers).encode()).decode()
 
 def decrypt_headers(token: str) -> dict:
-    return json.loads(fernet.decrypt(token.encode()).decode())
+    return json.loads(get_fernet().decrypt(token.encode()).decode())
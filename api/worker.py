@@ -1,71 +1,179 @@
 # worker.py
+import argparse
 import logging
+import multiprocessing
+import os
+import queue
+import random
+import signal
 import time
 import threading
-from datetime import datetime
-from croniter import croniter
-import requests
-from database import SessionLocal
-from models import Task, Run, DeadLetterQueue
-from utils import decrypt_headers
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Iterable, List, NamedTuple, Set, Tuple
+from database import SessionLocal, engine
+import metrics
+import migrations
+import events
+import executor as executor_mod
+from executor import Outcome, get_executor
+from models import Task
+from leases import LeaseManager, SHARDS, SHARD_INDEX
+import outbox
+import retention
+from scheduler import Job, scheduler
+from sink import dlq_values, run_values, sink as result_sink
 
 logger = logging.getLogger(__name__)
 
 _worker_started = False
 
+RESYNC_SECONDS = float(os.getenv("WORKER_RESYNC_SECONDS", "60"))
+REFRESH_SECONDS = float(os.getenv("WORKER_REFRESH_SECONDS", "2"))  # poll for tasks edited by the API
+REFRESH_OVERLAP = timedelta(seconds=30)  # late commits, clock skew between API and worker hosts
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+DEFAULT_BACKOFF_MAX_SECONDS = 60.0
+
+
+class RetryPolicy(NamedTuple):
+    max_retries: int = DEFAULT_MAX_RETRIES
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS
+    backoff_max_seconds: float = DEFAULT_BACKOFF_MAX_SECONDS
+    jitter: float = 0.0
+
+
+def retry_policy(task) -> RetryPolicy:
+    """Per-task retry settings; NULL columns fall back to the defaults."""
+    def pick(value, default):
+        return default if value is None else value
+    return RetryPolicy(
+        max_retries=pick(getattr(task, "max_retries", None), DEFAULT_MAX_RETRIES),
+        backoff_seconds=pick(getattr(task, "retry_backoff_seconds", None), DEFAULT_BACKOFF_SECONDS),
+        backoff_max_seconds=pick(getattr(task, "retry_backoff_max_seconds", None), DEFAULT_BACKOFF_MAX_SECONDS),
+        jitter=pick(getattr(task, "retry_jitter", None), 0.0),
+    )
+
+
+def retry_delay(policy: RetryPolicy, attempt: int) -> float:
+    """Exponential backoff after ``attempt`` failed, capped, with optional jitter.
+
+    ``jitter`` is the fraction of the delay that is randomized: 0 keeps the
+    classic 1/2/4s sequence, 1 is "full jitter" (uniform in [0, delay]).
+    """
+    delay = min(policy.backoff_max_seconds, policy.backoff_seconds * (2 ** (attempt - 1)))
+    if policy.jitter:
+        delay -= delay * policy.jitter * random.random()
+    return delay
+
 
 def execute_task(task):
-    """Make the HTTP request defined by the task."""
-    headers = {}
-    raw = getattr(task, "headers_encrypted", None)
-    if isinstance(raw, str) and raw.strip():
+    """Make the HTTP request defined by the task -> (ok, latency, code, err)."""
+    return get_executor().execute(task).as_tuple()
+
+
+class Dispatcher:
+    """Submits due attempts to the executor without waiting for them.
+
+    Completed requests land on a queue that the worker thread drains: it buffers
+    the ``Run`` in the result sink and, on failure, re-enqueues the next attempt
+    on the scheduler's retry heap (or moves the task to the DLQ once retries are
+    exhausted).
+
+    ``active`` holds the outbox keys of slots whose attempt chain is still
+    going (in flight or waiting for a retry); their leases are renewed.
+    """
+
+    def __init__(self, executor=None, sched=scheduler, sink=result_sink):
+        self.executor = executor or get_executor()
+        self.scheduler = sched
+        self.sink = sink
+        self.completions = queue.SimpleQueue()
+        self.inflight = 0
+        self.finished: List[int] = []  # task ids whose attempt chain ended since last taken
+        self.completed: List[str] = []  # outbox keys of those chains
+        self.active: Set[str] = set()
+
+    def dispatch(self, db, jobs: Iterable[Tuple]):
+        """Submit ``Job``/``(task_id, attempt)`` jobs; disabled or deleted tasks are dropped."""
+        jobs = [Job(*job) for job in jobs]
+        if not jobs:
+            return
+        ids = {job.task_id for job in jobs}
+        tasks = {t.id: t for t in db.query(Task).filter(Task.id.in_(ids), Task.enabled == True)}
+        for job in jobs:
+            task = tasks.get(job.task_id)
+            if task is None:
+                self._finish(job.task_id, job.key)
+                continue
+            future = self.executor.submit(task, job.key)
+            self.inflight += 1
+            if job.key:
+                self.active.add(job.key)
+            future.add_done_callback(partial(self._done, job.task_id, job.attempt, retry_policy(task), job.key))
+
+    def _finish(self, task_id, key):
+        self.finished.append(task_id)
+        if key:
+            self.active.discard(key)
+            self.completed.append(key)
+
+    def _done(self, task_id, attempt, policy, key, future):
+        # runs on the executor loop thread: hand over and wake the worker
         try:
-            headers = decrypt_headers(raw)
+            result = future.result()
         except Exception as e:
-            logger.error(f"Header decrypt failed: {e}")
-            headers = {}
+            result = Outcome(False, 0, 0, str(e))
+        self.completions.put((task_id, attempt, policy, key, result))
+        self.scheduler.wake()
 
-    start = time.time()
-    try:
-        resp = requests.request(task.method, task.url, headers=headers, data=task.body, timeout=10)
-        latency = int((time.time() - start) * 1000)
-        return True, latency, resp.status_code, None
-    except Exception as e:
-        return False, 0, 0, str(e)
-
-
-def run_with_retries(db, task, max_retries=3, backoff_seconds=(1, 2, 4), _execute=execute_task):
-    """Execute a task with retries and DLQ fallback."""
-    attempts = 0
-    last_error = None
-    while attempts <= max_retries:
-        attempts += 1
-        ok, latency, code, err = _execute(task)
-
-        db.add(Run(
-            task_id=task.id,
-            status="success" if ok else "failure",
-            latency_ms=latency,
-            response_code=code,
-            error=err
-        ))
-        db.commit()
+    def drain(self) -> int:
+        """Hand every completed attempt to the result sink."""
+        handled = 0
+        while True:
+            try:
+                task_id, attempt, policy, key, outcome = self.completions.get_nowait()
+            except queue.Empty:
+                break
+            ok, latency, code, err = outcome.as_tuple()
+            handled += 1
+            self.inflight -= 1
+            self.sink.add_run(run_values(task_id, outcome))
+            if ok:
+                self._finish(task_id, key)
+                logger.info(f"✅ Task {task_id} succeeded (code={code}, latency={latency}ms)")
+            elif attempt <= policy.max_retries:
+                delay = retry_delay(policy, attempt)
+                if outcome.retry_after:
+                    delay = max(delay, outcome.retry_after)  # host refused locally, retry once it reopens
+                logger.warning(f"⚠️ Task {task_id} failed (attempt {attempt}), retrying in {delay:.1f}s...")
+                self.scheduler.schedule_retry(task_id, attempt + 1, delay, key)
+            else:
+                self.sink.add_dlq(dlq_values(task_id, err))
+                metrics.DLQ.inc()
+                self._finish(task_id, key)
+                logger.error(f"❌ Task {task_id} moved to DLQ: {err}")
+        return handled
+
+    def release(self, db, leases: LeaseManager):
+        """Release the leases and complete the outbox keys of finished chains.
 
-        if ok:
-            logger.info(f"✅ Task {task.id} succeeded (code={code}, latency={latency}ms)")
-            return True
+        Only done while the sink holds nothing: a slot is marked done once its
+        last Run/DLQ row is committed, so a crash before the flush leaves it to
+        ``outbox.recover``.
+        """
+        if len(self.sink):
+            return
+        leases.release(db, self.take_finished(), self.take_completed())
 
-        last_error = err
-        if attempts <= max_retries:
-            sleep_for = backoff_seconds[min(attempts - 1, len(backoff_seconds) - 1)]
-            logger.warning(f"⚠️ Task {task.id} failed (attempt {attempts}), retrying in {sleep_for}s...")
-            time.sleep(sleep_for)
+    def take_finished(self) -> List[int]:
+        finished, self.finished = self.finished, []
+        return finished
 
-    # exhausted retries → move to DLQ
-    db.add(DeadLetterQueue(task_id=task.id, error=last_error or "unknown"))
-    db.commit()
-    logger.error(f"❌ Task {task.id} moved to DLQ: {last_error}")
-    return False
+    def take_completed(self) -> List[str]:
+        completed, self.completed = self.completed, []
+        return completed
 
 
 def seed_tasks(db):
@@ -94,46 +202,200 @@ def seed_tasks(db):
         logger.info("✅ Demo tasks created: 2")
 
 
-def worker_loop(poll_interval: int = 5):
-    logger.info("🔄 Worker started (poll interval: %ss)", poll_interval)
-    while True:
-        db = SessionLocal()
-        try:
-            # ✅ ensure demo tasks exist
-            seed_tasks(db)
+def worker_loop(max_sleep: float = 60, resync_interval: float = RESYNC_SECONDS, leases: LeaseManager = None,
+                stop_event: threading.Event = None, drain_timeout: float = 30,
+                refresh_interval: float = REFRESH_SECONDS):
+    """Fire tasks as their slots come due, sleeping until the earliest deadline.
 
-            tasks = db.query(Task).filter(Task.enabled == True).all()
-            now = datetime.utcnow()
+    The heap is built once at startup and rebuilt every ``resync_interval``; in
+    between, tasks created or edited by the API (another process) are applied
+    every ``refresh_interval`` from ``tasks.updated_at``. Requests run
+    on the executor, so this thread only dispatches work and records results.
+    Each due slot is claimed through ``leases`` first, so several workers (API
+    processes or replicas) never fire the same slot twice. Claimed slots are
+    kept in the outbox until the results of their attempt chain are committed;
+    every (re)load first settles misfires and then picks up pending or abandoned
+    slots in batches.
 
-            for task in tasks:
-                if not task.schedule_cron:
-                    continue
+    Setting ``stop_event`` stops dispatching, waits up to ``drain_timeout`` for
+    in-flight requests, flushes buffered results and releases held leases.
+    """
+    leases = leases or LeaseManager()
+    stop_event = stop_event or threading.Event()
+    logger.info("🔄 Worker %s started (max sleep: %ss, resync: %ss, shard %s/%s)",
+                leases.worker_id, max_sleep, resync_interval, leases.shard_index, leases.shards)
+    horizon = 2 * resync_interval  # resyncs overlap, so no slot is loaded too late
+    last_sync = None  # first load happens in the loop, so a database that is not ready yet is retried
+    last_refresh = 0.0
+    recover_due = False
+    last_heartbeat = time.monotonic()
+    heartbeat_every = leases.lease.total_seconds() / 3
+    dispatcher = Dispatcher()
+    events.start_bridge()  # results reach live feeds served by other processes
+    if leases.shard_index == 0:  # one housekeeper per deployment when sharded
+        retention.start_background(stop_event)
 
-                # last run time
-                last = db.query(Run).filter(Run.task_id == task.id).order_by(Run.created_at.desc()).first()
-                base = last.created_at if last else task.created_at
+    while not stop_event.is_set():
+        tick = time.perf_counter()
+        db = SessionLocal()
+        try:
+            if last_sync is None:
+                seed_tasks(db)  # ✅ ensure demo tasks exist
+            if last_sync is None or scheduler.resync_requested or time.monotonic() - last_sync >= resync_interval:
+                outbox.apply_misfires(db)  # before the load, so the heap starts at future slots
+                scheduler.load(db, horizon)
+                last_sync = last_refresh = time.monotonic()
+                recover_due = True
+            elif time.monotonic() - last_refresh >= refresh_interval:
+                scheduler.refresh(db, datetime.utcnow() - REFRESH_OVERLAP)
+                last_refresh = time.monotonic()
 
-                try:
-                    itr = croniter(task.schedule_cron, base)
-                    next_run = itr.get_next(datetime)
-                except Exception:
-                    continue
+            now = datetime.utcnow()
+            recovered = []
+            if recover_due:
+                recovered = leases.recover(db, now)
+                recover_due = len(recovered) >= outbox.RECOVERY_BATCH  # more left: next batch next tick
+            to_claim = []
+            due = scheduler.pop_due_slots(now)
+            metrics.DUE_TASKS.observe(len(due))
+            for task_id, slot, next_slot in due:
+                delay = leases.claim_delay(task_id, slot, now)
+                if delay:
+                    scheduler.defer(Job(task_id, 1, slot, next_slot), delay)  # another shard's task
+                else:
+                    to_claim.append((task_id, slot, next_slot))
+            jobs = []
+            for job in scheduler.pop_retries(now):
+                if job.slot is None:
+                    jobs.append(job)  # retry of a slot we already own
+                else:
+                    to_claim.append((job.task_id, job.slot, job.next_slot))
+            won = leases.claim(db, to_claim, now)
+            jobs += [Job(task_id, 1, key=outbox.slot_key(task_id, slot)) for task_id, slot, _ in to_claim
+                     if task_id in won]
+            jobs += [Job(task_id, 1, key=key) for task_id, key in recovered]
+            dispatched_at = datetime.utcnow()
+            for task_id, slot, _ in to_claim:
+                if task_id in won:
+                    metrics.SCHEDULE_LAG.observe((dispatched_at - slot).total_seconds())
 
-                if next_run <= now:
-                    run_with_retries(db, task, max_retries=3)
+            dispatcher.dispatch(db, jobs)
+            dispatcher.drain()
+            result_sink.flush_if_due()
+            dispatcher.release(db, leases)  # after the flush that made their results durable
+            if time.monotonic() - last_heartbeat >= heartbeat_every:
+                leases.renew(db, now, dispatcher.active)
+                last_heartbeat = time.monotonic()
         except Exception as e:
             logger.exception("Worker error: %s", e)
         finally:
             db.close()
+            metrics.TICK_SECONDS.observe(time.perf_counter() - tick)
+        metrics.QUEUE_DEPTH.labels("scheduled").set(len(scheduler))
+        metrics.QUEUE_DEPTH.labels("retries").set(scheduler.pending_retries)
+        metrics.QUEUE_DEPTH.labels("results").set(len(result_sink))
+        metrics.QUEUE_DEPTH.labels("dispatched").set(dispatcher.inflight)  # in the executor, incl. waiting
+
+        # wake up in time for the next flush, the lease heartbeat, the refresh and the resync
+        flush_in = result_sink.seconds_until_flush()
+        sleep_cap = min(max_sleep, heartbeat_every, refresh_interval, resync_interval)
+        scheduler.wait(sleep_cap if flush_in is None else min(sleep_cap, flush_in))
 
-        time.sleep(poll_interval)
+    _shutdown(dispatcher, leases, drain_timeout)
+
+
+def _shutdown(dispatcher: Dispatcher, leases: LeaseManager, drain_timeout: float):
+    logger.info("🛑 Worker %s stopping, draining %s in-flight request(s)", leases.worker_id, dispatcher.inflight)
+    deadline = time.monotonic() + drain_timeout
+    while dispatcher.inflight > 0 and time.monotonic() < deadline:
+        dispatcher.drain()
+        scheduler.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+    dispatcher.drain()
+    if dispatcher.inflight:
+        logger.warning("⚠️ %s request(s) still in flight after %ss, abandoning", dispatcher.inflight, drain_timeout)
+    result_sink.close()
+    db = SessionLocal()
+    try:
+        dispatcher.release(db, leases)  # skipped if the final flush failed: those slots are requeued
+        leases.release_all(db)  # unfinished slots go back to pending for the next worker
+    finally:
+        db.close()
+    dispatcher.executor.shutdown()
+    logger.info("👋 Worker %s stopped", leases.worker_id)
 
 
 def start_worker_background():
-    """Start the worker once (avoid duplicates under reload)."""
+    """Start the worker once per process; leases coordinate across processes."""
     global _worker_started
     if _worker_started:
         return
-    t = threading.Thread(target=worker_loop, kwargs={"poll_interval": 5}, daemon=True)
+    t = threading.Thread(target=worker_loop, daemon=True)
     t.start()
     _worker_started = True
+
+
+# ---------- standalone entry point: python -m worker ----------
+def _run_process(index: int, processes: int, args):
+    """Body of one worker process; local processes split the shard between them."""
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    executor_mod.configure(max_concurrency=args.concurrency, per_host=args.per_host)
+    if args.metrics_port:
+        metrics.start_exporter(args.metrics_port + index)
+    leases = LeaseManager(shards=SHARDS * processes, shard_index=SHARD_INDEX * processes + index)
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        stop.set()
+        scheduler.wake()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    worker_loop(max_sleep=args.max_sleep, resync_interval=args.resync, leases=leases,
+                stop_event=stop, drain_timeout=args.drain_timeout, refresh_interval=args.refresh)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m worker", description="Run the task scheduler/executor.")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "1")),
+                        help="worker processes on this node (default: WORKER_PROCESSES or 1)")
+    parser.add_argument("--concurrency", type=int, default=executor_mod.MAX_CONCURRENCY,
+                        help="max in-flight requests per process")
+    parser.add_argument("--per-host", type=int, default=executor_mod.PER_HOST_CONCURRENCY,
+                        help="max in-flight requests per destination host per process")
+    parser.add_argument("--max-sleep", type=float, default=60)
+    parser.add_argument("--resync", type=float, default=RESYNC_SECONDS,
+                        help="seconds between full scheduler reloads from the DB")
+    parser.add_argument("--refresh", type=float, default=REFRESH_SECONDS,
+                        help="seconds between polls for tasks edited by the API")
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="seconds to wait for in-flight requests on shutdown")
+    parser.add_argument("--metrics-port", type=int, default=metrics.WORKER_METRICS_PORT,
+                        help="serve Prometheus metrics on this port (+ process index), 0 = off")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    migrations.upgrade(engine)  # before any process loads tasks; idempotent next to the API's
+
+    if args.processes <= 1:
+        _run_process(0, 1, args)
+        return
+
+    ctx = multiprocessing.get_context("spawn")  # no inherited threads/connections
+    procs = [ctx.Process(target=_run_process, args=(i, args.processes, args), name=f"worker-{i}")
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+
+    def forward(signum, frame):
+        for p in procs:
+            if p.is_alive():
+                p.terminate()  # SIGTERM -> graceful drain in the child
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-import { useQuery } from "@tanstack/react-query";
+import { useEffect } from "react";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
 import axios from "axios";
 import { PieChart, Pie, Cell, Tooltip, ResponsiveContainer } from "recharts";
 
@@ -11,17 +12,61 @@ type Summary = {
   failures: number;
   success_rate: number;
   average_latency_ms: number;
+  latency_count: number;
 };
 
+// coalesced counts pushed by GET /events/runs since the previous "summary" event
+type SummaryDelta = {
+  runs: number;
+  successes: number;
+  failures: number;
+  latency_sum: number;
+  latency_count: number;
+};
+
+function applyDelta(s: Summary, d: SummaryDelta): Summary {
+  const total_runs = s.total_runs + d.runs;
+  const successes = s.successes + d.successes;
+  const latency_count = s.latency_count + d.latency_count;
+  const latencySum = s.average_latency_ms * s.latency_count + d.latency_sum;
+  return {
+    ...s,
+    total_runs,
+    successes,
+    failures: s.failures + d.failures,
+    success_rate: total_runs ? Math.round((successes / total_runs) * 10000) / 100 : 0,
+    average_latency_ms: latency_count ? Math.round((latencySum / latency_count) * 100) / 100 : 0,
+    latency_count,
+  };
+}
+
 export default function Analytics() {
+  const queryClient = useQueryClient();
   const { data, isLoading, error } = useQuery<Summary>({
     queryKey: ["analytics-summary"],
     queryFn: async () => {
       const res = await axios.get(`${API_URL}/analytics/summary`);
       return res.data;
     },
+    staleTime: Infinity, // kept current by the live feed below
   });
 
+  // Live updates instead of polling; the browser reconnects on its own,
+  // and after a reconnect the summary is reloaded once to catch up.
+  useEffect(() => {
+    const source = new EventSource(`${API_URL}/events/runs`);
+    source.addEventListener("summary", (e) => {
+      const delta: SummaryDelta = JSON.parse((e as MessageEvent).data);
+      queryClient.setQueryData<Summary>(["analytics-summary"], (s) => (s ? applyDelta(s, delta) : s));
+    });
+    let opened = false;
+    source.onopen = () => {
+      if (opened) queryClient.invalidateQueries({ queryKey: ["analytics-summary"] });
+      opened = true;
+    };
+    return () => source.close();
+  }, [queryClient]);
+
   if (isLoading) return <p className="p-4">Loading analytics...</p>;
   if (error) return <p className="p-4 text-red-500">Failed to load analytics</p>;
   if (!data) return null;
@@ -5,25 +5,31 @@ import { api } from "../api";
 import type { Run } from "../types";
 import { BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer } from "recharts";
 
-async function fetchRuns(taskId: string, limit: number, offset: number): Promise<Run[]> {
-  const { data } = await api.get<Run[]>(`/tasks/${taskId}/runs?limit=${limit}&offset=${offset}`);
-  return data;
+type RunsPage = { runs: Run[]; next: string | null };
+
+async function fetchRuns(taskId: string, limit: number, cursor: string | null): Promise<RunsPage> {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  const { data, headers } = await api.get<Run[]>(`/tasks/${taskId}/runs?${params}`);
+  return { runs: data, next: (headers["x-next-cursor"] as string | undefined) ?? null };
 }
 
 export default function TaskRuns() {
   const { id } = useParams<{ id: string }>();
   const [limit, setLimit] = useState(100);
-  const [offset, setOffset] = useState(0);
+  // cursors[i] starts page i (null = newest); Prev pops, Next pushes the server's cursor
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
+  const cursor = cursors[cursors.length - 1];
   const [statusFilter, setStatusFilter] = useState<"all" | "success" | "failure">("all");
 
   const { data, isLoading, isError, error, refetch, isFetching } = useQuery({
-    queryKey: ["runs", id, limit, offset],
-    queryFn: () => fetchRuns(id!, limit, offset),
+    queryKey: ["runs", id, limit, cursor],
+    queryFn: () => fetchRuns(id!, limit, cursor),
     enabled: !!id,
     placeholderData: (prev) => prev,
   });
 
-  const runs = (data ?? []).filter((r: Run) => statusFilter === "all" ? true : r.status === statusFilter);
+  const runs = (data?.runs ?? []).filter((r: Run) => statusFilter === "all" ? true : r.status === statusFilter);
 
   const histogram = useMemo(() => {
     // bucket latencies into 200ms bins
@@ -64,14 +70,14 @@ export default function TaskRuns() {
         </label>
         <label>
           Limit:&nbsp;
-          <select value={limit} onChange={e => { setLimit(parseInt(e.target.value, 10)); setOffset(0); }}>
+          <select value={limit} onChange={e => { setLimit(parseInt(e.target.value, 10)); setCursors([null]); }}>
             <option value={50}>50</option>
             <option value={100}>100</option>
             <option value={250}>250</option>
           </select>
         </label>
-        <button onClick={() => setOffset(Math.max(0, offset - limit))} disabled={offset === 0 || isFetching}>Prev</button>
-        <button onClick={() => setOffset(offset + limit)} disabled={isFetching}>Next</button>
+        <button onClick={() => setCursors(cursors.slice(0, -1))} disabled={cursors.length === 1 || isFetching}>Prev</button>
+        <button onClick={() => data?.next && setCursors([...cursors, data.next])} disabled={!data?.next || isFetching}>Next</button>
         <button onClick={() => refetch()} disabled={isFetching}>Refresh</button>
       </div>
 